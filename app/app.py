@@ -1,11 +1,15 @@
 # app.py
  
+import http.client
+import socket
 import streamlit as st
 import time
 import uuid
 
-from src.vectorpipeline import VecSearchRAGPipeline
-from src.espipeline import ElSearchRAGPipeline
+from src.client import InferenceClient, InferenceError
+from src.constants import decoding_profiles, inference_url, ui_decoding_profile
+from src.pipelines import make_pipeline
+from src.tracing import trace, start_metrics_server
 from src.db import (
     init_db,
     save_conversation,
@@ -18,48 +22,88 @@ from src.db import (
 def print_log(message):
     print(message, flush=True)
 
+@st.cache_resource
+def load_cache():
+    """Response cache shared by all sessions and pipelines of the process."""
+    from src.cache import ResponseCache
+
+    return ResponseCache()
+
+@st.cache_resource
+def load_metrics_server():
+    """Prometheus /metrics endpoint, started once per process if METRICS_PORT is set."""
+    return start_metrics_server()
+
+@st.cache_resource(show_spinner="Preparing index...")
+def load_pipeline(search_type):
+    """
+    Creates the pipeline for a search type once per process and makes sure its
+    index is up to date. The index is only rebuilt when the data changed.
+    """
+    pipeline = make_pipeline(search_type)
+    print_log(f"Ensuring {search_type} index...")
+    pipeline.create_index()
+    pipeline.cache = load_cache()
+    print_log(f"{search_type} index ready: {pipeline.index_version}")
+    return pipeline
+
+def ask_pipeline(search_type, user_input, profile):
+    """Answers in-process, streaming the response as it is generated."""
+    pipeline = load_pipeline(search_type)
+    with trace(search_type) as request_trace:
+        with st.spinner("Retrieving context..."):
+            result, chunks = pipeline.stream_response(user_input, profile=profile)
+        # Render the answer as it is generated
+        st.write_stream(chunks)
+    return result, request_trace.stage_ms()
+
+def ask_server(search_type, user_input, profile):
+    """Answers through the inference server at INFERENCE_URL."""
+    start_time = time.time()
+    with st.spinner("Waiting for the inference server..."):
+        try:
+            result = InferenceClient().answer(user_input, search_type, profile)
+        except socket.timeout as e:
+            raise InferenceError(504, f'No answer from the inference server: {e}') from e
+        except (OSError, http.client.HTTPException) as e:
+            # Server down, socket missing or connection dropped: reported like a busy server
+            raise InferenceError(503, f'Inference server unreachable: {e}') from e
+    st.write(result['response'])
+    # The server answers in one piece, so the first token arrives with the last
+    result['ttft'] = result['total_time'] = time.time() - start_time
+    # The server times stages per micro-batch, not per request, so there are no
+    # per-conversation stage timings to store; they are exported on its /metrics
+    print_log(f"Answered in a batch of {result.get('batch_size')}, batch stage timings (ms): {result.get('batch_stage_ms')}")
+    return result, None
+
 def main():
     print_log("Starting the Data Science Assistant application")
     st.title("Data Science Assistant")
 
     # Initialize the database
     init_db()
+    load_metrics_server()
     
-    # Check if the index has been created already
-    text_index_created = st.session_state.get("text_index_created", False)
-    vec_index_created = st.session_state.get("vec_index_created", False) 
     if "count" not in st.session_state:
         st.session_state.count = 0
         print_log("Feedback count initialized to 0")
 
     # Search type selection
-    search_type = st.radio("Select search type:", ["Text", "Vector"])
+    search_type = st.radio("Select search type:", ["Text", "Vector", "Hybrid"])
     print_log(f"User selected search type: {search_type}")
 
-    if search_type == "Text":
-        pipeline = ElSearchRAGPipeline()
-        # Automatically create index if not already created
-        if not text_index_created:
-            with st.spinner("Reading data..."):
-                print_log("Reading data...")
-                pipeline.read_data()
-            with st.spinner("Creating index..."):
-                print_log("Indexing data...")
-                pipeline.create_index()
-                st.success("Index created!")
-                st.session_state.text_index_created = True  
-    else:
-        pipeline = VecSearchRAGPipeline()
-        # Automatically create vector index if not already created
-        if not vec_index_created:
-            with st.spinner("Generating vector embeddings..."):
-                print_log("Generating vector embeddings...")
-                pipeline.read_data()
-            with st.spinner("Creating index..."):
-                print_log("Indexing data...")
-                pipeline.create_index()
-                st.success("Index created!")
-                st.session_state.vec_index_created = True   
+    # Decoding profile selection
+    profiles = list(decoding_profiles)
+    profile = st.selectbox(
+        "Answer style:", profiles, index=profiles.index(ui_decoding_profile),
+        help="fast streams the answer as it is written. balanced and quality use beam search: "
+             "longer, more careful answers that appear all at once when done.",
+    )
+    print_log(f"User selected decoding profile: {profile}")
+
+    if not inference_url:
+        # Prepare the index before the first question
+        load_pipeline(search_type)
 
     # User input
     user_input = st.text_input("Enter your question:")
@@ -67,30 +111,45 @@ def main():
     if st.button("Ask"):
         print_log(f"User asked: '{user_input}'")
         st.session_state.conversation_id = str(uuid.uuid4())
-        with st.spinner("Processing..."):
-            print_log(
-                f"Getting answer from assistant using {search_type} search"
-            )
-            start_time = time.time()
-            answer_data, time_taken, total_hits, relevance_score, topic = pipeline.get_response(user_input)
-            end_time = time.time()
-            print_log(f"Answer received in {end_time - start_time:.2f} seconds")
-            st.success("Completed!")
-            st.write(answer_data)
-
-            # Save conversation to database
-            print_log("Saving conversation to database")
-            save_conversation(
-                st.session_state.conversation_id, 
-                user_input, 
-                answer_data, 
-                time_taken, 
-                total_hits, 
-                relevance_score,
-                topic,
-                search_type
-            )
-            print_log("Conversation saved successfully") 
+        print_log(
+            f"Getting answer from assistant using {search_type} search"
+        )
+        try:
+            if inference_url:
+                result, stage_ms = ask_server(search_type, user_input, profile)
+            else:
+                result, stage_ms = ask_pipeline(search_type, user_input, profile)
+        except InferenceError as e:
+            print_log(f"Inference server error: {e}")
+            st.error("The assistant is busy, please try again." if e.status in (503, 504) else str(e))
+            return
+        print_log(
+            f"First token after {result['ttft']:.2f} seconds, "
+            f"answer completed in {result['total_time']:.2f} seconds"
+        )
+        print_log(f"Stage timings (ms): {stage_ms}")
+        st.success("Completed!")
+
+        # Save conversation to database
+        print_log("Saving conversation to database")
+        save_conversation(
+            st.session_state.conversation_id, 
+            user_input, 
+            result['response'], 
+            result['time_taken'], 
+            result['total_hits'], 
+            result['relevance_score'],
+            result['topic'],
+            search_type,
+            decoding_profile=result['decoding_profile'],
+            decode_tokens=result['decode_tokens'],
+            decode_time=result['decode_time'],
+            cache_status=result['cache_status'],
+            ttft_ms=int(result['ttft'] * 1000),
+            total_time_ms=int(result['total_time'] * 1000),
+            stage_ms=stage_ms,
+        )
+        print_log("Conversation saved successfully") 
 
     # Feedback buttons
     col1, col2 = st.columns(2)
@@ -19,5 +19,7 @@ setuptools.setup(
         "Bug Tracker": f"https://github.com/{AUTHOR_USER_NAME}/{REPO_NAME}/issues",
     },
     package_dir={"": "src"},
-    packages=setuptools.find_packages(where="src")
+    packages=setuptools.find_packages(where="src"),
+    # GENERATOR_BACKEND=onnx: pip install ".[onnx]"
+    extras_require={"onnx": ["optimum[onnxruntime]"]},
 )
\ No newline at end of file
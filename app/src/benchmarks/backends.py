@@ -0,0 +1,113 @@
+# backends.py
+# Parity, CPU latency and memory of the generator backends (eager torch, int8, ONNX Runtime).
+#
+# Usage (from the app directory):
+#     python -m src.benchmarks.backends --backends torch int8 onnx --num-questions 16
+#     python -m src.benchmarks.backends --check --min-parity 0.9
+
+import argparse
+import sys
+import time
+
+import numpy as np
+import torch
+
+from src.benchmarks.generation import load_prompts
+from src.generator import Generator
+from src.models import registry, _rss_mb
+
+
+def run_backend(backend, prompts, profile):
+    """
+    Generates every prompt one at a time with a backend.
+
+    Args:
+        backend (str): Generator backend name.
+        prompts (list of str): The prompts.
+        profile (str): Decoding profile.
+
+    Returns:
+        dict: The responses, per-prompt latencies in seconds, the model load time
+        and memory (MB of RSS added by loading it).
+    """
+    # Without the encoder cache, so the warm-up prompt is encoded again when timed
+    generator = Generator(backend=backend, encoder_cache_size=0)
+    # Load and warm up so neither is timed
+    generator.generate(prompts[0], profile)
+    stats = registry.stats[('t5-model', generator.model_name, backend)]
+
+    responses, latencies = [], []
+    for prompt in prompts:
+        start_time = time.perf_counter()
+        responses.append(generator.generate(prompt, profile)['response'])
+        latencies.append(time.perf_counter() - start_time)
+    return {
+        'responses': responses,
+        'latencies': latencies,
+        'load_time': stats['load_time'],
+        'memory_mb': stats['memory_mb'],
+    }
+
+
+def token_agreement(tokenizer, reference, response):
+    """
+    Returns the share of positions where two responses have the same token.
+
+    Args:
+        tokenizer: Tokenizer used to split the responses.
+        reference (str): Response of the eager backend.
+        response (str): Response to compare.
+
+    Returns:
+        float: Matching positions divided by the length of the longer response.
+    """
+    reference_ids = tokenizer(reference, add_special_tokens=False)['input_ids']
+    response_ids = tokenizer(response, add_special_tokens=False)['input_ids']
+    longest = max(len(reference_ids), len(response_ids))
+    if not longest:
+        return 1.0
+    return sum(a == b for a, b in zip(reference_ids, response_ids)) / longest
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare output parity, CPU latency and memory of the generator backends.')
+    parser.add_argument('--backends', nargs='+', default=['torch', 'int8', 'onnx'], choices=['torch', 'int8', 'onnx'])
+    parser.add_argument('--num-questions', type=int, default=16, help='Number of ground-truth questions to run.')
+    parser.add_argument('--profile', default='fast',
+                        help='Decoding profile. Parity needs a deterministic one (defaults to fast, greedy).')
+    parser.add_argument('--threads', type=int, default=None, help='torch CPU threads (defaults to torch default).')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit non-zero if a backend matches the eager outputs less often than --min-parity.')
+    parser.add_argument('--min-parity', type=float, default=0.9, help='Minimum share of responses identical to eager torch.')
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    pipeline, prompts = load_prompts(args.num_questions)
+    tokenizer = pipeline.generator.tokenizer
+
+    # The eager outputs are the reference for parity
+    backends = ['torch'] + [backend for backend in args.backends if backend != 'torch']
+    results = {backend: run_backend(backend, prompts, args.profile) for backend in backends}
+    reference = results['torch']['responses']
+
+    failed = []
+    print(f"{'backend':<10}{'exact':>8}{'tokens':>9}{'mean s':>9}{'p50 s':>9}{'p95 s':>9}{'load s':>9}{'mem MB':>9}")
+    for backend, result in results.items():
+        exact = np.mean([a == b for a, b in zip(reference, result['responses'])])
+        tokens = np.mean([token_agreement(tokenizer, a, b) for a, b in zip(reference, result['responses'])])
+        latencies = result['latencies']
+        print(f"{backend:<10}{exact:>8.1%}{tokens:>9.1%}{np.mean(latencies):>9.3f}{np.percentile(latencies, 50):>9.3f}"
+              f"{np.percentile(latencies, 95):>9.3f}{result['load_time']:>9.1f}{result['memory_mb']:>9.0f}")
+        if exact < args.min_parity:
+            failed.append(backend)
+    print(f'Process RSS: {_rss_mb():.0f} MB')
+
+    if args.check and failed:
+        print(f"Parity below {args.min_parity:.0%} for: {', '.join(failed)}")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,117 @@
+# generation.py
+# CPU benchmark of fixed 512-token padding versus dynamic, length-bucketed generation.
+#
+# Usage (from the app directory):
+#     python -m src.benchmarks.generation --num-questions 16
+
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+import torch
+
+from src.constants import ground_truth_path, max_input_length
+from src.mspipeline import MiniSearchRAGPipeline
+
+
+def load_prompts(num_questions):
+    """
+    Builds prompts for the first ground-truth questions using MiniSearch retrieval,
+    so the benchmark runs without Elasticsearch.
+
+    Args:
+        num_questions (int): Number of sample questions.
+
+    Returns:
+        tuple: The pipeline and the list of prompts.
+    """
+    # Rows end with a trailing comma, which pandas would otherwise read as an index column
+    questions = pd.read_csv(ground_truth_path, usecols=['question'], index_col=False)['question']
+    questions = questions.head(num_questions).tolist()
+    pipeline = MiniSearchRAGPipeline()
+    retrievals = pipeline.search_batch(questions, num_results=3)
+    prompts = [pipeline.generate_prompt(q, r['answers'], r.get('answer_ids'), r.get('scores')) for q, r in zip(questions, retrievals)]
+    return pipeline, prompts
+
+
+def run_fixed_padding(generator, prompts, profile):
+    """
+    Generates one prompt at a time padded to max_input_length, as the pipelines used to.
+
+    Returns:
+        tuple: Per-prompt latencies in seconds and the padding waste ratio.
+    """
+    latencies, real, total = [], 0, 0
+    for prompt in prompts:
+        start_time = time.perf_counter()
+        inputs = generator.tokenizer(prompt, return_tensors='pt', max_length=max_input_length,
+                                     truncation=True, padding='max_length')
+        generator.model.generate(**inputs, **generator.profile_kwargs(profile)[1])
+        latencies.append(time.perf_counter() - start_time)
+        real += int(inputs['attention_mask'].sum())
+        total += inputs['input_ids'].numel()
+    return latencies, 1 - real / total
+
+
+def run_dynamic(generator, prompts, profile):
+    """
+    Generates one prompt at a time without padding.
+
+    Returns:
+        tuple: Per-prompt latencies in seconds and the padding waste ratio.
+    """
+    generator.stats.update(prompt_tokens=0, padding_tokens=0)
+    latencies = []
+    for prompt in prompts:
+        start_time = time.perf_counter()
+        generator.generate(prompt, profile)
+        latencies.append(time.perf_counter() - start_time)
+    return latencies, generator.padding_waste()
+
+
+def run_bucketed(generator, prompts, profile):
+    """
+    Generates all prompts in length-bucketed, dynamically padded batches.
+
+    Returns:
+        tuple: Amortized per-prompt latencies in seconds and the padding waste ratio.
+    """
+    generator.stats.update(prompt_tokens=0, padding_tokens=0)
+    start_time = time.perf_counter()
+    generator.generate_batch(prompts, profile)
+    elapsed = time.perf_counter() - start_time
+    return [elapsed / len(prompts)] * len(prompts), generator.padding_waste()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare fixed-padding and dynamic-padding generation latency on CPU.')
+    parser.add_argument('--num-questions', type=int, default=16, help='Number of ground-truth questions to run.')
+    parser.add_argument('--threads', type=int, default=None, help='torch CPU threads (defaults to torch default).')
+    parser.add_argument('--profile', default=None, help='Decoding profile (defaults to DECODING_PROFILE).')
+    parser.add_argument('--seed', type=int, default=42)
+    args = parser.parse_args()
+
+    if args.threads:
+        torch.set_num_threads(args.threads)
+
+    pipeline, prompts = load_prompts(args.num_questions)
+    generator = pipeline.generator
+    # Every mode runs the same prompts, so cached encoder outputs would skew the later ones
+    generator.encoder_cache_size = 0
+    lengths = [len(ids) for ids in generator.tokenizer(prompts)['input_ids']]
+    print(f'Prompts: {len(prompts)}, mean length {np.mean(lengths):.0f} tokens, max {max(lengths)}')
+
+    # Warm up so model loading is not timed
+    generator.generate(prompts[0], args.profile)
+
+    print(f"{'mode':<16}{'mean s':>10}{'p50 s':>10}{'p95 s':>10}{'padding':>10}")
+    for name, run in (('fixed-512', run_fixed_padding), ('dynamic', run_dynamic), ('bucketed-batch', run_bucketed)):
+        torch.manual_seed(args.seed)
+        latencies, waste = run(generator, prompts, args.profile)
+        print(f'{name:<16}{np.mean(latencies):>10.3f}{np.percentile(latencies, 50):>10.3f}'
+              f'{np.percentile(latencies, 95):>10.3f}{waste:>10.1%}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+# load.py
+# Load test of the inference server: latency, throughput and admission control under concurrency.
+#
+# Usage (from the app directory, with the server running):
+#     python -m src.server --search-types MiniSearch
+#     python -m src.benchmarks.load --search-type MiniSearch --concurrency 1 8 32
+
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src.client import InferenceClient, InferenceError
+from src.constants import ground_truth_path
+
+
+def run_load(client, questions, search_type, profile, concurrency):
+    """
+    Sends every question to the server from concurrency worker threads.
+
+    Args:
+        client (InferenceClient): Client of the server.
+        questions (list of str): The questions.
+        search_type (str): Pipeline to use.
+        profile (str): Decoding profile.
+        concurrency (int): Number of requests in flight.
+
+    Returns:
+        dict: Latencies in seconds of the answered requests, the wall time,
+        the number of rejected (503) and timed out (504) requests, and the mean batch size.
+    """
+    def timed_answer(question):
+        start_time = time.perf_counter()
+        try:
+            result = client.answer(question, search_type, profile)
+        except InferenceError as e:
+            return e.status, time.perf_counter() - start_time, 0
+        return 200, time.perf_counter() - start_time, result.get('batch_size', 1)
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_answer, questions))
+    wall_time = time.perf_counter() - start_time
+
+    answered = [(latency, batch_size) for status, latency, batch_size in results if status == 200]
+    return {
+        'latencies': [latency for latency, _ in answered],
+        'wall_time': wall_time,
+        'rejected': sum(status == 503 for status, _, _ in results),
+        'timeouts': sum(status == 504 for status, _, _ in results),
+        'errors': sum(status not in (200, 503, 504) for status, _, _ in results),
+        'batch_size': np.mean([batch_size for _, batch_size in answered]) if answered else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load test the inference server.')
+    parser.add_argument('--url', default=None, help='http://host:port or unix:/path (defaults to INFERENCE_URL).')
+    parser.add_argument('--search-type', default='Text')
+    parser.add_argument('--profile', default='fast')
+    parser.add_argument('--num-questions', type=int, default=64, help='Number of ground-truth questions to send.')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1, 8, 32], help='Requests in flight.')
+    args = parser.parse_args()
+
+    # Rows end with a trailing comma, which pandas would otherwise read as an index column
+    questions = pd.read_csv(ground_truth_path, usecols=['question'], index_col=False)['question']
+    questions = questions.head(args.num_questions).tolist()
+    client = InferenceClient(args.url)
+    print(f"Server: {client.url} {client.health()['pipelines']}")
+
+    print(f"{'conc':>5}{'ok':>6}{'503':>6}{'504':>6}{'err':>6}{'batch':>7}{'p50 s':>9}{'p95 s':>9}{'p99 s':>9}{'QPS':>8}")
+    for concurrency in args.concurrency:
+        result = run_load(client, questions, args.search_type, args.profile, concurrency)
+        latencies = result['latencies'] or [float('nan')]
+        print(f"{concurrency:>5}{len(result['latencies']):>6}{result['rejected']:>6}{result['timeouts']:>6}"
+              f"{result['errors']:>6}{result['batch_size']:>7.1f}"
+              f"{np.percentile(latencies, 50):>9.3f}{np.percentile(latencies, 95):>9.3f}"
+              f"{np.percentile(latencies, 99):>9.3f}{len(result['latencies']) / result['wall_time']:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,231 @@
+# retrieval.py
+# Hit rate, MRR, latency and throughput of every retrieval backend on the ground-truth questions.
+#
+# Usage (from the app directory):
+#     python -m src.benchmarks.retrieval --backends minisearch text vector hybrid --concurrency 1 4
+#     python -m src.benchmarks.retrieval --es live --output results.json
+
+import argparse
+import json
+import subprocess
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+from src import minisearch
+from src.constants import ground_truth_path
+from src.embeddings import BatchEncoder
+from src.espipeline import ElSearchRAGPipeline
+from src.hybridpipeline import HybridSearchRAGPipeline
+from src.mspipeline import MiniSearchRAGPipeline
+from src.sync import read_documents
+from src.vectorindex import VectorIndex, to_es_response
+from src.vectorpipeline import VecSearchRAGPipeline
+
+
+class StubElasticsearch:
+    """
+    Answers the msearch requests of the Elasticsearch pipelines in-process, so the
+    benchmark runs offline. Text queries (multi_match with field boosts) are scored
+    by a MiniSearch index and kNN queries by an exact VectorIndex, both built over
+    the corpus. Responses have the Elasticsearch shape.
+
+    Attributes:
+        docs (list): The indexed documents; a hit's _id is its document's id.
+        text_index (minisearch.Index): TF-IDF index over question, answer and topic.
+        vector_index (VectorIndex): Index over the question and answer embeddings.
+    """
+
+    def __init__(self, docs):
+        self.docs = docs
+        self.text_index = minisearch.Index(text_fields=['question', 'answer', 'topic'], keyword_fields=[]).fit(docs)
+        vectors = BatchEncoder().encode([doc['question'] + ' ' + doc['answer'] for doc in docs])
+        self.vector_index = VectorIndex().fit(vectors, docs)
+
+    def _search(self, body):
+        start_time = time.time()
+        size = body.get('size', 10)
+        if 'knn' in body:
+            doc_ids, scores = self.vector_index.search(np.asarray(body['knn']['query_vector']), num_results=size)
+        else:
+            multi_match = body['query']['bool']['must']['multi_match']
+            boost_dict = {}
+            for field in multi_match['fields']:
+                name, _, boost = field.partition('^')
+                boost_dict[name] = float(boost or 1)
+            doc_ids, scores = self.text_index.score_batch([multi_match['query']], boost_dict=boost_dict,
+                                                          num_results=size)[0]
+        return to_es_response(self.vector_index, doc_ids, scores, int((time.time() - start_time) * 1000))
+
+    def msearch(self, searches):
+        """
+        Runs the searches of an msearch request one after the other.
+
+        Args:
+            searches (list of dict): Alternating header and body dicts.
+
+        Returns:
+            dict: ``responses`` with one search response per body.
+        """
+        return {'responses': [self._search(body) for body in searches[1::2]]}
+
+
+def make_pipelines(names, es):
+    """
+    Creates the retrieval pipelines to benchmark. All of them are queried through
+    RAGPipeline.search_batch().
+
+    Args:
+        names (list of str): Backend names: minisearch, text, vector, vector-local or hybrid.
+        es (str): 'stub' to answer Elasticsearch requests in-process, 'live' to use the cluster.
+
+    Returns:
+        dict: Pipeline per backend name, with its index ready.
+    """
+    factories = {
+        'minisearch': MiniSearchRAGPipeline,
+        'text': ElSearchRAGPipeline,
+        'vector': lambda: VecSearchRAGPipeline(backend='elasticsearch'),
+        'vector-local': lambda: VecSearchRAGPipeline(backend='local'),
+        'hybrid': lambda: HybridSearchRAGPipeline(backend='elasticsearch'),
+    }
+    stub = None
+    pipelines = {}
+    for name in names:
+        pipeline = factories[name]()
+        uses_es = name in ('text', 'vector', 'hybrid')
+        if uses_es and es == 'stub':
+            if stub is None:
+                print('[DEBUG] Building the Elasticsearch stub...')
+                stub = StubElasticsearch(read_documents())
+            pipeline.es = stub
+        else:
+            pipeline.create_index()
+        pipelines[name] = pipeline
+    return pipelines
+
+
+def load_ground_truth(num_questions=None):
+    """
+    Loads the ground-truth questions and the id of the document that answers each.
+
+    Args:
+        num_questions (int, optional): Only use the first num_questions questions.
+
+    Returns:
+        pd.DataFrame: The ground truth, with question and document_id columns.
+    """
+    # Rows end with a trailing comma, which pandas would otherwise read as an index column
+    ground_truth = pd.read_csv(ground_truth_path, usecols=['question', 'document_id'], dtype=str, index_col=False)
+    if num_questions:
+        ground_truth = ground_truth.head(num_questions)
+    return ground_truth
+
+
+def run_backend(pipeline, questions, num_results, concurrency):
+    """
+    Sends one search per question from concurrency worker threads.
+
+    Args:
+        pipeline (RAGPipeline): The pipeline to query.
+        questions (list of str): The questions.
+        num_results (int): The number of results retrieved per question.
+        concurrency (int): Number of searches in flight.
+
+    Returns:
+        tuple: Retrieved document ids per question, per-question latencies in seconds, and the wall time.
+    """
+    def timed_search(question):
+        start_time = time.perf_counter()
+        ids = pipeline.search_batch([question], num_results)[0]['ids']
+        return ids, time.perf_counter() - start_time
+
+    start_time = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(timed_search, questions))
+    wall_time = time.perf_counter() - start_time
+    return [ids for ids, _ in results], [latency for _, latency in results], wall_time
+
+
+def score(retrieved, relevant):
+    """
+    Computes hit rate and mean reciprocal rank.
+
+    Args:
+        retrieved (list of list of str): Retrieved document ids per question, best first.
+        relevant (list of str): Id of the relevant document per question.
+
+    Returns:
+        dict: ``hit_rate`` and ``mrr``.
+    """
+    hits, reciprocal_ranks = [], []
+    for ids, document_id in zip(retrieved, relevant):
+        rank = ids.index(document_id) + 1 if document_id in ids else None
+        hits.append(rank is not None)
+        reciprocal_ranks.append(1 / rank if rank else 0.0)
+    return {'hit_rate': float(np.mean(hits)), 'mrr': float(np.mean(reciprocal_ranks))}
+
+
+def git_commit():
+    """Returns the current git commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark hit rate, MRR, latency and throughput of the retrieval backends.')
+    parser.add_argument('--backends', nargs='+', default=['minisearch', 'text', 'vector', 'hybrid'],
+                        choices=['minisearch', 'text', 'vector', 'vector-local', 'hybrid'])
+    parser.add_argument('--es', choices=['stub', 'live'], default='stub',
+                        help='Answer Elasticsearch requests in-process (stub) or send them to the cluster (live).')
+    parser.add_argument('--num-results', type=int, default=5, help='Results retrieved per question.')
+    parser.add_argument('--num-questions', type=int, default=None, help='Number of ground-truth questions (defaults to all).')
+    parser.add_argument('--concurrency', type=int, nargs='+', default=[1], help='Searches in flight; one run per value.')
+    parser.add_argument('--output', default=None, help='Write the results as JSON to this file.')
+    args = parser.parse_args()
+
+    ground_truth = load_ground_truth(args.num_questions)
+    questions = ground_truth['question'].tolist()
+    relevant = ground_truth['document_id'].tolist()
+    pipelines = make_pipelines(args.backends, args.es)
+
+    runs = []
+    print(f"{'backend':<14}{'conc':>6}{'hit rate':>10}{'mrr':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'qps':>9}")
+    for name, pipeline in pipelines.items():
+        # Warm up so model and index loading are not timed
+        pipeline.search_batch(questions[:1], args.num_results)
+        for concurrency in args.concurrency:
+            retrieved, latencies, wall_time = run_backend(pipeline, questions, args.num_results, concurrency)
+            latencies_ms = np.array(latencies) * 1000
+            run = {
+                'backend': name,
+                'concurrency': concurrency,
+                **score(retrieved, relevant),
+                'p50_ms': float(np.percentile(latencies_ms, 50)),
+                'p95_ms': float(np.percentile(latencies_ms, 95)),
+                'p99_ms': float(np.percentile(latencies_ms, 99)),
+                'qps': len(questions) / wall_time,
+            }
+            runs.append(run)
+            print(f"{name:<14}{concurrency:>6}{run['hit_rate']:>10.3f}{run['mrr']:>8.3f}{run['p50_ms']:>9.1f}"
+                  f"{run['p95_ms']:>9.1f}{run['p99_ms']:>9.1f}{run['qps']:>9.1f}")
+
+    if args.output:
+        report = {
+            'commit': git_commit(),
+            'es': args.es,
+            'num_questions': len(questions),
+            'num_results': args.num_results,
+            'runs': runs,
+        }
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f'Results written to {args.output}')
+
+
+if __name__ == '__main__':
+    main()
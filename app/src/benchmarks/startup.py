@@ -0,0 +1,149 @@
+# startup.py
+# Import time of the app's modules, the heavy dependencies they pull in, and wall-clock time to the first answer.
+#
+# Usage (from the app directory):
+#     python -m src.benchmarks.startup
+#     python -m src.benchmarks.startup --first-answer MiniSearch
+#     python -m src.benchmarks.startup --check --budget-ms 500
+
+import argparse
+import ast
+import json
+import subprocess
+import sys
+import time
+
+from src.constants import startup_budget_ms
+
+# Dependencies that must only load once a backend is used
+HEAVY_MODULES = [
+    'torch', 'transformers', 'sentence_transformers', 'elasticsearch',
+    'pandas', 'numpy', 'scipy', 'sklearn', 'tqdm',
+]
+
+
+def app_imports(path='app.py'):
+    """
+    Returns the project modules imported at the top of a script.
+
+    Args:
+        path (str): Path of the script.
+
+    Returns:
+        list of str: Module names under src, in import order.
+    """
+    with open(path) as f:
+        tree = ast.parse(f.read())
+    modules = []
+    for node in tree.body:
+        if isinstance(node, ast.ImportFrom) and node.module and node.module.split('.')[0] == 'src':
+            modules.append(node.module)
+        elif isinstance(node, ast.Import):
+            modules.extend(alias.name for alias in node.names if alias.name.split('.')[0] == 'src')
+    return modules
+
+
+def measure_imports(modules):
+    """
+    Imports modules in a fresh interpreter with ``-X importtime``.
+
+    Args:
+        modules (list of str): Modules to import.
+
+    Returns:
+        dict: Wall-clock import time in ms, the HEAVY_MODULES found in ``sys.modules``
+        afterwards, and (module, self ms, cumulative ms) for every module loaded.
+
+    Raises:
+        ModuleNotFoundError: A dependency of the modules is not installed.
+        RuntimeError: The import failed otherwise.
+    """
+    code = (
+        'import json, sys, time; start = time.perf_counter(); '
+        f'import {", ".join(modules)}; '
+        'wall_ms = (time.perf_counter() - start) * 1000; '
+        f'print(json.dumps([wall_ms, [m for m in {HEAVY_MODULES!r} if m in sys.modules]]))'
+    )
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', code], capture_output=True, text=True)
+    if result.returncode:
+        error = result.stderr.strip().splitlines()[-1]
+        if error.startswith('ModuleNotFoundError'):
+            raise ModuleNotFoundError(f'Importing {modules} failed: {error}')
+        raise RuntimeError(f'Importing {modules} failed: {error}')
+    loaded = []
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        loaded.append((name.strip(), int(self_us) / 1000, int(cumulative_us) / 1000))
+    wall_ms, heavy = json.loads(result.stdout.strip().splitlines()[-1])
+    return {'wall_ms': wall_ms, 'heavy': heavy, 'modules': loaded}
+
+
+def first_answer(search_type, question):
+    """
+    Times a cold start in this process: importing and creating the pipeline,
+    preparing its index and answering one question.
+
+    Args:
+        search_type (str): Pipeline to start.
+        question (str): The question.
+
+    Returns:
+        dict: Seconds spent in each step and in total.
+    """
+    timings = {}
+    start_time = time.perf_counter()
+    from src.pipelines import make_pipeline
+
+    pipeline = make_pipeline(search_type)
+    timings['create_s'] = time.perf_counter() - start_time
+
+    step_time = time.perf_counter()
+    pipeline.create_index()
+    timings['index_s'] = time.perf_counter() - step_time
+
+    step_time = time.perf_counter()
+    pipeline.get_response(question)
+    timings['answer_s'] = time.perf_counter() - step_time
+    timings['total_s'] = time.perf_counter() - start_time
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure startup: app import time and time to the first answer.')
+    parser.add_argument('--script', default='app.py', help='Script whose src imports are measured.')
+    parser.add_argument('--repeat', type=int, default=3, help='Import runs; the fastest is reported.')
+    parser.add_argument('--top', type=int, default=10, help='Number of slowest modules to list.')
+    parser.add_argument('--first-answer', default=None, metavar='SEARCH_TYPE',
+                        help='Also time a cold start to the first answer with this pipeline.')
+    parser.add_argument('--question', default='What is overfitting?')
+    parser.add_argument('--check', action='store_true',
+                        help='Exit non-zero if the imports exceed --budget-ms or load a heavy dependency.')
+    parser.add_argument('--budget-ms', type=float, default=startup_budget_ms, help='Import budget of the app modules.')
+    args = parser.parse_args()
+
+    modules = app_imports(args.script)
+    runs = [measure_imports(modules) for _ in range(max(1, args.repeat))]
+    best = min(runs, key=lambda run: run['wall_ms'])
+
+    print(f"Imports of {args.script}: {', '.join(modules)}")
+    print(f"Wall-clock import time: {best['wall_ms']:.0f} ms (best of {len(runs)}, budget {args.budget_ms:.0f} ms)")
+    print(f"{'module':<40}{'self ms':>10}{'cumul ms':>10}")
+    for name, self_ms, cumulative_ms in sorted(best['modules'], key=lambda m: m[2], reverse=True)[:args.top]:
+        print(f"{name:<40}{self_ms:>10.1f}{cumulative_ms:>10.1f}")
+
+    heavy = best['heavy']
+    print(f"Heavy dependencies loaded at startup: {', '.join(heavy) or 'none'}")
+
+    if args.first_answer:
+        timings = first_answer(args.first_answer, args.question)
+        print(f"First {args.first_answer} answer: " + ', '.join(f'{k} {v:.2f}' for k, v in timings.items()))
+
+    if args.check and (best['wall_ms'] > args.budget_ms or heavy):
+        print('Startup check failed')
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,155 @@
+# cache.py
+# Two-tier (exact and semantic) response cache in front of the RAG pipelines.
+
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from src.constants import cache_max_size, cache_ttl, cache_similarity_threshold
+
+
+def normalize_query(query):
+    """
+    Normalizes a query for exact-match lookups: lowercase, single spaces and
+    no trailing punctuation.
+
+    Args:
+        query (str): The search query string.
+
+    Returns:
+        str: The normalized query.
+    """
+    return re.sub(r'\s+', ' ', query).strip().lower().rstrip('?!. ')
+
+
+class ResponseCache:
+    """
+    A thread-safe LRU cache of pipeline responses with a time-to-live.
+
+    The exact tier matches on the normalized query, search type and decoding
+    profile. The semantic tier compares the query embedding with the embeddings
+    of cached entries of the same search type and profile, and serves the
+    closest one if its cosine similarity is above the threshold. Entries are
+    tied to the index version they were computed on; when a pipeline reports a
+    new version, all entries of its search type are dropped.
+
+    Attributes:
+        max_size (int): Maximum number of entries kept.
+        ttl (float): Seconds an entry stays valid.
+        similarity_threshold (float): Minimum cosine similarity for a semantic hit.
+        entries (OrderedDict): Cached entries, least recently used first.
+        versions (dict): Index version of the cached entries, per search type.
+        stats (dict): Number of exact hits, semantic hits and misses.
+    """
+
+    def __init__(self, max_size=cache_max_size, ttl=cache_ttl, similarity_threshold=cache_similarity_threshold):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.entries = OrderedDict()
+        self.versions = {}
+        self.stats = {'exact': 0, 'semantic': 0, 'miss': 0}
+        self._lock = threading.Lock()
+
+    def _check_version(self, search_type, index_version):
+        # Called with the lock held
+        if self.versions.get(search_type) != index_version:
+            for key in [key for key in self.entries if key[1] == search_type]:
+                del self.entries[key]
+            self.versions[search_type] = index_version
+
+    def _expire(self):
+        # Called with the lock held
+        now = time.time()
+        for key in [key for key, entry in self.entries.items() if entry['expires'] < now]:
+            del self.entries[key]
+
+    def _semantic_match(self, search_type, profile, embedding):
+        # Called with the lock held
+        candidates = [
+            (key, entry) for key, entry in self.entries.items()
+            if key[1] == search_type and key[2] == profile and entry['embedding'] is not None
+        ]
+        if not candidates:
+            return None
+        matrix = np.stack([entry['embedding'] for _, entry in candidates])
+        similarities = matrix @ embedding
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return candidates[best][0]
+        return None
+
+    @staticmethod
+    def _unit(embedding):
+        if embedding is None:
+            return None
+        embedding = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(embedding)
+        return embedding / norm if norm else embedding
+
+    def get(self, query, search_type, profile, index_version, embedding=None):
+        """
+        Looks up a cached response.
+
+        Args:
+            query (str): The search query string.
+            search_type (str): Search type of the pipeline.
+            profile (str): Decoding profile name.
+            index_version (str): Version of the index the pipeline searches.
+            embedding (np.ndarray, optional): Query embedding for the semantic tier.
+
+        Returns:
+            tuple: The cached response (or None) and how it was found: 'exact', 'semantic' or 'miss'.
+        """
+        key = (normalize_query(query), search_type, profile)
+        with self._lock:
+            self._check_version(search_type, index_version)
+            self._expire()
+
+            status = 'exact' if key in self.entries else 'miss'
+            if status == 'miss' and embedding is not None:
+                key = self._semantic_match(search_type, profile, self._unit(embedding))
+                status = 'semantic' if key is not None else 'miss'
+
+            self.stats[status] += 1
+            if status == 'miss':
+                return None, status
+            self.entries.move_to_end(key)
+            return self.entries[key]['value'], status
+
+    def put(self, query, search_type, profile, index_version, value, embedding=None):
+        """
+        Stores a response, evicting the least recently used entries beyond max_size.
+
+        Args:
+            query (str): The search query string.
+            search_type (str): Search type of the pipeline.
+            profile (str): Decoding profile name.
+            index_version (str): Version of the index the response was computed on.
+            value (dict): The response to cache.
+            embedding (np.ndarray, optional): Query embedding for the semantic tier.
+        """
+        key = (normalize_query(query), search_type, profile)
+        with self._lock:
+            self._check_version(search_type, index_version)
+            self.entries[key] = {
+                'value': value,
+                'embedding': self._unit(embedding),
+                'expires': time.time() + self.ttl,
+            }
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+
+    def hit_rate(self):
+        """
+        Returns the share of lookups served from the cache.
+
+        Returns:
+            float: Exact and semantic hits divided by all lookups.
+        """
+        total = sum(self.stats.values())
+        return (self.stats['exact'] + self.stats['semantic']) / total if total else 0.0
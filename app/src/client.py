@@ -0,0 +1,124 @@
+# client.py
+# Thin client and CLI for the inference server.
+#
+# Usage (from the app directory):
+#     python -m src.client "What is overfitting?" --search-type Text --profile fast
+#     python -m src.client "What is overfitting?" --url unix:/tmp/rag.sock
+
+import argparse
+import http.client
+import json
+import socket
+from urllib.parse import urlparse
+
+from src.constants import inference_url, inference_host, inference_port, request_timeout
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """HTTPConnection over a Unix domain socket."""
+
+    def __init__(self, path, timeout=None):
+        super().__init__('localhost', timeout=timeout)
+        self.path = path
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.path)
+
+
+class InferenceError(Exception):
+    """
+    Raised when the inference server answers with an error.
+
+    Attributes:
+        status (int): HTTP status code (503 when overloaded, 504 on timeout).
+    """
+
+    def __init__(self, status, message):
+        super().__init__(f'{status}: {message}')
+        self.status = status
+
+
+class InferenceClient:
+    """
+    Sends questions to the inference server.
+
+    Attributes:
+        url (str): ``http://host:port`` or ``unix:/path/to/socket``.
+        timeout (float): Seconds to wait for an answer.
+    """
+
+    def __init__(self, url=None, timeout=request_timeout):
+        self.url = url or inference_url or f'http://{inference_host}:{inference_port}'
+        self.timeout = timeout
+
+    def _connection(self):
+        parsed = urlparse(self.url)
+        if parsed.scheme == 'unix':
+            return UnixHTTPConnection(parsed.path, timeout=self.timeout)
+        return http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=self.timeout)
+
+    def _request(self, method, path, payload=None):
+        connection = self._connection()
+        try:
+            body = json.dumps(payload) if payload is not None else None
+            connection.request(method, path, body=body, headers={'Content-Type': 'application/json'})
+            response = connection.getresponse()
+            data = json.loads(response.read() or b'{}')
+        finally:
+            connection.close()
+        if response.status != 200:
+            raise InferenceError(response.status, data.get('error', response.reason))
+        return data
+
+    def answer(self, query, search_type='Text', profile=None, num_results=3):
+        """
+        Asks the server for an answer.
+
+        Args:
+            query (str): The question.
+            search_type (str): Pipeline to use.
+            profile (str, optional): Decoding profile. Defaults to the server's default.
+            num_results (int): The number of passages to retrieve.
+
+        Returns:
+            dict: The ``response``, retrieval and decoding metadata, as from RAGPipeline.get_responses(),
+            plus the ``batch_size`` and ``batch_stage_ms`` of the micro-batch that answered it.
+        """
+        return self._request('POST', '/answer', {
+            'query': query,
+            'search_type': search_type,
+            'profile': profile,
+            'num_results': num_results,
+        })
+
+    def health(self):
+        """
+        Returns the server status and the queue depth of every pipeline.
+
+        Returns:
+            dict: The health report.
+        """
+        return self._request('GET', '/health')
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Ask the inference server a question.')
+    parser.add_argument('question')
+    parser.add_argument('--search-type', default='Text')
+    parser.add_argument('--profile', default=None)
+    parser.add_argument('--num-results', type=int, default=3)
+    parser.add_argument('--url', default=None, help='http://host:port or unix:/path (defaults to INFERENCE_URL).')
+    args = parser.parse_args()
+
+    result = InferenceClient(args.url).answer(args.question, args.search_type, args.profile, args.num_results)
+    print(result['response'])
+    print(f"\n[{args.search_type}] "
+          f"cache: {result.get('cache_status')}, batch of {result.get('batch_size')}, "
+          f"batch stages (ms): {result.get('batch_stage_ms')}")
+
+
+if __name__ == '__main__':
+    main()
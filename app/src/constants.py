@@ -1,22 +1,108 @@
 # constants.py
 
 import os
-from dotenv import load_dotenv
 from pathlib import Path
 
-# Load environment variables from .env file
-# load_dotenv() 
-load_dotenv(dotenv_path=Path(__file__).resolve().parent.parent / '.env')
+# Load environment variables from the .env file, if there is one
+env_path = Path(__file__).resolve().parent.parent / '.env'
+if env_path.exists():
+    from dotenv import load_dotenv
+    load_dotenv(dotenv_path=env_path)
 
 # Index Constants
 text_fields=["question", "answer"]
 keyword_fields=["topic","id"]
 index_name = "python-qa-index"
+# Aliases served to queries; each points at a versioned index built from the data
+text_index_alias = f"{index_name}-text"
+vector_index_alias = f"{index_name}-vector"
+index_build_timeout = int(os.getenv('INDEX_BUILD_TIMEOUT', '600'))  # Seconds to wait on another process's build
+minisearch_index_dir = os.getenv('MINISEARCH_INDEX_DIR', os.path.join('cache', 'minisearch'))
+manifest_dir = os.getenv('MANIFEST_DIR', os.path.join('cache', 'manifests'))  # Document id -> content hash of each index
+docstore_dir = os.getenv('DOCSTORE_DIR', os.path.join('cache', 'docstore'))  # Columnar corpus shared by the in-process indices
+
+# Hybrid Search Constants
+hybrid_fusion = os.getenv('HYBRID_FUSION', 'rrf')  # rrf or weighted
+hybrid_window = int(os.getenv('HYBRID_WINDOW', '20'))  # Candidates retrieved per method before fusion
+hybrid_text_weight = float(os.getenv('HYBRID_TEXT_WEIGHT', '0.5'))  # Share of the text score in weighted fusion
+rrf_k = int(os.getenv('RRF_K', '60'))  # Rank constant of reciprocal rank fusion
+
+# Vector Search Constants
+vector_backend = os.getenv('VECTOR_BACKEND', 'elasticsearch')  # elasticsearch or local
+vector_index_dir = os.getenv('VECTOR_INDEX_DIR', os.path.join('cache', 'vectorindex'))
+vector_index_dtype = os.getenv('VECTOR_INDEX_DTYPE', 'float32')  # float32 or int8
+vector_index_method = os.getenv('VECTOR_INDEX_METHOD', 'auto')  # exact, ivf or auto
+ann_min_docs = int(os.getenv('ANN_MIN_DOCS', '50000'))  # Corpus size from which auto switches to ivf
+ivf_nprobe = int(os.getenv('IVF_NPROBE', '8'))  # Clusters scored per query
+knn_min_candidates = int(os.getenv('KNN_MIN_CANDIDATES', '100'))  # Lower bound of ES num_candidates
+
+# Response Cache Constants
+cache_max_size = int(os.getenv('CACHE_MAX_SIZE', '1024'))  # Entries kept in memory
+cache_ttl = int(os.getenv('CACHE_TTL', '3600'))  # Seconds an entry stays valid
+cache_similarity_threshold = float(os.getenv('CACHE_SIMILARITY_THRESHOLD', '0.95'))  # Min cosine similarity for a semantic hit
+
+# Bulk Ingestion Constants
+bulk_chunk_size = int(os.getenv('BULK_CHUNK_SIZE', '500'))  # Documents per bulk request
+bulk_thread_count = int(os.getenv('BULK_THREAD_COUNT', '2'))  # Bulk requests in flight
+bulk_max_retries = int(os.getenv('BULK_MAX_RETRIES', '5'))  # Retries on 429 Too Many Requests
+
+# Data Constants
+data_path = os.path.join('data', 'data.csv')
+ground_truth_path = os.path.join('data', 'ground_truth.csv')
+ml_indexed_path = os.path.join('data', 'ml_indexed.csv')  # data.csv with the stable document ids used by ground_truth.csv
+corpus_path = os.getenv('CORPUS_PATH', ml_indexed_path)  # Corpus the indices are built and synced from
+document_fields = ['question', 'answer', 'topic']  # Fields whose change makes a document re-indexed
+loader_chunk_size = int(os.getenv('LOADER_CHUNK_SIZE', '5000'))  # Records read, embedded and indexed per chunk
 
 # Model Constants 
 model_name = 'google/flan-t5-small' 
 embedding_model = 'multi-qa-MiniLM-L6-cos-v1'
 embedding_size = 128
+generation_batch_size = int(os.getenv('GENERATION_BATCH_SIZE', '8'))  # Prompts per generate() call
+max_input_length = int(os.getenv('MAX_INPUT_LENGTH', '512'))  # Prompt token budget
+length_buckets = (64, 128, 256, 512)  # Prompts are batched with others of the same bucket
+generator_backend = os.getenv('GENERATOR_BACKEND', 'torch')  # torch, int8 or onnx
+onnx_cache_dir = os.getenv('ONNX_CACHE_DIR', os.path.join('cache', 'onnx'))  # Exported ONNX models
+stream_token_timeout = float(os.getenv('STREAM_TOKEN_TIMEOUT', '60'))  # Seconds a stream waits for its next token
+encoder_cache_size = int(os.getenv('ENCODER_CACHE_SIZE', '64'))  # Prompts whose encoder outputs are kept, 0 disables
+context_token_budget = int(os.getenv('CONTEXT_TOKEN_BUDGET', '0'))  # Max context tokens per prompt, 0 uses all room left
+pack_dedupe_threshold = float(os.getenv('PACK_DEDUPE_THRESHOLD', '0.8'))  # Token Jaccard similarity of near-duplicate passages
+pack_min_fragment = int(os.getenv('PACK_MIN_FRAGMENT', '32'))  # Smallest passage cut worth adding to the context
+pack_separator = os.getenv('PACK_SEPARATOR', ' ; ')  # Text put between packed passages; T5 drops newlines
+
+# Decoding profiles passed to model.generate(), selectable per request
+decoding_profiles = {
+    # Greedy with a tight cap for one-line answers
+    'fast': {
+        'max_new_tokens': 64,
+        'num_beams': 1,
+        'do_sample': False,
+    },
+    'balanced': {
+        'max_new_tokens': 256,
+        'no_repeat_ngram_size': 3,
+        'num_beams': 2,
+        'do_sample': False,
+        'early_stopping': True,
+    },
+    # The original settings: long, sampled beam search
+    'quality': {
+        'max_new_tokens': 1024,
+        'min_length': 100,
+        'no_repeat_ngram_size': 3,
+        'do_sample': True,
+        'num_beams': 4,
+        'early_stopping': True,  # Stop once all beams are finished
+    },
+}
+default_decoding_profile = os.getenv('DECODING_PROFILE', 'quality')
+# Preselected in the UI. Beam search cannot stream, so only greedy profiles (num_beams 1) show tokens as they are
+# decoded; balanced and quality give longer answers that appear in one piece once generation ends.
+ui_decoding_profile = os.getenv('UI_DECODING_PROFILE', 'fast')
+embedding_batch_size = int(os.getenv('EMBEDDING_BATCH_SIZE', '64'))
+embedding_cache_dir = os.getenv('EMBEDDING_CACHE_DIR', os.path.join('cache', 'embeddings'))
+embedding_cache_dtype = os.getenv('EMBEDDING_CACHE_DTYPE', 'float32')  # float32 or float16
+embedding_cache_max_shards = int(os.getenv('EMBEDDING_CACHE_MAX_SHARDS', '16'))  # Shards appended before they are merged
 
 # Path to the SQLite database file
 # DATABASE_PATH = 'database.db'
@@ -30,4 +116,32 @@ DB_HOST = os.getenv('DB_HOST', 'localhost')  # Default to localhost if not set
 DB_PORT = os.getenv('DB_PORT', '5432')  # Default to 5432 if not set
 
 # Construct the database URI
-DATABASE_URI = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
\ No newline at end of file
+DATABASE_URI = f'postgresql://{DB_USER}:{DB_PASSWORD}@{DB_HOST}:{DB_PORT}/{DB_NAME}'
+
+# Database Pool and Telemetry Writer Constants
+db_pool_min = int(os.getenv('DB_POOL_MIN', '1'))
+db_pool_max = int(os.getenv('DB_POOL_MAX', '5'))
+telemetry_queue_size = int(os.getenv('TELEMETRY_QUEUE_SIZE', '1000'))  # Rows waiting to be written
+telemetry_batch_size = int(os.getenv('TELEMETRY_BATCH_SIZE', '50'))  # Rows per flush
+telemetry_flush_interval = float(os.getenv('TELEMETRY_FLUSH_INTERVAL', '2'))  # Max seconds between flushes
+telemetry_max_retries = int(os.getenv('TELEMETRY_MAX_RETRIES', '3'))  # Retries of a batch while the DB is down
+stats_cache_ttl = float(os.getenv('STATS_CACHE_TTL', '5'))  # Seconds feedback stats are cached in-process
+latency_refresh_interval = float(os.getenv('LATENCY_REFRESH_INTERVAL', '60'))  # Min seconds between latency view refreshes
+
+# Tracing Constants
+metrics_port = int(os.getenv('METRICS_PORT', '0'))  # Port of the Prometheus /metrics endpoint, 0 disables it
+trace_profile = os.getenv('TRACE_PROFILE', 'off')  # off, cprofile or torch
+trace_sample_rate = float(os.getenv('TRACE_SAMPLE_RATE', '0.1'))  # Share of requests profiled when enabled
+trace_slow_ms = float(os.getenv('TRACE_SLOW_MS', '2000'))  # Profiles of faster requests are discarded
+trace_dir = os.getenv('TRACE_DIR', os.path.join('cache', 'traces'))
+startup_budget_ms = float(os.getenv('STARTUP_BUDGET_MS', '500'))  # Max import time of app.py's src modules
+
+# Inference Server Constants
+inference_url = os.getenv('INFERENCE_URL', '')  # http://host:port or unix:/path of the server; empty runs inference in-process
+inference_host = os.getenv('INFERENCE_HOST', '127.0.0.1')
+inference_port = int(os.getenv('INFERENCE_PORT', '8000'))
+inference_search_types = os.getenv('INFERENCE_SEARCH_TYPES', 'Text,Vector,Hybrid').split(',')  # Pipelines the server loads
+batch_max_size = int(os.getenv('BATCH_MAX_SIZE', '8'))  # Requests per micro-batch
+batch_wait_ms = float(os.getenv('BATCH_WAIT_MS', '10'))  # How long a micro-batch waits for more requests
+inference_queue_size = int(os.getenv('INFERENCE_QUEUE_SIZE', '64'))  # Queued requests per pipeline before new ones are rejected
+request_timeout = float(os.getenv('REQUEST_TIMEOUT', '120'))  # Seconds before a queued or running request times out
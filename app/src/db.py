@@ -1,73 +1,502 @@
 # db.py
-# This script initializes the PostgreSQL database and creates necessary tables.
+# This script initializes the PostgreSQL database by applying the schema migrations.
+# Reads go through a connection pool; conversation and feedback inserts are
+# queued and written in batches by a background thread, through a PostgreSQL
+# or SQLite sink.
 
-import psycopg2
-import os
-from src.constants import DATABASE_URI 
+import atexit
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
 
-def init_db():
-    """Initialize the PostgreSQL database with necessary tables."""
-    print('[DEBUG] Initializing database...')
+from src.constants import (
+    DATABASE_URI,
+    db_pool_min,
+    db_pool_max,
+    telemetry_queue_size,
+    telemetry_batch_size,
+    telemetry_flush_interval,
+    telemetry_max_retries,
+    stats_cache_ttl,
+    latency_refresh_interval,
+)
+from src.tracing import STAGES, stage
+
+# Per-stage request timings; the DB write itself happens later and is only exported as a metric
+STAGE_COLUMNS = tuple(f'{name}_ms' for name in STAGES if name != 'db_write')
+
+CONVERSATION_COLUMNS = (
+    'id', 'question', 'answer', 'time_taken', 'total_hits', 'relevance_score', 'topic', 'search_type',
+    'decoding_profile', 'decode_tokens', 'decode_time', 'cache_status', 'ttft_ms', 'total_time_ms',
+    *STAGE_COLUMNS,
+)
+FEEDBACK_COLUMNS = ('conversation_id', 'feedback')
+
+# Conversations are written before feedback, which references them
+TABLE_COLUMNS = {
+    'conversations': CONVERSATION_COLUMNS,
+    'feedback': FEEDBACK_COLUMNS,
+}
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    """Return the process-wide connection pool, creating it on first use."""
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                from psycopg2 import pool
+
+                _pool = pool.ThreadedConnectionPool(db_pool_min, db_pool_max, DATABASE_URI)
+    return _pool
+
+
+@contextmanager
+def get_connection():
+    """Borrow a connection from the pool, committing on success and rolling back on error."""
+    connection_pool = get_pool()
+    conn = connection_pool.getconn()
+    try:
+        yield conn
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        # Broken connections are closed instead of going back to the pool
+        connection_pool.putconn(conn, close=bool(conn.closed))
+
+
+class PostgresSink:
+    """
+    Writes telemetry batches to PostgreSQL with execute_values, every table of
+    a batch in one transaction, so a batch is either written or not at all.
+    The latency percentiles view is refreshed at most every latency_refresh_interval seconds.
+    """
+
+    def __init__(self):
+        self._last_latency_refresh = 0.0
+
+    def is_transient(self, error):
+        """Return True for connection errors, which are worth retrying."""
+        import psycopg2
+        from psycopg2 import pool
+
+        return isinstance(error, (psycopg2.OperationalError, psycopg2.InterfaceError, pool.PoolError))
+
+    def write(self, rows_by_table):
+        """
+        Insert rows into their tables in one transaction.
+
+        Args:
+            rows_by_table (dict): Lists of row tuples keyed by table name.
+        """
+        import psycopg2
+        from psycopg2.extras import execute_values
+
+        with stage('db_write'), get_connection() as conn:
+            with conn.cursor() as cursor:
+                for table, columns in TABLE_COLUMNS.items():
+                    if rows_by_table.get(table):
+                        execute_values(
+                            cursor,
+                            f"INSERT INTO {table} ({', '.join(columns)}) VALUES %s ON CONFLICT DO NOTHING",
+                            rows_by_table[table],
+                        )
+
+        if rows_by_table.get('conversations') and time.time() - self._last_latency_refresh > latency_refresh_interval:
+            self._last_latency_refresh = time.time()
+            try:
+                refresh_latency_stats()
+            except psycopg2.Error as e:
+                # The rows are already written, a stale view is not worth retrying them for
+                print(f'[DEBUG] Could not refresh latency stats: {e}')
+
+
+class SQLiteSink:
+    """
+    Writes telemetry batches to a SQLite database, every table of a batch in
+    one transaction. For local runs and tests without PostgreSQL.
+
+    Attributes:
+        path (str): Database file, or ':memory:'.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+
+    def create_tables(self):
+        """Create the telemetry tables, with untyped columns, if they do not exist."""
+        with self._lock, self._conn:
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS conversations "
+                               f"(id TEXT PRIMARY KEY, {', '.join(CONVERSATION_COLUMNS[1:])})")
+            self._conn.execute(f"CREATE TABLE IF NOT EXISTS feedback ({', '.join(FEEDBACK_COLUMNS)})")
+
+    def is_transient(self, error):
+        """Return True when the database was locked by another writer."""
+        return isinstance(error, sqlite3.OperationalError) and 'locked' in str(error)
+
+    def write(self, rows_by_table):
+        """
+        Insert rows into their tables in one transaction.
+
+        Args:
+            rows_by_table (dict): Lists of row tuples keyed by table name.
+        """
+        with self._lock, self._conn:
+            for table, columns in TABLE_COLUMNS.items():
+                if rows_by_table.get(table):
+                    self._conn.executemany(
+                        f"INSERT OR IGNORE INTO {table} ({', '.join(columns)}) "
+                        f"VALUES ({', '.join('?' * len(columns))})",
+                        rows_by_table[table],
+                    )
+
+    def close(self):
+        """Close the connection."""
+        self._conn.close()
+
+
+class TelemetryWriter:
+    """
+    Writes rows to the database from a background thread so that callers never
+    wait on the database.
+
+    Rows go into a bounded queue and are flushed in batches once batch_size
+    rows are waiting or flush_interval seconds have passed. A batch that fails
+    with a transient (connection) error is retried with backoff; after
+    max_retries it is dropped. A batch that fails otherwise is written again
+    table by table, so a bad feedback row does not cost the conversations
+    their rows, and only the tables that still fail are dropped. When the
+    queue is full, new rows wait up to put_timeout seconds and are then
+    dropped. Written and dropped rows are counted per row.
+
+    The sink writes a dict of row lists keyed by table name in one transaction
+    and tells transient errors apart (PostgresSink, SQLiteSink).
+
+    Attributes:
+        sink (PostgresSink or SQLiteSink): Writes batches of rows.
+        batch_size (int): Rows per flush.
+        flush_interval (float): Maximum seconds between flushes.
+        max_retries (int): Retries of a batch on connection errors.
+        put_timeout (float): Seconds to wait for room in a full queue before dropping a row.
+        written (int): Rows written so far.
+        dropped (int): Rows dropped so far.
+    """
+
+    _stop = object()
+
+    def __init__(self, sink=None, queue_size=telemetry_queue_size, batch_size=telemetry_batch_size,
+                 flush_interval=telemetry_flush_interval, max_retries=telemetry_max_retries, put_timeout=0):
+        self.sink = PostgresSink() if sink is None else sink
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_retries = max_retries
+        self.put_timeout = put_timeout
+        self.written = 0
+        self.dropped = 0
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._thread = threading.Thread(target=self._run, name='telemetry-writer', daemon=True)
+        self._thread.start()
+
+    def submit(self, table, row):
+        """
+        Queue a row for insertion.
+
+        Args:
+            table (str): Table name.
+            row (tuple): Row values in the table's column order.
+
+        Returns:
+            bool: False if the queue was full and the row was dropped.
+        """
+        try:
+            if self.put_timeout:
+                self._queue.put((table, row), timeout=self.put_timeout)
+            else:
+                self._queue.put_nowait((table, row))
+        except queue.Full:
+            self.dropped += 1
+            print(f'[DEBUG] Telemetry queue full, dropped a {table} row ({self.dropped} dropped so far).')
+            return False
+        return True
+
+    def _write(self, rows_by_table):
+        """Write a batch, retrying transient errors with backoff. Return the error that ended it, or None."""
+        for attempt in range(self.max_retries + 1):
+            try:
+                self.sink.write(rows_by_table)
+                return None
+            except Exception as e:
+                if not self.sink.is_transient(e) or attempt == self.max_retries:
+                    return e
+                print(f'[DEBUG] Database unavailable ({e}), retrying telemetry flush...')
+                time.sleep(min(2 ** attempt, 30))
+
+    def _flush(self, rows):
+        if not rows:
+            return
+        rows_by_table = {}
+        for table, row in rows:
+            rows_by_table.setdefault(table, []).append(row)
 
-    with psycopg2.connect(DATABASE_URI) as conn:
+        error = self._write(rows_by_table)
+        if error is None:
+            self.written += len(rows)
+            print(f'[DEBUG] Flushed {len(rows)} telemetry rows to the database.')
+            return
+        print(f'[DEBUG] Telemetry flush failed: {error}')
+
+        if len(rows_by_table) > 1 and not self.sink.is_transient(error):
+            # The batch was rolled back; write each table on its own so only the failing ones are lost
+            results = {table: self._write({table: rows_by_table[table]})
+                       for table in TABLE_COLUMNS if table in rows_by_table}
+        else:
+            results = {table: error for table in rows_by_table}
+        for table, table_error in results.items():
+            if table_error is None:
+                self.written += len(rows_by_table[table])
+            else:
+                self.dropped += len(rows_by_table[table])
+                print(f'[DEBUG] Dropped {len(rows_by_table[table])} {table} rows '
+                      f'({self.dropped} dropped so far): {table_error}')
+
+    def _run(self):
+        rows = []
+        deadline = time.time() + self.flush_interval
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0, deadline - time.time()))
+            except queue.Empty:
+                item = None
+
+            if item is self._stop:
+                self._flush(rows)
+                return
+            if item is not None:
+                rows.append(item)
+
+            if len(rows) >= self.batch_size or time.time() >= deadline:
+                self._flush(rows)
+                rows = []
+                deadline = time.time() + self.flush_interval
+
+    def close(self, timeout=10):
+        """
+        Flush queued rows and stop the background thread.
+
+        Args:
+            timeout (float): Seconds to wait for the final flush.
+        """
+        if not self._thread.is_alive():
+            return
+        try:
+            self._queue.put(self._stop, timeout=timeout)
+        except queue.Full:
+            pass
+        self._thread.join(timeout)
+
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def get_writer():
+    """Return the process-wide telemetry writer, starting it on first use."""
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = TelemetryWriter()
+                # Graceful flush on interpreter shutdown
+                atexit.register(_writer.close)
+    return _writer
+
+
+# Schema migrations, applied in order. Each version runs once, in its own transaction.
+MIGRATIONS = [
+    (1, [
+        '''
+        CREATE TABLE IF NOT EXISTS conversations (
+            id TEXT PRIMARY KEY,
+            question TEXT NOT NULL,
+            answer TEXT NOT NULL,
+            time_taken INT,
+            total_hits INT,
+            relevance_score FLOAT,
+            topic TEXT,
+            search_type TEXT,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS feedback (
+            id SERIAL PRIMARY KEY,
+            conversation_id TEXT NOT NULL,
+            feedback INTEGER NOT NULL,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+        )
+        ''',
+    ]),
+    # Decoding, cache and streaming metadata
+    (2, [
+        'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS decoding_profile TEXT',
+        'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS decode_tokens INT',
+        'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS decode_time FLOAT',
+        'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS cache_status TEXT',
+        'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS ttft_ms INT',
+        'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS total_time_ms INT',
+    ]),
+    # Indexes for recent-conversation reads, feedback joins and per-search-type dashboards
+    (3, [
+        'CREATE INDEX IF NOT EXISTS conversations_timestamp_idx ON conversations (timestamp DESC)',
+        'CREATE INDEX IF NOT EXISTS conversations_search_type_idx ON conversations (search_type)',
+        'CREATE INDEX IF NOT EXISTS feedback_conversation_id_idx ON feedback (conversation_id)',
+    ]),
+    # Feedback counts maintained by a trigger, so stats never scan the feedback table
+    (4, [
+        '''
+        CREATE TABLE IF NOT EXISTS feedback_summary (
+            feedback INTEGER PRIMARY KEY,
+            count BIGINT NOT NULL DEFAULT 0
+        )
+        ''',
+        '''
+        CREATE OR REPLACE FUNCTION feedback_summary_update() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'INSERT' THEN
+                INSERT INTO feedback_summary (feedback, count) VALUES (NEW.feedback, 1)
+                ON CONFLICT (feedback) DO UPDATE SET count = feedback_summary.count + 1;
+                RETURN NEW;
+            END IF;
+            UPDATE feedback_summary SET count = count - 1 WHERE feedback = OLD.feedback;
+            RETURN OLD;
+        END;
+        $$ LANGUAGE plpgsql
+        ''',
+        'DROP TRIGGER IF EXISTS feedback_summary_trigger ON feedback',
+        '''
+        CREATE TRIGGER feedback_summary_trigger AFTER INSERT OR DELETE ON feedback
+        FOR EACH ROW EXECUTE FUNCTION feedback_summary_update()
+        ''',
+        '''
+        INSERT INTO feedback_summary (feedback, count)
+        SELECT feedback, COUNT(*) FROM feedback GROUP BY feedback
+        ON CONFLICT (feedback) DO UPDATE SET count = EXCLUDED.count
+        ''',
+    ]),
+    # Per-search-type latency percentiles, refreshed periodically by the telemetry writer
+    (5, [
+        '''
+        CREATE MATERIALIZED VIEW IF NOT EXISTS search_type_latency AS
+        SELECT search_type,
+               COUNT(*) AS requests,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY time_taken) AS p50_time_taken,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY time_taken) AS p95_time_taken,
+               percentile_cont(0.99) WITHIN GROUP (ORDER BY time_taken) AS p99_time_taken,
+               percentile_cont(0.5) WITHIN GROUP (ORDER BY total_time_ms) AS p50_total_time_ms,
+               percentile_cont(0.95) WITHIN GROUP (ORDER BY total_time_ms) AS p95_total_time_ms,
+               percentile_cont(0.99) WITHIN GROUP (ORDER BY total_time_ms) AS p99_total_time_ms
+        FROM conversations
+        GROUP BY search_type
+        ''',
+        # A unique index lets the view be refreshed without blocking readers
+        'CREATE UNIQUE INDEX IF NOT EXISTS search_type_latency_idx ON search_type_latency (search_type)',
+    ]),
+    # Per-stage request timings from src.tracing
+    (6, [f'ALTER TABLE conversations ADD COLUMN IF NOT EXISTS {column} INT' for column in STAGE_COLUMNS]),
+]
+
+def migrate(conn):
+    """
+    Apply the schema migrations that have not been applied yet, committing after
+    each version so a failing migration leaves the earlier ones applied.
+
+    A session-level advisory lock, taken before any DDL and held across the
+    per-version commits, serializes app processes starting at the same time.
+
+    Args:
+        conn: An open psycopg2 connection.
+    """
+    with conn.cursor() as cursor:
+        cursor.execute('SELECT pg_advisory_lock(hashtext(%s))', ('schema_migrations',))
+    try:
         with conn.cursor() as cursor:
-            # cursor.execute("DROP TABLE IF EXISTS feedback")
-            # cursor.execute("DROP TABLE IF EXISTS conversations")
-            # Create the conversations table
-            cursor.execute('''
-                CREATE TABLE IF NOT EXISTS conversations (
-                    id TEXT PRIMARY KEY,
-                    question TEXT NOT NULL,
-                    answer TEXT NOT NULL,
-                    time_taken INT,  
-                    total_hits INT,
-                    relevance_score FLOAT,   
-                    topic TEXT,
-                    search_type TEXT,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
-                )
-            ''')        
-            
-            # Create the feedback table
             cursor.execute('''
-                CREATE TABLE IF NOT EXISTS feedback (
-                    id SERIAL PRIMARY KEY,
-                    conversation_id TEXT NOT NULL,
-                    feedback INTEGER NOT NULL,
-                    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-                    FOREIGN KEY (conversation_id) REFERENCES conversations (id) ON DELETE CASCADE
+                CREATE TABLE IF NOT EXISTS schema_migrations (
+                    version INT PRIMARY KEY,
+                    applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
-            
-            conn.commit()
+            cursor.execute('SELECT version FROM schema_migrations')
+            applied = {row[0] for row in cursor.fetchall()}
+        conn.commit()
 
-def save_conversation(conversation_id, question, answer, time_taken, total_hits, relevance_score, topic, search_type):
-    """Save a conversation to the database."""
-    with psycopg2.connect(DATABASE_URI) as conn:
-        with conn.cursor() as cursor: 
-            cursor.execute('''
-                INSERT INTO conversations (id, question, answer, time_taken, total_hits, relevance_score, topic, search_type) VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
-            ''', (conversation_id, question, answer, time_taken, total_hits, relevance_score, topic, search_type))
+        for version, statements in MIGRATIONS:
+            if version in applied:
+                continue
+            print(f'[DEBUG] Applying schema migration {version}...')
+            with conn.cursor() as cursor:
+                for statement in statements:
+                    cursor.execute(statement)
+                cursor.execute('INSERT INTO schema_migrations (version) VALUES (%s)', (version,))
+            conn.commit()
+    finally:
+        # A failed migration is rolled back; the lock is released either way
+        if not conn.closed:
+            conn.rollback()
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT pg_advisory_unlock(hashtext(%s))', ('schema_migrations',))
             conn.commit()
-            print('[DEBUG] Conversation saved to database.')
 
-def save_feedback(conversation_id, feedback):
-    """Save feedback to the database."""
-    with psycopg2.connect(DATABASE_URI) as conn:
+def init_db():
+    """Initialize the PostgreSQL database by applying pending schema migrations."""
+    print('[DEBUG] Initializing database...')
+
+    with get_connection() as conn:
+        migrate(conn)
+
+def refresh_latency_stats():
+    """Refresh the per-search-type latency percentiles view."""
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute('''
-                INSERT INTO feedback (conversation_id, feedback) VALUES (%s, %s)
-            ''', (conversation_id, feedback))
-            conn.commit()
-            print('[DEBUG] Feedback saved to database.')
+            cursor.execute('REFRESH MATERIALIZED VIEW CONCURRENTLY search_type_latency')
+
+def save_conversation(conversation_id, question, answer, time_taken, total_hits, relevance_score, topic, search_type,
+                      decoding_profile=None, decode_tokens=None, decode_time=None, cache_status=None,
+                      ttft_ms=None, total_time_ms=None, stage_ms=None):
+    """Queue a conversation to be saved to the database. stage_ms maps stage names to milliseconds."""
+    stage_ms = stage_ms or {}
+    get_writer().submit('conversations', (
+        conversation_id, question, answer, time_taken, total_hits, relevance_score, topic, search_type,
+        decoding_profile, decode_tokens, decode_time, cache_status, ttft_ms, total_time_ms,
+        *(stage_ms.get(column[:-len('_ms')]) for column in STAGE_COLUMNS),
+    ))
+    print('[DEBUG] Conversation queued for the database.')
+
+def save_feedback(conversation_id, feedback):
+    """Queue feedback to be saved to the database."""
+    get_writer().submit('feedback', (conversation_id, feedback))
+    print('[DEBUG] Feedback queued for the database.')
 
 def get_recent_conversations(limit=5):
     """Retrieve recent conversations from the database."""
-    with psycopg2.connect(DATABASE_URI) as conn:
+    with get_connection() as conn:
         with conn.cursor() as cursor:
-            cursor.execute('SELECT * FROM conversations ORDER BY timestamp DESC LIMIT %s', (limit,))
+            cursor.execute('''
+                SELECT id, question, answer, time_taken, total_hits, relevance_score, topic, timestamp
+                FROM conversations ORDER BY timestamp DESC LIMIT %s
+            ''', (limit,))
             rows = cursor.fetchall()
-    
+
     # Convert rows to dictionaries for easier access
     conversations = []
     for row in rows:
@@ -82,25 +511,49 @@ def get_recent_conversations(limit=5):
             'timestamp': row[7]
         }
         conversations.append(conversation)
-    
+
     return conversations
 
+_stats_cache = {}
+
+def _cached(name, loader):
+    """Return a cached query result, reloading it once it is older than stats_cache_ttl."""
+    cached = _stats_cache.get(name)
+    if cached and time.time() - cached[0] < stats_cache_ttl:
+        return cached[1]
+    value = loader()
+    _stats_cache[name] = (time.time(), value)
+    return value
+
 def get_feedback_stats():
-    """Retrieve feedback statistics from the database."""
-    with psycopg2.connect(DATABASE_URI) as conn:
-        with conn.cursor() as cursor:
-            # Count positive feedback
-            cursor.execute('SELECT COUNT(*) FROM feedback WHERE feedback = 1')
-            thumbs_up = cursor.fetchone()[0]
-            
-            # Count negative feedback
-            cursor.execute('SELECT COUNT(*) FROM feedback WHERE feedback = -1')
-            thumbs_down = cursor.fetchone()[0]
-    
-    return {
-        'thumbs_up': thumbs_up,
-        'thumbs_down': thumbs_down
-    }
+    """Retrieve feedback statistics from the database in one query, cached briefly."""
+    def load():
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('''
+                    SELECT COALESCE(SUM(count) FILTER (WHERE feedback = 1), 0),
+                           COALESCE(SUM(count) FILTER (WHERE feedback = -1), 0)
+                    FROM feedback_summary
+                ''')
+                thumbs_up, thumbs_down = cursor.fetchone()
+
+        return {
+            'thumbs_up': thumbs_up,
+            'thumbs_down': thumbs_down
+        }
+
+    return _cached('feedback_stats', load)
+
+def get_latency_stats():
+    """Retrieve per-search-type latency percentiles from the database, cached briefly."""
+    def load():
+        with get_connection() as conn:
+            with conn.cursor() as cursor:
+                cursor.execute('SELECT * FROM search_type_latency ORDER BY search_type')
+                columns = [column[0] for column in cursor.description]
+                return [dict(zip(columns, row)) for row in cursor.fetchall()]
+
+    return _cached('latency_stats', load)
 
 if __name__ == "__main__":
     init_db()
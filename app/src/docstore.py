@@ -0,0 +1,454 @@
+# docstore.py
+# Columnar, memory-mapped document store shared by the in-process retrieval backends.
+
+import hashlib
+import json
+import os
+import shutil
+from array import array
+
+import numpy as np
+
+from src.constants import docstore_dir, embedding_model, embedding_size, loader_chunk_size, model_name
+from src.indexmanager import schema_hash
+from src.sync import sync_documents
+
+# Elements copied per write when streaming a column slice to disk
+_copy_block = 1 << 24
+
+
+def _unit(vectors):
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _map(path, dtype, shape, mmap=True):
+    """Reads a raw array file, memory-mapped unless it is empty or mmap is off."""
+    if not mmap or not int(np.prod(shape)):
+        return np.fromfile(path, dtype=dtype).reshape(shape)
+    return np.memmap(path, dtype=dtype, mode='r', shape=shape)
+
+
+def _embedding_meta():
+    return {'model': embedding_model, 'size': embedding_size}
+
+
+class DocStore:
+    """
+    The corpus as a few flat arrays instead of one dict per document.
+
+    The id, question and answer columns are UTF-8 bytes in one buffer per
+    column, with int64 offsets. The topic is an int32 code per row into a short
+    list of distinct values. The answers' token ids share one int32 buffer with
+    offsets. Embeddings are optional: a contiguous, unit-normalized float32
+    matrix that only the vector backends ask for. Every array is a file that is
+    memory-mapped on load, so processes on one machine share a single copy
+    through the page cache.
+
+    Indices fitted over the store return row numbers and read only the columns
+    they need. ``store[row]`` returns a document as a dict for code that wants one.
+
+    Attributes:
+        path (str): Directory the store was loaded from.
+        columns (dict): (buffer, offsets) per text column.
+        topic_values (list of str): Distinct topics, sorted.
+        topic_codes (np.ndarray): Position of each row's topic in topic_values.
+        answer_tokens (np.ndarray): Token ids of all answers, concatenated.
+        answer_offsets (np.ndarray): Start of each answer in answer_tokens, plus the end of the last one.
+        embeddings (np.ndarray or None): Unit question and answer embedding per row, if computed.
+        version (str): Hash of the stored documents.
+    """
+
+    # Bumped whenever the on-disk layout written by _StoreWriter changes
+    format_version = 2
+
+    text_columns = ('id', 'question', 'answer')
+
+    def __init__(self):
+        self.path = None
+        self.columns = {}
+        self.topic_values = []
+        self.topic_codes = None
+        self.answer_tokens = None
+        self.answer_offsets = None
+        self.embeddings = None
+        self.version = None
+
+    def __len__(self):
+        return len(self.columns['id'][1]) - 1
+
+    def __getitem__(self, row):
+        return {
+            'id': self.text('id', row),
+            'question': self.text('question', row),
+            'answer': self.text('answer', row),
+            'topic': self.topic(row),
+            'answer_ids': self.answer_ids(row),
+        }
+
+    def __iter__(self):
+        return (self[row] for row in range(len(self)))
+
+    def text(self, name, row):
+        """
+        Returns one value of a text column.
+
+        Args:
+            name (str): 'id', 'question' or 'answer'.
+            row (int): Row number.
+
+        Returns:
+            str: The decoded value.
+        """
+        buffer, offsets = self.columns[name]
+        return buffer[offsets[row]:offsets[row + 1]].tobytes().decode('utf-8')
+
+    def topic(self, row):
+        """Returns the topic of a row."""
+        return self.topic_values[self.topic_codes[row]]
+
+    def answer_ids(self, row):
+        """Returns the token ids of a row's answer."""
+        return self.answer_tokens[self.answer_offsets[row]:self.answer_offsets[row + 1]].tolist()
+
+    def column(self, name, rows=None):
+        """
+        Returns the values of a column.
+
+        Args:
+            name (str): 'id', 'question', 'answer' or 'topic'.
+            rows (iterable of int, optional): Row numbers. Defaults to every row.
+
+        Returns:
+            list of str: The values, in row order.
+        """
+        rows = range(len(self)) if rows is None else rows
+        if name == 'topic':
+            return [self.topic(row) for row in rows]
+        return [self.text(name, row) for row in rows]
+
+    def keyword_codes(self, field):
+        """
+        Returns the sorted distinct values of a column and the code of every row,
+        in the form the indices use for keyword filters.
+
+        Args:
+            field (str): Column name.
+
+        Returns:
+            tuple: Distinct values (np.ndarray) and one int32 code per row.
+        """
+        if field == 'topic':
+            return np.array(self.topic_values, dtype=object), np.asarray(self.topic_codes, dtype=np.int32)
+        values, codes = np.unique(np.array(self.column(field), dtype=object), return_inverse=True)
+        return values, codes.astype(np.int32)
+
+    def retrieval(self, rows, scores, time_taken):
+        """
+        Builds a retrieval result from ranked rows.
+
+        Args:
+            rows (np.ndarray): Row numbers of the top documents, best first.
+            scores (np.ndarray): Their scores.
+            time_taken (int): Search time in ms.
+
+        Returns:
+            dict: The retrieved answers, ids, scores, answer_ids, time_taken, total_hits, relevance_score and topic.
+        """
+        return {
+            'answers': self.column('answer', rows),
+            'ids': self.column('id', rows),
+            'scores': [float(score) for score in scores[:len(rows)]],
+            'answer_ids': [self.answer_ids(row) for row in rows],
+            'time_taken': time_taken,
+            'total_hits': len(rows),
+            'relevance_score': float(scores[0]) if len(rows) else None,
+            'topic': self.topic(rows[0]) if len(rows) else None,
+        }
+
+    def add_embeddings(self, chunk_size=loader_chunk_size):
+        """
+        Embeds every row, chunk by chunk, and saves the matrix next to the other
+        columns. For stores written by a pipeline that needed no embeddings;
+        rows already in the embedding cache are not encoded again.
+
+        Args:
+            chunk_size (int): Rows embedded per chunk.
+        """
+        from src.embeddings import BatchEncoder
+
+        print(f'[DEBUG] Adding embeddings to the doc store of {len(self)} documents...')
+        encoder = BatchEncoder()
+        tmp_file = os.path.join(self.path, 'embeddings.bin.tmp')
+        with open(tmp_file, 'wb') as f:
+            for start in range(0, len(self), chunk_size):
+                rows = range(start, min(start + chunk_size, len(self)))
+                texts = [question + ' ' + answer for question, answer
+                         in zip(self.column('question', rows), self.column('answer', rows))]
+                f.write(_unit(encoder.encode(texts)).tobytes())
+        os.replace(tmp_file, os.path.join(self.path, 'embeddings.bin'))
+
+        meta_file = os.path.join(self.path, 'meta.json')
+        with open(meta_file) as f:
+            meta = json.load(f)
+        meta['embeddings'] = _embedding_meta()
+        with open(f'{meta_file}.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(f'{meta_file}.tmp', meta_file)
+        self.embeddings = _map(os.path.join(self.path, 'embeddings.bin'), np.float32, (len(self), embedding_size))
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """
+        Loads a store written by _StoreWriter, memory-mapping the arrays by default.
+        Embeddings of another model or size than the configured one are left out.
+
+        Args:
+            path (str): Directory the store was written to.
+            mmap (bool): Memory-map the arrays instead of reading them into memory.
+
+        Returns:
+            DocStore: The loaded store.
+        """
+        def offsets(name):
+            return np.load(os.path.join(path, f'{name}_offsets.npy'), mmap_mode='r' if mmap else None)
+
+        def data(name, dtype, shape):
+            return _map(os.path.join(path, f'{name}.bin'), dtype, shape, mmap)
+
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        store = cls()
+        store.path = path
+        store.version = meta['version']
+        store.topic_values = meta['topic_values']
+        for name in cls.text_columns:
+            name_offsets = offsets(name)
+            store.columns[name] = (data(name, np.uint8, (int(name_offsets[-1]),)), name_offsets)
+        store.topic_codes = np.load(os.path.join(path, 'topic_codes.npy'), mmap_mode='r' if mmap else None)
+        store.answer_offsets = offsets('answer_tokens')
+        store.answer_tokens = data('answer_tokens', np.int32, (int(store.answer_offsets[-1]),))
+        if meta['embeddings'] == _embedding_meta():
+            store.embeddings = data('embeddings', np.float32, (meta['rows'], embedding_size))
+        return store
+
+
+class _StoreWriter:
+    """
+    Writes a store to a directory chunk by chunk, from new documents and from
+    runs of rows of an existing store, so neither is ever held in memory as a
+    whole. Text columns, answer tokens and embeddings are appended to flat
+    files as they come; only the lengths and topic codes (a few bytes per row)
+    are kept until close() writes the offsets and the metadata.
+
+    Attributes:
+        path (str): Directory the store is written to.
+        embeddings (bool): Whether rows come with embeddings.
+        rows (int): Number of rows written so far.
+    """
+
+    def __init__(self, path, embeddings=False):
+        self.path = path
+        self.embeddings = embeddings
+        self.rows = 0
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        names = DocStore.text_columns + ('answer_tokens',) + (('embeddings',) if embeddings else ())
+        self.files = {name: open(os.path.join(path, f'{name}.bin'), 'wb') for name in names}
+        self.digests = {name: hashlib.sha256() for name in DocStore.text_columns}
+        self.lengths = {name: array('q') for name in DocStore.text_columns + ('answer_tokens',)}
+        # Topic -> code in first-seen order; codes are sorted by topic in close()
+        self.topics = {}
+        self.codes = array('i')
+
+    def _code(self, topic):
+        return self.topics.setdefault(topic, len(self.topics))
+
+    def _write(self, name, data):
+        step = max(1, _copy_block // max(1, data[:1].nbytes))
+        for start in range(0, len(data), step):
+            block = np.ascontiguousarray(data[start:start + step]).tobytes()
+            self.files[name].write(block)
+            if name in self.digests:
+                self.digests[name].update(block)
+
+    def append_docs(self, docs, vectors=None):
+        """
+        Appends documents.
+
+        Args:
+            docs (list of dict): Documents with id, question, answer, topic and answer_ids.
+            vectors (np.ndarray, optional): One embedding per document, if the store has embeddings.
+        """
+        for name in DocStore.text_columns:
+            encoded = [str(doc[name]).encode('utf-8') for doc in docs]
+            self._write(name, np.frombuffer(b''.join(encoded), dtype=np.uint8))
+            self.lengths[name].extend(len(value) for value in encoded)
+        tokens = [np.asarray(doc['answer_ids'], dtype=np.int32) for doc in docs]
+        self._write('answer_tokens', np.concatenate(tokens) if tokens else np.empty(0, dtype=np.int32))
+        self.lengths['answer_tokens'].extend(len(ids) for ids in tokens)
+        self.codes.extend(self._code(str(doc['topic'])) for doc in docs)
+        if self.embeddings:
+            self._write('embeddings', _unit(vectors).reshape(len(docs), embedding_size))
+        self.rows += len(docs)
+
+    def append_rows(self, store, start, end):
+        """
+        Appends the rows start to end of another store, copying column slices
+        without decoding them.
+
+        Args:
+            store (DocStore): The store to copy from. Must have embeddings if this store has.
+            start (int): First row.
+            end (int): Row after the last one.
+        """
+        ragged = [(name, *store.columns[name]) for name in DocStore.text_columns]
+        ragged.append(('answer_tokens', store.answer_tokens, store.answer_offsets))
+        for name, buffer, offsets in ragged:
+            self._write(name, buffer[offsets[start]:offsets[end]])
+            self.lengths[name].frombytes(np.diff(offsets[start:end + 1]).astype(np.int64).tobytes())
+        codes = np.array([self._code(value) for value in store.topic_values], dtype=np.int32)
+        self.codes.frombytes(codes[np.asarray(store.topic_codes[start:end])].tobytes())
+        if self.embeddings:
+            self._write('embeddings', store.embeddings[start:end])
+        self.rows += end - start
+
+    def close(self):
+        """Writes the offsets, topic codes and metadata and closes the files."""
+        for f in self.files.values():
+            f.close()
+
+        values = sorted(self.topics)
+        remap = np.empty(len(values), dtype=np.int32)
+        for code, value in enumerate(values):
+            remap[self.topics[value]] = code
+        codes = remap[np.frombuffer(self.codes, dtype=np.int32)]
+        np.save(os.path.join(self.path, 'topic_codes.npy'), codes)
+
+        digest = hashlib.sha256()
+        for name, lengths in self.lengths.items():
+            offsets = np.zeros(self.rows + 1, dtype=np.int64)
+            offsets[1:] = np.cumsum(np.frombuffer(lengths, dtype=np.int64))
+            np.save(os.path.join(self.path, f'{name}_offsets.npy'), offsets)
+            if name in self.digests:
+                digest.update(self.digests[name].digest())
+                digest.update(offsets.tobytes())
+        digest.update(json.dumps(values).encode('utf-8'))
+        digest.update(codes.tobytes())
+
+        with open(os.path.join(self.path, 'meta.json'), 'w') as f:
+            json.dump({
+                'version': digest.hexdigest()[:12],
+                'rows': self.rows,
+                'topic_values': values,
+                'embeddings': _embedding_meta() if self.embeddings else None,
+            }, f)
+
+
+def _kept_runs(store, replaced):
+    """
+    Returns the (start, end) runs of rows of a store whose id is not in replaced.
+
+    Args:
+        store (DocStore): The store.
+        replaced (set of str): Ids of the rows to leave out.
+
+    Returns:
+        list of tuple: Row ranges, in row order.
+    """
+    runs, start = [], 0
+    for row, doc_id in enumerate(store.column('id')):
+        if doc_id in replaced:
+            if row > start:
+                runs.append((start, row))
+            start = row + 1
+    if len(store) > start:
+        runs.append((start, len(store)))
+    return runs
+
+
+def remove_stale(directory, prefix, keep):
+    """
+    Deletes the saved versions in directory that start with prefix, except keep.
+    Processes that still map the files of a deleted version keep reading them.
+
+    Args:
+        directory (str): Directory holding one sub-directory per version.
+        prefix (str): Name prefix of the versions to consider.
+        keep (str): Name of the version to keep.
+    """
+    if not os.path.isdir(directory):
+        return
+    for name in os.listdir(directory):
+        if name.startswith(prefix) and name != keep and not name.endswith('.tmp'):
+            shutil.rmtree(os.path.join(directory, name), ignore_errors=True)
+
+
+# Stores already opened by this process, by path
+_stores = {}
+
+
+def open_docstore(prepare_fn, refresh=False, with_embeddings=False, chunks=None):
+    """
+    Returns the doc store of this process, synced with the data file the first
+    time it is opened (or when refresh is set). Only new and changed documents
+    are tokenized (and embedded, if the store has embeddings); the rest are
+    copied from the saved store as column slices.
+
+    Embeddings are computed only for callers that ask for them, so keyword-only
+    backends never load the embedding model. A sync without with_embeddings
+    writes a store without them; the next caller that needs them adds them back
+    through the embedding cache.
+
+    Args:
+        prepare_fn (callable): Adds ``answer_ids`` to a list of documents in place,
+            e.g. RAGPipeline.add_answer_ids.
+        refresh (bool): Sync again even if the store is already open.
+        with_embeddings (bool): Make sure the store has embeddings.
+        chunks (iterable of list of dict, optional): The current documents. Defaults to iter_records().
+
+    Returns:
+        tuple: The DocStore and the sync report from sync_documents().
+    """
+    version = schema_hash(model_name, DocStore.format_version)
+    path = os.path.join(docstore_dir, version)
+    if path not in _stores or refresh:
+        current = {'store': DocStore.load(path) if os.path.exists(path) else None}
+
+        def apply(upsert_chunks, deletes):
+            store = current['store']
+            embed = with_embeddings and (store is None or store.embeddings is not None)
+            tmp_path = f'{path}.tmp'
+            writer = _StoreWriter(tmp_path, embeddings=embed)
+            replaced = set()
+            for chunk in upsert_chunks:
+                prepare_fn(chunk)
+                vectors = None
+                if embed:
+                    from src.embeddings import BatchEncoder
+                    vectors = BatchEncoder().encode([doc['question'] + ' ' + doc['answer'] for doc in chunk])
+                writer.append_docs(chunk, vectors)
+                replaced.update(doc['id'] for doc in chunk)
+            new_rows = writer.rows
+            replaced.update(deletes)
+
+            if store is not None:
+                for start, end in _kept_runs(store, replaced):
+                    writer.append_rows(store, start, end)
+            writer.close()
+            print(f'[DEBUG] Wrote doc store of {writer.rows} documents, {new_rows} of them new or changed')
+
+            shutil.rmtree(path, ignore_errors=True)
+            os.replace(tmp_path, path)
+            # Map the written files so other processes share them
+            current['store'] = DocStore.load(path)
+
+        report = sync_documents(f'docstore-{version}', apply, chunks=chunks, rebuild=current['store'] is None)
+        _stores[path] = current['store'], report
+
+    store, report = _stores[path]
+    if with_embeddings and store is not None and store.embeddings is None:
+        store.add_embeddings()
+    return store, report
@@ -0,0 +1,262 @@
+# embeddings.py
+# Batched embedding generation backed by a content-addressed on-disk cache.
+
+import glob
+import hashlib
+import os
+import time
+
+import numpy as np
+
+from src.constants import (
+    embedding_model,
+    embedding_size,
+    embedding_batch_size,
+    embedding_cache_dir,
+    embedding_cache_dtype,
+    embedding_cache_max_shards,
+)
+from src.models import get_embedding_model
+
+
+class _CacheIndex:
+    """
+    The shards of one cache directory that this process has read, with the
+    shard and row of every cached key. Shared by the encoders of the process,
+    so each shard's keys are read once.
+
+    Attributes:
+        shards (dict): Memory-mapped vectors per shard name.
+        rows (dict): (shard name, row) per key.
+    """
+
+    def __init__(self):
+        self.shards = {}
+        self.rows = {}
+
+    def add(self, shard, keys, vectors):
+        self.shards[shard] = vectors
+        for row, key in enumerate(keys):
+            # Keys are unique per shard, but concurrent writers may cache the same text twice
+            self.rows.setdefault(str(key), (shard, row))
+
+
+# Cache indices of this process, by cache directory
+_indices = {}
+
+
+class BatchEncoder:
+    """
+    Encodes texts with the shared SentenceTransformer in length-sorted batches
+    and caches the vectors on disk.
+
+    The cache is append-only: every encode() call with texts missing from the
+    cache writes one shard, a ``.keys.npy`` file of hashes (of the text, model
+    name and dimension) and the matching ``.vectors.npy`` matrix, holding only
+    the new rows. Shards are memory-mapped and indexed by key in-process, so a
+    call reads only the shards it has not seen yet and writes only what it
+    encoded. compact() merges the shards into one, optionally evicting the keys
+    of texts that are no longer embedded; it also runs on its own once there
+    are more than ``embedding_cache_max_shards`` shards.
+
+    Attributes:
+        model_name (str): SentenceTransformer model name.
+        dim (int): Embedding dimension.
+        batch_size (int): Number of texts encoded per call.
+        cache_path (str): Directory holding the cache files for this model and dimension.
+        dtype (str): Storage dtype of the cached vectors (float32 or float16).
+        max_shards (int): Number of shards above which they are merged.
+    """
+
+    def __init__(self, model_name=embedding_model, dim=embedding_size, batch_size=embedding_batch_size,
+                 cache_dir=embedding_cache_dir, dtype=embedding_cache_dtype, max_shards=embedding_cache_max_shards):
+        self.model_name = model_name
+        self.dim = dim
+        self.batch_size = batch_size
+        self.dtype = np.dtype(dtype)
+        self.max_shards = max_shards
+        safe_name = model_name.replace('/', '_')
+        self.cache_path = os.path.join(cache_dir, f'{safe_name}-{dim}-{self.dtype.name}')
+
+    @property
+    def model(self):
+        """Shared SentenceTransformer, loaded from the model registry on first use."""
+        return get_embedding_model(self.model_name, self.dim)
+
+    def key(self, text):
+        """
+        Returns the cache key of a text for this model and dimension.
+
+        Args:
+            text (str): Text to hash.
+
+        Returns:
+            str: Hex digest identifying the text's embedding.
+        """
+        return hashlib.sha1(f'{self.model_name}|{self.dim}|{text}'.encode('utf-8')).hexdigest()
+
+    def _shard_file(self, shard, kind):
+        return os.path.join(self.cache_path, f'{shard}.{kind}.npy')
+
+    def _cache_index(self):
+        """
+        Returns the in-process index of the cache, after reading the shards
+        written since the last call. Starts over if another process compacted
+        the cache, removing shards the index refers to.
+        """
+        # A shard is complete once its keys file exists, which is written last
+        shards = sorted(os.path.basename(name)[:-len('.keys.npy')]
+                        for name in glob.glob(os.path.join(self.cache_path, 'shard-*.keys.npy')))
+        index = _indices.get(self.cache_path)
+        if index is None or not set(index.shards) <= set(shards):
+            index = _indices[self.cache_path] = _CacheIndex()
+        for shard in shards:
+            if shard not in index.shards:
+                index.add(shard, np.load(self._shard_file(shard, 'keys')),
+                          np.load(self._shard_file(shard, 'vectors'), mmap_mode='r'))
+        return index
+
+    def _write_shard(self, keys, vectors):
+        """
+        Writes new cache rows as a shard, vectors first and keys last, each to a
+        temporary file renamed into place, so readers never see a partial shard.
+
+        Returns:
+            str: The shard name.
+        """
+        os.makedirs(self.cache_path, exist_ok=True)
+        shard = f'shard-{time.time_ns():020d}-{os.getpid()}'
+        for kind, array in (('vectors', vectors), ('keys', keys)):
+            tmp_file = os.path.join(self.cache_path, f'{shard}.{kind}.tmp.npy')
+            np.save(tmp_file, array)
+            os.replace(tmp_file, self._shard_file(shard, kind))
+        return shard
+
+    def _gather(self, index, keys):
+        """Copies the cached vectors of keys into one matrix, reading each shard once."""
+        vectors = np.empty((len(keys), self.dim), dtype=self.dtype)
+        by_shard = {}
+        for i, key in enumerate(keys):
+            shard, row = index.rows[key]
+            by_shard.setdefault(shard, ([], []))
+            by_shard[shard][0].append(i)
+            by_shard[shard][1].append(row)
+        for shard, (positions, rows) in by_shard.items():
+            vectors[positions] = index.shards[shard][rows]
+        return vectors
+
+    def encode_batched(self, texts):
+        """
+        Encodes texts without the cache, in batches of similar length to reduce padding.
+
+        Args:
+            texts (list of str): Texts to encode.
+
+        Returns:
+            np.ndarray: Float32 matrix of shape (len(texts), dim), in input order.
+        """
+        vectors = np.empty((len(texts), self.dim), dtype=np.float32)
+        order = sorted(range(len(texts)), key=lambda i: len(texts[i]), reverse=True)
+        for start in range(0, len(order), self.batch_size):
+            batch_ids = order[start:start + self.batch_size]
+            vectors[batch_ids] = self.model.encode(
+                [texts[i] for i in batch_ids],
+                batch_size=len(batch_ids),
+                convert_to_numpy=True,
+                show_progress_bar=False,
+            )
+        return vectors
+
+    def encode(self, texts):
+        """
+        Returns embeddings for texts, encoding only the ones missing from the cache
+        and appending them to it as a new shard.
+
+        Args:
+            texts (list of str): Texts to encode.
+
+        Returns:
+            np.ndarray: Matrix of shape (len(texts), dim) in the cache dtype, in input order.
+            When the cache is a single shard holding exactly these texts in the same
+            order, this is the memory-mapped shard itself.
+        """
+        keys = [self.key(text) for text in texts]
+        index = self._cache_index()
+
+        if len(index.shards) == 1 and len(index.rows) == len(keys):
+            shard = next(iter(index.shards))
+            if all(index.rows.get(key) == (shard, row) for row, key in enumerate(keys)):
+                print(f'[DEBUG] All {len(keys)} embeddings found in cache.')
+                return index.shards[shard]
+
+        missing = {}
+        for i, key in enumerate(keys):
+            if key not in index.rows and key not in missing:
+                missing[key] = i
+
+        if missing:
+            print(f'[DEBUG] Encoding {len(missing)} of {len(keys)} texts missing from the embedding cache...')
+            new_vectors = self.encode_batched([texts[i] for i in missing.values()]).astype(self.dtype)
+            shard = self._write_shard(np.array(list(missing), dtype='U40'), new_vectors)
+            index.add(shard, list(missing), new_vectors)
+            if len(index.shards) > self.max_shards:
+                vectors = self._gather(index, keys)
+                self.compact()
+                return vectors
+
+        return self._gather(index, keys)
+
+    def compact(self, texts=None):
+        """
+        Merges the cache shards into one, streaming the vectors into the new
+        shard so the cache is never held in memory. When texts are given, only
+        their embeddings are kept and every other key is evicted.
+
+        Args:
+            texts (iterable of str, optional): Texts whose embeddings to keep. Defaults to all.
+
+        Returns:
+            dict: Numbers of ``kept`` and ``evicted`` keys.
+        """
+        index = self._cache_index()
+        if texts is None:
+            keys = list(index.rows)
+        else:
+            keep = {self.key(text) for text in texts}
+            keys = [key for key in index.rows if key in keep]
+        report = {'kept': len(keys), 'evicted': len(index.rows) - len(keys)}
+        if len(index.shards) <= 1 and not report['evicted']:
+            return report
+
+        print(f"[DEBUG] Compacting {len(index.shards)} embedding cache shards: "
+              f"{report['kept']} keys kept, {report['evicted']} evicted")
+        os.makedirs(self.cache_path, exist_ok=True)
+        shard = f'shard-{time.time_ns():020d}-{os.getpid()}'
+        tmp_file = os.path.join(self.cache_path, f'{shard}.vectors.tmp.npy')
+        vectors = np.lib.format.open_memmap(tmp_file, mode='w+', dtype=self.dtype, shape=(len(keys), self.dim))
+        # One shard at a time, so only that shard's rows are read
+        by_shard = {}
+        for position, key in enumerate(keys):
+            old_shard, row = index.rows[key]
+            by_shard.setdefault(old_shard, ([], []))
+            by_shard[old_shard][0].append(position)
+            by_shard[old_shard][1].append(row)
+        for old_shard, (positions, rows) in by_shard.items():
+            vectors[positions] = index.shards[old_shard][rows]
+        vectors.flush()
+        del vectors
+        os.replace(tmp_file, self._shard_file(shard, 'vectors'))
+        tmp_file = os.path.join(self.cache_path, f'{shard}.keys.tmp.npy')
+        np.save(tmp_file, np.array(keys, dtype='U40'))
+        os.replace(tmp_file, self._shard_file(shard, 'keys'))
+
+        # Keys files go first, so readers stop listing a shard before its vectors disappear;
+        # processes that mapped the vectors keep reading them
+        for old_shard in index.shards:
+            for kind in ('keys', 'vectors'):
+                try:
+                    os.remove(self._shard_file(old_shard, kind))
+                except FileNotFoundError:
+                    pass
+        _indices.pop(self.cache_path, None)
+        return report
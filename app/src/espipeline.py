@@ -1,39 +1,84 @@
 # espipeline.py
 
-import os
-import pandas as pd 
-from elasticsearch import Elasticsearch 
-from tqdm import tqdm
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-from src.constants import model_name,index_name
-
-class ElSearchRAGPipeline:
+from itertools import chain
+
+from src.constants import text_index_alias, model_name
+from src.indexmanager import IndexManager
+from src.ingest import BulkIngestor, make_actions, delete_actions, failed_ids
+from src.ragpipeline import RAGPipeline
+from src.sync import sync_documents
+
+
+def parse_es_results(results):
+    """
+    Converts an Elasticsearch search response into a retrieval result.
+
+    Args:
+        results (dict): Response of a search, or one item of an msearch response.
+
+    Returns:
+        dict: The retrieved answers, their document ids (ids), scores and stored token ids
+        (answer_ids), time_taken, total_hits, relevance_score and topic.
+    """
+    if 'error' in results:
+        raise RuntimeError(f"Elasticsearch query failed: {results['error']}")
+
+    hits = results['hits']['hits']
+    result_docs = [hit['_source'] for hit in hits]
+    return {
+        'answers': [result['answer'] for result in result_docs],
+        'ids': [hit['_id'] for hit in hits],
+        'scores': [hit['_score'] for hit in hits],
+        'answer_ids': [result.get('answer_ids') for result in result_docs],
+        'time_taken': results['took'],
+        'total_hits': results['hits']['total']['value'],
+        'relevance_score': results['hits']['max_score'],
+        'topic': result_docs[0]['topic'] if result_docs else None,
+    }
+
+
+def text_query(query, num_results):
+    """
+    Builds the text search body for a query.
+
+    Args:
+        query (str): The search query string.
+        num_results (int): The number of top results to return.
+
+    Returns:
+        dict: Search body with size and query.
+    """
+    return {
+        "size": num_results,
+        "query": {
+            "bool": {
+                "must": {
+                    "multi_match": {
+                        "query": query,
+                        "fields": ["question^3", "answer", "topic"],
+                        "type": "best_fields",
+                    }
+                },
+            },
+        },
+    }
+
+
+class ElSearchRAGPipeline(RAGPipeline):
+    search_type = 'Text'
+
     def __init__(self): 
-        self.query = None
-        self.response = None
-        self.tokenizer = T5Tokenizer.from_pretrained(model_name)
-        self.model = T5ForConditionalGeneration.from_pretrained(model_name)
+        from elasticsearch import Elasticsearch
+
+        super().__init__()
         self.es = Elasticsearch("http://elasticsearch:9200") 
-        self.data_dict = None
+        self.ingest_report = None
 
-    def read_data(self):
-        """
-        Reads data from csv file and converts it into list of dictionaries
-        
-        :return: None
-        """
-        print('[DEBUG] Reading data...')
-        # Read data into dataframe 
-        data_file_path = os.path.join('data', 'data.csv')
-        df = pd.read_csv(data_file_path).dropna()
-
-        # Convert dataframe to list of dictionaries
-        self.data_dict = df.to_dict(orient="records")
-        
     def create_index(self):
         """
-        Creates an Elasticsearch index with the specified settings and mappings,
-        and adds data from the data_dict to the index.
+        Makes sure the text index alias points at an index with the current
+        mappings, building it when they changed, and applies the rows of the
+        data file that changed since the last sync.
 
         :return: None
         """
@@ -43,134 +88,75 @@ class ElSearchRAGPipeline:
                 "properties": {
                     "question": {"type": "text"},
                     "answer": {"type": "text"},
+                    # Stored for prompt building only, never searched
+                    "answer_ids": {"type": "integer", "index": False, "doc_values": False},
             }
         }
-        
-        # Create Index and delete if it already exists
-        self.es.indices.delete(index=index_name, ignore_unavailable=True)
-        self.es.indices.create(index=index_name, mappings=mappings)
 
-        # Add Data to Index using index()
-        print('\n\n[[DEBUG] Adding data to index...')
-        # Considering only the first 100 rows for now
-        for i in tqdm(range(len(self.data_dict))):
-            row = self.data_dict[i]
-            self.es.index(index=index_name, id=i, document=row) 
+        manager = IndexManager(self.es, text_index_alias, mappings, extra=(model_name,))
+        self.sync_report = None
+        self.index_version = manager.ensure_index(self.add_documents)
+        if self.sync_report is None:
+            # The index already existed: apply only what changed
+            self.sync_report = sync_documents(self.index_version, self.apply_changes(self.index_version))
 
-    def search(self, query, num_results=3):
+    def add_documents(self, index):
         """
-        Retrieves results from the index based on the query.
+        Adds all documents to a new index, streamed from the data file.
 
         Args:
-            data_dict (list of dict): List of dictionaries containing the data to be indexed.
-            query (str): The search query string.
-            num_results (int): The number of top results to return.
-
-        Returns:
-            list of str: List of results matching the search criteria, ranked by relevance.
+            index (str): Name of the concrete index to add documents to.
         """
-        # Retrieve Search Results
-        print('\n\n[[DEBUG] Retrieving Search Results...') 
-        results = self.es.search(
-            index=index_name,
-            size = num_results,
-            query={
-                    "bool": {
-                        "must": {
-                            "multi_match": {
-                                "query": query,
-                                "fields": ["question^3", "answer", "topic"],
-                                "type": "best_fields",
-                            }
-                        },
-                    },
-                },
-        )
-
-        time_taken = results['took']
-        relevance_score = results['hits']['max_score']
-        total_hits = results['hits']['total']['value']
-        topic = results['hits']['hits'][0]['_source']['topic']
-
-        print('\n\n[DEBUG] Retrieved results:', time_taken, relevance_score, total_hits)
-        result_docs = [hit['_source'] for hit in results['hits']['hits']] 
+        # Add Data to Index in bulk batches
+        print('\n\n[[DEBUG] Adding data to index...')
+        self.sync_report = sync_documents(index, self.apply_changes(index), rebuild=True)
 
-        response = [result['answer'] for result in result_docs]
- 
-        return response, time_taken, total_hits, relevance_score, topic
-    
-    def generate_prompt(self, query, response):
+    def apply_changes(self, index):
         """
-        Generates a prompt for the LLM based on the query and response.
+        Returns a function that applies document changes to index in bulk batches.
+        Only the upserted answers are tokenized, one chunk at a time as the
+        bulk requests consume them.
 
         Args:
-            query (str): The search query string.
-            response (str): The response from the retrieval model.
+            index (str): Name of the concrete index.
 
         Returns:
-            str: The prompt to be sent to the LLM.
+            callable: Takes the chunks of documents to upsert and the ids to delete, and
+            returns the ids of the documents that failed.
         """
-
-        prompt_template = """
-            You're a data science expert. 
-            Provide concise and complete answers to the questions based on the context given below.
-            QUESTION: {question}
-
-            CONTEXT: 
-            {response}
-            """.strip()
-
-        prompt = prompt_template.format(question=query, response=response)
-        return prompt
-    
-    def generate_response(self, prompt): 
+        def prepared(upsert_chunks):
+            for chunk in upsert_chunks:
+                # Pre-tokenize answers so prompts are built from stored token ids
+                self.add_answer_ids(chunk)
+                yield from chunk
+
+        def apply(upsert_chunks, deletes):
+            actions = chain(make_actions(prepared(upsert_chunks), id_field='id'), delete_actions(deletes))
+            self.ingest_report = BulkIngestor(self.es).ingest(index, actions)
+            return failed_ids(self.ingest_report)
+        return apply
+
+    def search_batch(self, queries, num_results, query_vectors=None):
         """
-        Generates a response using the LLM based on the given prompt.
+        Retrieves results for several queries in a single msearch request.
 
         Args:
-            prompt (str): The prompt to generate a response for.
+            queries (list of str): The search query strings.
+            num_results (int): The number of top results to return per query.
+            query_vectors (np.ndarray, optional): Not used by text search.
 
         Returns:
-            str: The generated response from the LLM.
-        """
-
-        print('[DEBUG] Generating LLM response...')
-        inputs = self.tokenizer(
-            prompt, 
-            return_tensors="pt", 
-            max_length=512, 
-            truncation=True, 
-            padding='max_length'
-        )
-
-        # Generate Response
-        outputs = self.model.generate(
-            **inputs,
-            max_new_tokens=1024,
-            min_length=100,
-            no_repeat_ngram_size=3,
-            do_sample=True, 
-            num_beams=4,        
-            early_stopping = True # Stop once all beams are finished 
-            # early_stopping = False # Stop once max_new_tokens is reached
-        )
-        
-        llm_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        return llm_response
-    
-    def get_response(self,query, num_results=3):
+            list of dict: One retrieval result per query, ranked by relevance, in input order.
         """
-        Retrieves and generates a response for a given query.
-
-        Args:
-            query (str): The search query string.
-            num_results (int, optional): The number of top results to return. Defaults to 5.
-
-        Returns:
-            str: The generated response from the LLM.
-        """ 
-        results, time_taken, total_hits, relevance_score, topic = self.search(query, num_results)
-        prompt = self.generate_prompt(query, results)
-        llm_response = self.generate_response(prompt)
-        return llm_response, time_taken, total_hits, relevance_score, topic
\ No newline at end of file
+        # Retrieve Search Results
+        print('\n\n[[DEBUG] Retrieving Search Results...') 
+        searches = []
+        for query in queries:
+            searches.append({"index": text_index_alias})
+            searches.append(text_query(query, num_results))
+        results = self.es.msearch(searches=searches)
+
+        retrievals = [parse_es_results(result) for result in results['responses']]
+        for retrieval in retrievals:
+            print('\n\n[DEBUG] Retrieved results:', retrieval['time_taken'], retrieval['relevance_score'], retrieval['total_hits'])
+        return retrievals
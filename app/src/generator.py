@@ -0,0 +1,441 @@
+# generator.py
+# Flan-T5 response generation shared by all RAG pipelines.
+
+import queue
+import threading
+import time
+from collections import OrderedDict
+
+from src.constants import (
+    model_name,
+    generation_batch_size,
+    max_input_length,
+    length_buckets,
+    decoding_profiles,
+    default_decoding_profile,
+    generator_backend,
+    encoder_cache_size,
+    context_token_budget,
+    pack_separator,
+    stream_token_timeout,
+)
+from src.models import check_backend, get_t5_tokenizer, get_t5_model
+from src.packer import ContextPacker
+from src.tracing import stage
+
+
+class Generator:
+    """
+    Generates LLM responses with the shared Flan-T5 model.
+
+    Prompts are never padded to a fixed length. Single prompts are fed as-is;
+    batches are grouped into length buckets and each batch is padded only to
+    its longest prompt. The share of encoder positions spent on padding is
+    tracked in ``stats``.
+
+    The model runs on the configured inference backend: eager PyTorch, dynamically
+    quantized int8 PyTorch or ONNX Runtime (see models.get_t5_model).
+
+    Prompts are assembled from token ids: the fixed parts of a template are
+    tokenized once, and retrieved passages can come pre-tokenized from the index.
+    Encoder outputs are kept in an LRU cache keyed by the prompt's token ids, so
+    the same question and context regenerated with another decoding profile, or
+    retried after a failure, skips the encoder pass. The encoder is bidirectional,
+    so the states of the shared instruction prefix depend on the rest of the
+    prompt and cannot be reused on their own; only whole prompts are cached.
+
+    Attributes:
+        model_name (str): Hugging Face model name.
+        batch_size (int): Maximum number of prompts per generate() call.
+        max_input_length (int): Token budget of a prompt fed to the encoder.
+        length_buckets (tuple): Upper token-length bounds of the buckets prompts are grouped into.
+        default_profile (str): Decoding profile used when a request does not name one.
+        backend (str): Inference backend of the model: 'torch', 'int8' or 'onnx'.
+        encoder_cache_size (int): Maximum number of prompts whose encoder outputs are cached.
+        context_budget (int): Maximum context tokens per prompt; 0 uses all room left by the template and question.
+        packer (ContextPacker): Selects and dedupes the passages that fit in the context.
+        stats (dict): Running totals of prompt tokens and padding tokens fed to the encoder,
+            and of encoder cache hits and misses.
+    """
+
+    def __init__(self, model_name=model_name, batch_size=generation_batch_size,
+                 max_input_length=max_input_length, length_buckets=length_buckets,
+                 default_profile=default_decoding_profile, backend=generator_backend,
+                 encoder_cache_size=encoder_cache_size, context_budget=context_token_budget):
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.max_input_length = max_input_length
+        self.length_buckets = tuple(sorted(length_buckets))
+        self.default_profile = default_profile
+        check_backend(backend)
+        self.backend = backend
+        self.encoder_cache_size = encoder_cache_size
+        self.context_budget = context_budget
+        self.packer = ContextPacker()
+        self.stats = {'prompt_tokens': 0, 'padding_tokens': 0, 'encoder_hits': 0, 'encoder_misses': 0}
+        self._encoder_cache = OrderedDict()
+        self._template_ids = {}
+        self._separator_ids = None
+        self._lock = threading.Lock()
+
+    @property
+    def tokenizer(self):
+        """Shared T5 tokenizer, loaded from the model registry on first use."""
+        return get_t5_tokenizer(self.model_name)
+
+    @property
+    def model(self):
+        """Shared T5 model for the backend, loaded from the model registry on first use."""
+        return get_t5_model(self.model_name, self.backend)
+
+    def profile_kwargs(self, profile=None):
+        """
+        Returns the model.generate() arguments of a decoding profile.
+
+        Args:
+            profile (str, optional): Name of the profile. Defaults to default_profile.
+
+        Returns:
+            tuple: The resolved profile name and its decoding arguments.
+        """
+        profile = profile or self.default_profile
+        if profile not in decoding_profiles:
+            raise ValueError(f"Unknown decoding profile '{profile}', expected one of {list(decoding_profiles)}")
+        return profile, decoding_profiles[profile]
+
+    def count_tokens(self, text):
+        """
+        Returns the number of tokens of text, without special tokens.
+
+        Args:
+            text (str): Text to tokenize.
+
+        Returns:
+            int: Number of tokens.
+        """
+        return len(self.tokenizer(text, add_special_tokens=False)['input_ids'])
+
+    def tokenize_passages(self, passages):
+        """
+        Tokenizes passages in one call, for storing their token ids at index time.
+
+        Args:
+            passages (list of str): Passages to tokenize.
+
+        Returns:
+            list of list of int: Token ids of each passage, without special tokens.
+        """
+        return self.tokenizer(list(passages), add_special_tokens=False)['input_ids']
+
+    def _template_parts(self, template):
+        """
+        Returns the token ids of the fixed text before {question}, between
+        {question} and {response}, and after {response}, tokenized once per template.
+        """
+        parts = self._template_ids.get(template)
+        if parts is None:
+            before, rest = template.split('{question}')
+            between, after = rest.split('{response}')
+            parts = tuple(self.tokenize_passages([before, between, after]))
+            self._template_ids[template] = parts
+        return parts
+
+    def separator_ids(self):
+        """
+        Returns the token ids put between packed passages, tokenized once.
+
+        Returns:
+            list of int: Token ids of pack_separator.
+        """
+        if self._separator_ids is None:
+            self._separator_ids = self.tokenize_passages([pack_separator])[0]
+        return self._separator_ids
+
+    def build_prompt_ids(self, template, question, passages, passage_ids=None, scores=None):
+        """
+        Builds the token ids of a prompt from the template, the question and the
+        retrieved passages the context packer fits in the token budget, separated
+        by pack_separator. The budget is the room left by the template and the
+        question, capped at context_budget, so the question and the instructions
+        are never truncated. Passages with pre-tokenized ids are not tokenized again.
+
+        Args:
+            template (str): Prompt template with {question} and {response} fields, in that order.
+            question (str): The search query string.
+            passages (list of str): Retrieved passages, most relevant first.
+            passage_ids (list, optional): Token ids of each passage (None entries are tokenized).
+            scores (list of float, optional): Retrieval score of each passage, for ranking.
+
+        Returns:
+            list of int: The prompt token ids, ending with the end-of-sequence token.
+        """
+        before, between, after = self._template_parts(template)
+        question_ids = self.tokenize_passages([question])[0]
+        fixed = len(before) + len(question_ids) + len(between) + len(after)
+        # Leave room for the end-of-sequence token
+        budget = self.max_input_length - 1 - fixed
+        if self.context_budget:
+            budget = min(budget, self.context_budget)
+
+        passage_ids = passage_ids or [None] * len(passages)
+        missing = [i for i, ids in enumerate(passage_ids) if ids is None]
+        if missing:
+            tokenized = self.tokenize_passages([passages[i] for i in missing])
+            passage_ids = list(passage_ids)
+            for i, ids in zip(missing, tokenized):
+                passage_ids[i] = ids
+
+        context, _ = self.packer.pack(passage_ids, budget, scores, separator=self.separator_ids())
+        prompt_ids = before + question_ids + between + context + after
+        return prompt_ids[:self.max_input_length - 1] + [self.tokenizer.eos_token_id]
+
+    def build_prompt(self, template, question, passages, passage_ids=None, scores=None):
+        """
+        Returns the text of the prompt built by build_prompt_ids(), as the model sees it.
+
+        Args:
+            template (str): Prompt template with {question} and {response} fields.
+            question (str): The search query string.
+            passages (list of str): Retrieved passages, most relevant first.
+            passage_ids (list, optional): Token ids of each passage.
+            scores (list of float, optional): Retrieval score of each passage, for ranking.
+
+        Returns:
+            str: The prompt to be sent to the LLM.
+        """
+        return self.tokenizer.decode(self.build_prompt_ids(template, question, passages, passage_ids, scores),
+                                     skip_special_tokens=True)
+
+    def padding_waste(self):
+        """
+        Returns the share of encoder positions spent on padding so far.
+
+        Returns:
+            float: Padding tokens divided by all tokens fed to the encoder.
+        """
+        total = self.stats['prompt_tokens'] + self.stats['padding_tokens']
+        return self.stats['padding_tokens'] / total if total else 0.0
+
+    def _bucket(self, length):
+        for bound in self.length_buckets:
+            if length <= bound:
+                return bound
+        return self.max_input_length
+
+    def batches(self, lengths):
+        """
+        Groups prompt positions into batches of similar length. Prompts are
+        bucketed by length, sorted within each bucket and cut into batches of
+        at most batch_size.
+
+        Args:
+            lengths (list of int): Token length of each prompt.
+
+        Returns:
+            list of list of int: Prompt positions of each batch.
+        """
+        buckets = {}
+        for i in sorted(range(len(lengths)), key=lambda i: lengths[i]):
+            buckets.setdefault(self._bucket(lengths[i]), []).append(i)
+
+        batches = []
+        for bucket in sorted(buckets):
+            ids = buckets[bucket]
+            batches.extend(ids[start:start + self.batch_size] for start in range(0, len(ids), self.batch_size))
+        return batches
+
+    def encoder_hit_rate(self):
+        """
+        Returns the share of prompts whose encoder outputs came from the cache.
+
+        Returns:
+            float: Encoder cache hits divided by all encoded prompts.
+        """
+        total = self.stats['encoder_hits'] + self.stats['encoder_misses']
+        return self.stats['encoder_hits'] / total if total else 0.0
+
+    def encode(self, batch_input_ids):
+        """
+        Pads a batch of prompts and runs the encoder over it, unless the encoder
+        outputs of every prompt are cached. generate() is then given the encoder
+        outputs, so the encoder forward and the decode loop are timed apart.
+
+        Args:
+            batch_input_ids (list of list of int): Token ids of each prompt.
+
+        Returns:
+            tuple: The encoder outputs (BaseModelOutput) and the padded inputs.
+        """
+        import torch
+        from transformers.modeling_outputs import BaseModelOutput
+
+        with stage('tokenize'):
+            inputs = self.tokenizer.pad([{'input_ids': ids} for ids in batch_input_ids], return_tensors='pt')
+        keys = [tuple(ids) for ids in batch_input_ids]
+
+        with self._lock:
+            cached = [self._encoder_cache.get(key) for key in keys]
+            if all(states is not None for states in cached):
+                for key in keys:
+                    self._encoder_cache.move_to_end(key)
+                self.stats['encoder_hits'] += len(keys)
+            else:
+                cached = None
+                self.stats['encoder_misses'] += len(keys)
+
+        if cached is not None:
+            # Right-pad the cached states to the batch length; padded positions are masked
+            hidden = cached[0].new_zeros((len(keys), inputs['input_ids'].shape[1], cached[0].shape[-1]))
+            for row, states in enumerate(cached):
+                hidden[row, :states.shape[0]] = states
+            return BaseModelOutput(last_hidden_state=hidden), inputs
+
+        with stage('encode'), torch.no_grad():
+            outputs = self.model.get_encoder()(input_ids=inputs['input_ids'], attention_mask=inputs['attention_mask'])
+
+        if self.encoder_cache_size:
+            with self._lock:
+                for row, (key, ids) in enumerate(zip(keys, batch_input_ids)):
+                    self._encoder_cache[key] = outputs.last_hidden_state[row, :len(ids)].clone()
+                    self._encoder_cache.move_to_end(key)
+                while len(self._encoder_cache) > self.encoder_cache_size:
+                    self._encoder_cache.popitem(last=False)
+        return outputs, inputs
+
+    def _prompt_ids(self, prompts):
+        """
+        Returns the token ids of prompts given as text or as token ids, truncated to max_input_length.
+        """
+        texts = [i for i, prompt in enumerate(prompts) if isinstance(prompt, str)]
+        input_ids = list(prompts)
+        if texts:
+            with stage('tokenize'):
+                tokenized = self.tokenizer([prompts[i] for i in texts], max_length=self.max_input_length,
+                                           truncation=True)['input_ids']
+            for i, ids in zip(texts, tokenized):
+                input_ids[i] = ids
+        return [list(ids[:self.max_input_length]) for ids in input_ids]
+
+    def generate(self, prompt, profile=None):
+        """
+        Generates a response using the LLM based on the given prompt.
+
+        Args:
+            prompt (str or list of int): The prompt, as text or token ids, to generate a response for.
+            profile (str, optional): Decoding profile. Defaults to default_profile.
+
+        Returns:
+            dict: The generated ``response``, the ``decoding_profile`` used, the number
+            of generated tokens (``decode_tokens``), ``decode_time`` in seconds and the
+            exact number of tokens fed to the encoder (``prompt_tokens``).
+        """
+        return self.generate_batch([prompt], profile)[0]
+
+    def generate_batch(self, prompts, profile=None):
+        """
+        Generates responses for several prompts in length-bucketed, dynamically padded batches.
+
+        Args:
+            prompts (list): The prompts to generate responses for, as text or token ids.
+            profile (str, optional): Decoding profile. Defaults to default_profile.
+
+        Returns:
+            list of dict: One generation per prompt, in the same order as prompts. The
+            decode time of a prompt is the time of the batch it was generated in.
+        """
+        profile, generate_kwargs = self.profile_kwargs(profile)
+        print(f'[DEBUG] Generating LLM responses for {len(prompts)} prompts with the {profile} profile...')
+        input_ids = self._prompt_ids(prompts)
+        lengths = [len(ids) for ids in input_ids]
+
+        generations = [None] * len(prompts)
+        for batch_ids in self.batches(lengths):
+            # Generate Response
+            start_time = time.time()
+            encoder_outputs, inputs = self.encode([input_ids[i] for i in batch_ids])
+            prompt_tokens = sum(lengths[i] for i in batch_ids)
+            self.stats['prompt_tokens'] += prompt_tokens
+            self.stats['padding_tokens'] += inputs['input_ids'].numel() - prompt_tokens
+
+            with stage('decode'):
+                outputs = self.model.generate(
+                    encoder_outputs=encoder_outputs,
+                    attention_mask=inputs['attention_mask'],
+                    **generate_kwargs,
+                )
+            decode_time = time.time() - start_time
+
+            with stage('detokenize'):
+                # Padding (also the decoder start token) is not a generated token
+                decode_tokens = (outputs != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+                texts = self.tokenizer.batch_decode(outputs, skip_special_tokens=True)
+            for i, text, num_tokens in zip(batch_ids, texts, decode_tokens):
+                generations[i] = {
+                    'response': text,
+                    'decoding_profile': profile,
+                    'decode_tokens': num_tokens,
+                    'decode_time': decode_time,
+                    'prompt_tokens': lengths[i],
+                }
+
+        print(f'[DEBUG] Padding waste so far: {self.padding_waste():.1%}, '
+              f'encoder cache hit rate: {self.encoder_hit_rate():.1%}')
+        return generations
+
+    def stream(self, prompt, profile=None):
+        """
+        Generates a response and yields it in text chunks as tokens are decoded.
+
+        Streaming uses transformers' TextIteratorStreamer, with generate() running
+        in a background thread. Streamers do not support beam search, so profiles
+        with num_beams > 1 (balanced and quality) are generated in full and yielded
+        as a single chunk; the UI preselects the greedy fast profile for this reason.
+
+        Args:
+            prompt (str or list of int): The prompt, as text or token ids, to generate a response for.
+            profile (str, optional): Decoding profile. Defaults to default_profile.
+
+        Yields:
+            str: The next piece of the generated response.
+
+        Raises:
+            TimeoutError: If no token is generated within stream_token_timeout seconds.
+        """
+        profile, generate_kwargs = self.profile_kwargs(profile)
+        if generate_kwargs.get('num_beams', 1) > 1:
+            print(f'[DEBUG] The {profile} profile uses beam search, which cannot stream; answering in one chunk')
+            yield self.generate(prompt, profile)['response']
+            return
+
+        from transformers import TextIteratorStreamer
+
+        print(f'[DEBUG] Streaming LLM response with the {profile} profile...')
+        encoder_outputs, inputs = self.encode(self._prompt_ids([prompt]))
+        self.stats['prompt_tokens'] += inputs['input_ids'].numel()
+
+        streamer = TextIteratorStreamer(self.tokenizer, skip_prompt=True, skip_special_tokens=True,
+                                        timeout=stream_token_timeout)
+        errors = []
+
+        def run():
+            try:
+                self.model.generate(encoder_outputs=encoder_outputs, attention_mask=inputs['attention_mask'],
+                                    **generate_kwargs, streamer=streamer)
+            except Exception as e:
+                # End the stream so the caller stops waiting, and hand it the error
+                errors.append(e)
+                streamer.end()
+
+        thread = threading.Thread(target=run, daemon=True)
+        # The decode stage covers the decode loop and the streamer's incremental detokenization
+        with stage('decode'):
+            thread.start()
+            try:
+                for text in streamer:
+                    if text:
+                        yield text
+            except queue.Empty:
+                raise TimeoutError(f'No token generated in {stream_token_timeout:g}s') from None
+            thread.join()
+        if errors:
+            raise errors[0]
@@ -0,0 +1,235 @@
+# hybridpipeline.py
+# Hybrid retrieval: text and kNN search fused into one ranking.
+
+import time
+
+from src.constants import vector_index_alias, vector_backend, hybrid_fusion, hybrid_window, hybrid_text_weight, rrf_k
+from src.espipeline import text_query
+from src.vectorpipeline import VecSearchRAGPipeline, knn_query
+
+
+def rrf_fuse(rankings, k=rrf_k):
+    """
+    Fuses rankings with reciprocal rank fusion: a document scores the sum of
+    1 / (k + rank) over the rankings it appears in.
+
+    Args:
+        rankings (list of list): Rankings of (doc_id, score) pairs, best first.
+        k (int): Rank constant. Larger values flatten the contribution of the top ranks.
+
+    Returns:
+        list of tuple: (doc_id, fused score) pairs, best first.
+    """
+    fused = {}
+    for ranking in rankings:
+        for rank, (doc_id, _) in enumerate(ranking, start=1):
+            fused[doc_id] = fused.get(doc_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+def weighted_fuse(rankings, weights):
+    """
+    Fuses rankings by a weighted sum of min-max normalized scores. A document
+    missing from a ranking gets 0 for it.
+
+    Args:
+        rankings (list of list): Rankings of (doc_id, score) pairs, best first.
+        weights (list of float): Weight of each ranking.
+
+    Returns:
+        list of tuple: (doc_id, fused score) pairs, best first.
+    """
+    fused = {}
+    for ranking, weight in zip(rankings, weights):
+        if not ranking:
+            continue
+        scores = [score for _, score in ranking]
+        low, high = min(scores), max(scores)
+        for doc_id, score in ranking:
+            normalized = (score - low) / (high - low) if high > low else 1.0
+            fused[doc_id] = fused.get(doc_id, 0.0) + weight * normalized
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+
+class HybridSearchRAGPipeline(VecSearchRAGPipeline):
+    """
+    Retrieves with both text (multi_match) and kNN search and fuses the two
+    rankings, by reciprocal rank fusion or by weighted normalized scores.
+
+    Both searches run against the vector index, which holds the text fields as
+    well, and go out together in one msearch request. With the 'local' backend,
+    or when Elasticsearch cannot be reached, the pipeline searches in-process
+    instead: MiniSearch text scores fused with an exact VectorIndex, both over
+    the rows of the shared DocStore.
+
+    Each retrieval result also holds ``timings`` with the time spent embedding
+    the queries, searching and fusing, in ms.
+
+    Attributes:
+        fusion (str): 'rrf' or 'weighted'.
+        window (int): Candidates retrieved per method before fusion.
+        text_weight (float): Weight of the text scores in weighted fusion; kNN gets the rest.
+        local (MiniSearchRAGPipeline): In-process text index, set once the fallback is used.
+        local_vectors (VectorIndex): Vector index over the same DocStore rows as the local text index.
+    """
+
+    search_type = 'Hybrid'
+
+    def __init__(self, fusion=hybrid_fusion, window=hybrid_window, text_weight=hybrid_text_weight,
+                 backend=vector_backend):
+        super().__init__(backend)
+        if fusion not in ('rrf', 'weighted'):
+            raise ValueError(f"Unknown fusion method '{fusion}', expected 'rrf' or 'weighted'")
+        self.fusion = fusion
+        self.window = window
+        self.text_weight = text_weight
+        self.local = None
+        self.local_vectors = None
+
+    def create_index(self):
+        """
+        Makes sure the vector index is up to date. Sets up the in-process
+        indices instead with the local backend or when Elasticsearch cannot be reached.
+
+        :return: None
+        """
+        if self.backend == 'local':
+            self.create_local_index()
+            return
+        from elasticsearch import ConnectionError as ESConnectionError
+
+        try:
+            super().create_index()
+        except ESConnectionError as e:
+            print(f'[DEBUG] Elasticsearch unavailable ({e}), using the in-process hybrid index')
+            self.create_local_index()
+
+    def create_local_index(self):
+        """
+        Loads (or fits) the MiniSearch index and searches the embedding matrix
+        of its DocStore in place, adding the embeddings to the store if it has none.
+
+        :return: None
+        """
+        from src.docstore import open_docstore
+        from src.mspipeline import MiniSearchRAGPipeline
+        from src.vectorindex import VectorIndex
+
+        self.local = MiniSearchRAGPipeline()
+        self.local.create_index()
+        self.index_version = f'local-{self.local.index_version}'
+        self.sync_report = self.local.sync_report
+        self.store, _ = open_docstore(self.add_answer_ids, with_embeddings=True)
+        self.local_vectors = VectorIndex().fit(self.store.embeddings, self.store, normalized=True)
+
+    def fuse(self, text_ranking, knn_ranking):
+        """
+        Fuses a text and a kNN ranking with the configured method.
+
+        Args:
+            text_ranking (list): (doc_id, score) pairs from text search, best first.
+            knn_ranking (list): (doc_id, score) pairs from kNN search, best first.
+
+        Returns:
+            list of tuple: (doc_id, fused score) pairs, best first.
+        """
+        if self.fusion == 'rrf':
+            return rrf_fuse([text_ranking, knn_ranking])
+        return weighted_fuse([text_ranking, knn_ranking], [self.text_weight, 1 - self.text_weight])
+
+    def _es_rankings(self, queries, query_vectors, window):
+        searches = []
+        for query, query_vector in zip(queries, query_vectors):
+            searches.append({"index": vector_index_alias})
+            searches.append({**text_query(query, window), "_source": ["answer", "answer_ids", "topic"]})
+            searches.append({"index": vector_index_alias})
+            searches.append({**knn_query(query_vector, window), "_source": ["answer", "answer_ids", "topic"]})
+        responses = self.es.msearch(searches=searches)['responses']
+
+        sources = {}
+        rankings = []
+        for response in responses:
+            if 'error' in response:
+                raise RuntimeError(f"Elasticsearch query failed: {response['error']}")
+            ranking = []
+            for hit in response['hits']['hits']:
+                # The document id is the hit's _id; it is not stored in _source
+                sources[hit['_id']] = {**hit['_source'], 'id': hit['_id']}
+                ranking.append((hit['_id'], hit['_score']))
+            rankings.append(ranking)
+        # Text and kNN rankings alternate, one pair per query
+        return list(zip(rankings[::2], rankings[1::2])), sources
+
+    def _local_rankings(self, queries, query_vectors, window):
+        if self.local is None:
+            self.create_local_index()
+
+        text_results = self.local.index.score_batch(queries, num_results=window)
+        knn_results = self.local_vectors.search_batch(query_vectors, num_results=window)
+
+        pairs = []
+        for (text_ids, text_scores), (knn_ids, knn_scores) in zip(text_results, knn_results):
+            pairs.append((
+                [(int(i), float(score)) for i, score in zip(text_ids, text_scores)],
+                [(int(i), float(score)) for i, score in zip(knn_ids, knn_scores)],
+            ))
+        # Store rows are read as documents only for the fused top results
+        return pairs, self.store
+
+    def search_batch(self, queries, num_results, query_vectors=None):
+        """
+        Retrieves results for several queries. Text and kNN searches for all
+        queries go out in one msearch request and are fused per query.
+
+        Args:
+            queries (list of str): The search query strings.
+            num_results (int): The number of top results to return per query.
+            query_vectors (np.ndarray, optional): Query embeddings, if already computed.
+
+        Returns:
+            list of dict: One retrieval result per query, ranked by fused score, in input order.
+            Each also holds ``timings`` (embed_ms, search_ms, fuse_ms).
+        """
+        print('\n\n[[DEBUG] Retrieving Hybrid Search Results...')
+        window = max(num_results, self.window)
+
+        start_time = time.time()
+        if query_vectors is None:
+            query_vectors = self.embed_queries(queries)
+        embed_ms = (time.time() - start_time) * 1000
+
+        start_time = time.time()
+        if self.local is None:
+            from elasticsearch import ConnectionError as ESConnectionError
+
+            try:
+                pairs, sources = self._es_rankings(queries, query_vectors, window)
+            except ESConnectionError as e:
+                print(f'[DEBUG] Elasticsearch unavailable ({e}), falling back to the in-process hybrid index')
+                pairs, sources = self._local_rankings(queries, query_vectors, window)
+        else:
+            pairs, sources = self._local_rankings(queries, query_vectors, window)
+        search_ms = (time.time() - start_time) * 1000
+
+        start_time = time.time()
+        fused = [self.fuse(text_ranking, knn_ranking) for text_ranking, knn_ranking in pairs]
+        fuse_ms = (time.time() - start_time) * 1000
+
+        timings = {'embed_ms': embed_ms, 'search_ms': search_ms, 'fuse_ms': fuse_ms}
+        retrievals = []
+        for ranking in fused:
+            top = ranking[:num_results]
+            docs = [sources[doc_id] for doc_id, _ in top]
+            retrievals.append({
+                'answers': [doc['answer'] for doc in docs],
+                'ids': [doc['id'] for doc in docs],
+                'scores': [score for _, score in top],
+                'answer_ids': [doc.get('answer_ids') for doc in docs],
+                'time_taken': int(search_ms + fuse_ms),
+                'total_hits': len(ranking),
+                'relevance_score': top[0][1] if top else None,
+                'topic': docs[0]['topic'] if docs else None,
+                'timings': timings,
+            })
+        print(f'[DEBUG] Hybrid timings: embed {embed_ms:.1f} ms, search {search_ms:.1f} ms, fuse {fuse_ms:.1f} ms')
+        return retrievals
@@ -0,0 +1,152 @@
+# indexmanager.py
+# Builds schema-versioned Elasticsearch indices and serves them behind an alias.
+
+import hashlib
+import json
+import time
+
+from src.constants import index_build_timeout
+
+
+def schema_hash(*parts):
+    """
+    Computes a short hash of the parts that define an index's layout.
+
+    Args:
+        *parts: JSON-serializable values that change the result (mappings, model names...).
+
+    Returns:
+        str: First 12 hex characters of the SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+    for part in parts:
+        digest.update(json.dumps(part, sort_keys=True, default=str).encode('utf-8'))
+    return digest.hexdigest()[:12]
+
+
+class IndexManager:
+    """
+    Manages the lifecycle of a versioned Elasticsearch index behind an alias.
+
+    The concrete index is named ``{alias}-{version}`` where version is a hash of
+    the mappings, settings and any extra parts (e.g. the embedding model), so a
+    new index is only built when the schema changes. Data changes are applied
+    to the current index incrementally (see src.sync). Queries always go through
+    the alias, which is only moved to a new index once that index is fully
+    built, so readers never see a half-built index.
+
+    Attributes:
+        es (Elasticsearch): Elasticsearch client.
+        alias (str): Alias that queries are sent to.
+        mappings (dict): Index mappings.
+        settings (dict): Index settings.
+        version (str): Version hash of the mappings, settings and extra parts.
+    """
+
+    def __init__(self, es, alias, mappings, settings=None, extra=()):
+        self.es = es
+        self.alias = alias
+        self.mappings = mappings
+        self.settings = settings or {}
+        self.version = schema_hash(mappings, self.settings, *extra)
+
+    @property
+    def target_index(self):
+        """Name of the concrete index for the current version."""
+        return f'{self.alias}-{self.version}'
+
+    def current_index(self):
+        """
+        Returns the concrete index the alias currently points at.
+
+        Returns:
+            str or None: Index name, or None if the alias does not exist.
+        """
+        if not self.es.indices.exists_alias(name=self.alias):
+            return None
+        indices = list(self.es.indices.get_alias(name=self.alias).keys())
+        return indices[0] if indices else None
+
+    def _is_complete(self, index):
+        mapping = self.es.indices.get_mapping(index=index)[index]['mappings']
+        return mapping.get('_meta', {}).get('complete', False)
+
+    def _created_at(self, index):
+        settings = self.es.indices.get_settings(index=index)[index]['settings']['index']
+        return int(settings['creation_date']) / 1000
+
+    def _create(self, index):
+        """
+        Creates the index marked as incomplete. Returns False if another process
+        created it first.
+        """
+        from elasticsearch import BadRequestError
+
+        mappings = dict(self.mappings)
+        mappings['_meta'] = {'version': self.version, 'complete': False}
+        try:
+            self.es.indices.create(index=index, settings=self.settings, mappings=mappings)
+        except BadRequestError as e:
+            if e.error == 'resource_already_exists_exception':
+                return False
+            raise
+        return True
+
+    def _wait_for_build(self, index):
+        """
+        Waits for another process to finish building index. Rebuilds it if that
+        build looks abandoned.
+        """
+        print(f'[DEBUG] Waiting for index {index} to be built by another process...')
+        while not self._is_complete(index):
+            if time.time() - self._created_at(index) > index_build_timeout:
+                print(f'[DEBUG] Build of {index} timed out, rebuilding...')
+                self.es.indices.delete(index=index, ignore_unavailable=True)
+                return False
+            time.sleep(1)
+        return True
+
+    def _swap_alias(self, index):
+        """
+        Atomically points the alias at index and removes older versions.
+        """
+        previous = self.current_index()
+        actions = [{'add': {'index': index, 'alias': self.alias}}]
+        if previous and previous != index:
+            actions.insert(0, {'remove': {'index': previous, 'alias': self.alias}})
+        self.es.indices.update_aliases(actions=actions)
+        print(f'[DEBUG] Alias {self.alias} now points to {index}')
+
+        # Keep the previous version around for in-flight queries, drop the rest
+        for old in self.es.indices.get(index=f'{self.alias}-*'):
+            if old not in (index, previous):
+                self.es.indices.delete(index=old, ignore_unavailable=True)
+
+    def ensure_index(self, build_fn):
+        """
+        Makes sure the alias points at a complete index for the current version,
+        building it with build_fn only if no such index exists yet.
+
+        Args:
+            build_fn (callable): Function that takes an index name and adds all documents to it.
+
+        Returns:
+            str: Name of the concrete index the alias points at.
+        """
+        index = self.target_index
+        if self.current_index() == index:
+            print(f'[DEBUG] Index {index} is up to date, skipping build.')
+            return index
+
+        while True:
+            if self._create(index):
+                print(f'[DEBUG] Building index {index}...')
+                build_fn(index)
+                self.es.indices.refresh(index=index)
+                self.es.indices.put_mapping(index=index, meta={'version': self.version, 'complete': True})
+                break
+            if self._wait_for_build(index):
+                break
+
+        self._swap_alias(index)
+        return index
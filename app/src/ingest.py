@@ -0,0 +1,164 @@
+# ingest.py
+# Batched, parallel bulk ingestion into Elasticsearch.
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from src.constants import bulk_chunk_size, bulk_thread_count, bulk_max_retries
+
+
+def make_actions(docs, id_field=None):
+    """
+    Converts documents into bulk index actions.
+
+    Args:
+        docs (iterable of dict): Documents to index.
+        id_field (str, optional): Field to use as the document id. Defaults to the position of the document.
+
+    Yields:
+        dict: A bulk action with ``_id`` and ``_source``.
+    """
+    for i, doc in enumerate(docs):
+        doc_id = doc[id_field] if id_field else i
+        yield {'_id': doc_id, '_source': doc}
+
+
+def delete_actions(doc_ids):
+    """
+    Converts document ids into bulk delete actions.
+
+    Args:
+        doc_ids (iterable of str): Ids of the documents to delete.
+
+    Yields:
+        dict: A bulk delete action.
+    """
+    for doc_id in doc_ids:
+        yield {'_op_type': 'delete', '_id': doc_id}
+
+
+def failed_ids(report):
+    """
+    Returns the ids of the documents an ingest report lists as failed.
+
+    Args:
+        report (dict): Report returned by BulkIngestor.ingest().
+
+    Returns:
+        set of str: Ids of the documents that were not indexed or deleted.
+    """
+    return {str(info['_id']) for batch in report['batches'] for item in batch['errors']
+            for info in item.values() if '_id' in info}
+
+
+def _batches(actions, size):
+    batch = []
+    for action in actions:
+        batch.append(action)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+class BulkIngestor:
+    """
+    Sends documents to Elasticsearch in batches using ``helpers.streaming_bulk``,
+    with several batches in flight at once.
+
+    Refresh is turned off on the target index for the duration of the load and
+    restored afterwards. Batches rejected with 429 are retried with exponential
+    backoff, and failures are reported per batch instead of aborting the load.
+
+    Attributes:
+        es (Elasticsearch): Elasticsearch client (or any client with the same transport interface).
+        chunk_size (int): Number of documents per bulk request.
+        thread_count (int): Number of bulk requests sent concurrently.
+        max_retries (int): Number of retries for documents rejected with 429.
+        initial_backoff (float): Seconds to wait before the first retry, doubled on each retry.
+    """
+
+    def __init__(self, es, chunk_size=bulk_chunk_size, thread_count=bulk_thread_count,
+                 max_retries=bulk_max_retries, initial_backoff=2):
+        self.es = es
+        self.chunk_size = chunk_size
+        self.thread_count = max(1, thread_count)
+        self.max_retries = max_retries
+        self.initial_backoff = initial_backoff
+
+    def _send_batch(self, index, batch_no, batch):
+        """
+        Sends one batch and collects its per-document errors.
+
+        Returns:
+            dict: Batch number, indexed and failed counts and the errors.
+        """
+        from elasticsearch.helpers import streaming_bulk
+
+        indexed, errors = 0, []
+        for ok, item in streaming_bulk(
+            self.es,
+            batch,
+            index=index,
+            chunk_size=len(batch),
+            max_retries=self.max_retries,
+            initial_backoff=self.initial_backoff,
+            raise_on_error=False,
+            raise_on_exception=False,
+        ):
+            # A document that is already gone needs no delete
+            if ok or item.get('delete', {}).get('status') == 404:
+                indexed += 1
+            else:
+                errors.append(item)
+
+        if errors:
+            print(f'[DEBUG] Batch {batch_no}: {len(errors)} of {len(batch)} documents failed, first error: {errors[0]}')
+        return {'batch': batch_no, 'indexed': indexed, 'failed': len(errors), 'errors': errors}
+
+    def _set_refresh_interval(self, index, value):
+        self.es.indices.put_settings(index=index, settings={'index': {'refresh_interval': value}})
+
+    def ingest(self, index, actions):
+        """
+        Bulk indexes the actions into index.
+
+        Args:
+            index (str): Name of the index to load.
+            actions (iterable of dict): Bulk actions, e.g. from make_actions(). Consumed lazily.
+
+        Returns:
+            dict: Totals (indexed, failed, seconds) and a per-batch report.
+        """
+        start_time = time.time()
+        batch_reports = []
+
+        settings = self.es.indices.get_settings(index=index)[index]['settings']['index']
+        refresh_interval = settings.get('refresh_interval')
+        self._set_refresh_interval(index, '-1')
+        try:
+            with ThreadPoolExecutor(max_workers=self.thread_count) as executor:
+                pending = set()
+                for batch_no, batch in enumerate(_batches(actions, self.chunk_size)):
+                    # Keep a bounded number of batches in memory
+                    if len(pending) >= self.thread_count * 2:
+                        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                        batch_reports.extend(future.result() for future in done)
+                    pending.add(executor.submit(self._send_batch, index, batch_no, batch))
+                batch_reports.extend(future.result() for future in pending)
+        finally:
+            # None resets the setting to the index default
+            self._set_refresh_interval(index, refresh_interval)
+            self.es.indices.refresh(index=index)
+
+        batch_reports.sort(key=lambda report: report['batch'])
+        report = {
+            'indexed': sum(r['indexed'] for r in batch_reports),
+            'failed': sum(r['failed'] for r in batch_reports),
+            'seconds': time.time() - start_time,
+            'batches': batch_reports,
+        }
+        print(f"[DEBUG] Indexed {report['indexed']} documents ({report['failed']} failed) "
+              f"in {len(batch_reports)} batches, {report['seconds']:.2f}s")
+        return report
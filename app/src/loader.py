@@ -0,0 +1,101 @@
+# loader.py
+# Streams validated corpus records in chunks from CSV, JSONL or Parquet files.
+
+import json
+import os
+
+from src.constants import corpus_path, document_fields, loader_chunk_size
+
+
+def validate(record, required=document_fields):
+    """
+    Checks that a record has a non-empty string in every required field and
+    normalizes it: surrounding whitespace is stripped and an ``id`` becomes a string.
+
+    Args:
+        record (dict): The raw record.
+        required (list of str): Fields every record must have.
+
+    Returns:
+        dict or None: The normalized record, or None if it is invalid.
+    """
+    for field in required:
+        value = record.get(field)
+        if not isinstance(value, str) or not value.strip():
+            return None
+        record[field] = value.strip()
+    if record.get('id') is not None and record['id'] == record['id']:  # NaN != NaN
+        record['id'] = str(record['id'])
+    else:
+        record.pop('id', None)
+    return record
+
+
+def _csv_chunks(path, chunk_size):
+    import pandas as pd
+
+    for df in pd.read_csv(path, chunksize=chunk_size, dtype=str):
+        yield df.to_dict(orient="records")
+
+
+def _jsonl_chunks(path, chunk_size):
+    chunk = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            if not line.strip():
+                continue
+            try:
+                chunk.append(json.loads(line))
+            except ValueError:
+                # Counted as invalid by iter_records()
+                chunk.append({})
+            if len(chunk) == chunk_size:
+                yield chunk
+                chunk = []
+    if chunk:
+        yield chunk
+
+
+def _parquet_chunks(path, chunk_size):
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as e:
+        raise ImportError('Reading Parquet needs pyarrow: pip install pyarrow') from e
+
+    for batch in pq.ParquetFile(path).iter_batches(batch_size=chunk_size):
+        yield batch.to_pylist()
+
+
+READERS = {
+    '.csv': _csv_chunks,
+    '.jsonl': _jsonl_chunks,
+    '.parquet': _parquet_chunks,
+}
+
+
+def iter_records(path=corpus_path, chunk_size=loader_chunk_size):
+    """
+    Reads a corpus file chunk by chunk, so only one chunk of raw rows is in
+    memory at a time. The format follows the file extension (.csv, .jsonl or
+    .parquet). Records missing a required field are skipped, like the rows
+    dropped by ``dropna()`` before.
+
+    Args:
+        path (str): Path of the corpus file.
+        chunk_size (int): Number of rows read per chunk.
+
+    Yields:
+        list of dict: The valid records of each chunk, in file order.
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in READERS:
+        raise ValueError(f"Unsupported corpus format '{extension}', expected one of {list(READERS)}")
+
+    total, skipped = 0, 0
+    for raw_chunk in READERS[extension](path, chunk_size):
+        chunk = [record for record in map(validate, raw_chunk) if record is not None]
+        total += len(raw_chunk)
+        skipped += len(raw_chunk) - len(chunk)
+        if chunk:
+            yield chunk
+    print(f'[DEBUG] Read {total} records from {path}, skipped {skipped} invalid')
@@ -1,7 +1,10 @@
-import pandas as pd
+import json
+import os
+import shutil
 
+from scipy import sparse
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
+from sklearn.preprocessing import normalize
 
 import numpy as np
 
@@ -10,15 +13,27 @@ class Index:
     """
     A simple search index using TF-IDF and cosine similarity for text fields and exact matching for keyword fields.
 
+    The TF-IDF matrices of all text fields are L2-normalized row by row and stacked side by side into one
+    sparse matrix, whose transpose serves as an inverted index (one row of postings per term). A query is
+    transformed into the same stacked space with each field's block scaled by its boost, so a single sparse
+    product scores every field and only touches the documents that share a term with the query.
+
     Attributes:
         text_fields (list): List of text field names to index.
         keyword_fields (list): List of keyword field names to index.
+        vectorizer_params (dict): Parameters passed to each TfidfVectorizer.
         vectorizers (dict): Dictionary of TfidfVectorizer instances for each text field.
-        keyword_df (pd.DataFrame): DataFrame containing keyword field data.
-        text_matrices (dict): Dictionary of TF-IDF matrices for each text field.
-        docs (list): List of documents indexed.
+        field_offsets (dict): Column range (start, end) of each text field in the stacked matrix.
+        doc_matrix (sparse.csr_matrix): Stacked, normalized TF-IDF matrix (documents x terms).
+        term_doc_matrix (sparse.csr_matrix): Transpose of doc_matrix (terms x documents).
+        keyword_values (dict): Sorted distinct values of each keyword field.
+        keyword_codes (dict): Integer code of each document's value, per keyword field.
+        docs (list or DocStore): List of documents indexed.
     """
 
+    # Bumped whenever the on-disk layout written by save() changes
+    format_version = 2
+
     def __init__(self, text_fields, keyword_fields, vectorizer_params={}):
         """
         Initializes the Index with specified text and keyword fields.
@@ -30,10 +45,14 @@ class Index:
         """
         self.text_fields = text_fields
         self.keyword_fields = keyword_fields
+        self.vectorizer_params = vectorizer_params
 
         self.vectorizers = {field: TfidfVectorizer(**vectorizer_params) for field in text_fields}
-        self.keyword_df = None
-        self.text_matrices = {}
+        self.field_offsets = {}
+        self.doc_matrix = None
+        self.term_doc_matrix = None
+        self.keyword_values = {}
+        self.keyword_codes = {}
         self.docs = []
 
     def fit(self, docs):
@@ -41,24 +60,138 @@ class Index:
         Fits the index with the provided documents.
 
         Args:
-            docs (list of dict): List of documents to index. Each document is a dictionary.
+            docs (list of dict or DocStore): List of documents to index. Each document is a dictionary.
         """
         self.docs = docs
-        keyword_data = {field: [] for field in self.keyword_fields}
 
+        matrices = []
+        offset = 0
         for field in self.text_fields:
-            texts = [doc.get(field, '') for doc in docs]
-            self.text_matrices[field] = self.vectorizers[field].fit_transform(texts)
+            if hasattr(docs, 'column'):
+                # A DocStore reads one column without building the documents
+                texts = docs.column(field)
+            else:
+                texts = [doc.get(field, '') for doc in docs]
+            matrix = normalize(self.vectorizers[field].fit_transform(texts))
+            self.field_offsets[field] = (offset, offset + matrix.shape[1])
+            offset += matrix.shape[1]
+            matrices.append(matrix)
 
-        for doc in docs:
-            for field in self.keyword_fields:
-                keyword_data[field].append(doc.get(field, ''))
-
-        self.keyword_df = pd.DataFrame(keyword_data)
+        self._set_doc_matrix(sparse.hstack(matrices, format='csr'))
+        self._encode_keywords()
 
         return self
 
-    def search(self, query, filter_dict={}, boost_dict={}, num_results=10):
+    def _set_doc_matrix(self, doc_matrix):
+        self.doc_matrix = doc_matrix.tocsr()
+        self.term_doc_matrix = self.doc_matrix.T.tocsr()
+
+    def _encode_keywords(self):
+        """
+        Integer-codes every keyword field so filters compare small ints instead of strings.
+        """
+        for field in self.keyword_fields:
+            if hasattr(self.docs, 'keyword_codes'):
+                # A DocStore has the codes already
+                self.keyword_values[field], self.keyword_codes[field] = self.docs.keyword_codes(field)
+                continue
+            values = np.array([str(doc.get(field, '')) for doc in self.docs], dtype=object)
+            self.keyword_values[field], codes = np.unique(values, return_inverse=True)
+            self.keyword_codes[field] = codes.astype(np.int32)
+
+    def _keyword_code(self, field, value):
+        """
+        Returns the integer code of value in a keyword field, or -1 if no document has it.
+        """
+        values = self.keyword_values[field]
+        pos = np.searchsorted(values, str(value))
+        if pos < len(values) and values[pos] == str(value):
+            return pos
+        return -1
+
+    def query_matrix(self, queries, boost_dict={}):
+        """
+        Transforms queries into the stacked field space, with each field's block normalized and boosted.
+
+        Args:
+            queries (list of str): The search query strings.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+
+        Returns:
+            sparse.csr_matrix: Matrix of shape (len(queries), number of stacked terms).
+        """
+        blocks = [
+            normalize(self.vectorizers[field].transform(queries)) * boost_dict.get(field, 1)
+            for field in self.text_fields
+        ]
+        return sparse.hstack(blocks, format='csr')
+
+    def _top_docs(self, doc_ids, scores, filter_dict, num_results):
+        """
+        Applies keyword filters to the candidate documents and returns the ids and scores
+        of the top num_results of them, best first.
+        """
+        keep = scores > 0
+        for field, value in filter_dict.items():
+            if field in self.keyword_fields:
+                keep &= self.keyword_codes[field][doc_ids] == self._keyword_code(field, value)
+        doc_ids, scores = doc_ids[keep], scores[keep]
+
+        # Use argpartition on the candidates only to get the top num_results
+        num_results = min(num_results, len(doc_ids))
+        if num_results < len(doc_ids):
+            top = np.argpartition(-scores, num_results - 1)[:num_results]
+            doc_ids, scores = doc_ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+
+        return doc_ids[order], scores[order]
+
+    def score_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10):
+        """
+        Scores several queries at once with one sparse matrix product.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by, applied to every query.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+
+        Returns:
+            list of tuple: For each query, the positions of the top documents in docs and their scores, best first.
+        """
+        # One sparse product scores every field; only documents sharing a term with a query come back
+        scores = (self.query_matrix(queries, boost_dict) @ self.term_doc_matrix).tocsr()
+
+        results = []
+        for row in range(len(queries)):
+            start, end = scores.indptr[row], scores.indptr[row + 1]
+            results.append(self._top_docs(scores.indices[start:end], scores.data[start:end], filter_dict, num_results))
+        return results
+
+    def search_batch(self, queries, filter_dict={}, boost_dict={}, num_results=10, with_scores=False):
+        """
+        Searches the index with several queries at once. All queries are scored with one
+        sparse matrix product.
+
+        Args:
+            queries (list of str): The search query strings.
+            filter_dict (dict): Dictionary of keyword fields to filter by, applied to every query.
+            boost_dict (dict): Dictionary of boost scores for text fields.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+            with_scores (bool): Return (document, score) pairs instead of documents.
+
+        Returns:
+            list of list: For each query, the matching documents ranked by relevance.
+        """
+        results = []
+        for doc_ids, doc_scores in self.score_batch(queries, filter_dict, boost_dict, num_results):
+            if with_scores:
+                results.append([(self.docs[i], float(score)) for i, score in zip(doc_ids, doc_scores)])
+            else:
+                results.append([self.docs[i] for i in doc_ids])
+        return results
+
+    def search(self, query, filter_dict={}, boost_dict={}, num_results=10, with_scores=False):
         """
         Searches the index with the given query, filters, and boost parameters.
 
@@ -67,30 +200,80 @@ class Index:
             filter_dict (dict): Dictionary of keyword fields to filter by. Keys are field names and values are the values to filter by.
             boost_dict (dict): Dictionary of boost scores for text fields. Keys are field names and values are the boost scores.
             num_results (int): The number of top results to return. Defaults to 10.
+            with_scores (bool): Return (document, score) pairs instead of documents.
 
         Returns:
             list of dict: List of documents matching the search criteria, ranked by relevance.
         """
-        query_vecs = {field: self.vectorizers[field].transform([query]) for field in self.text_fields}
-        scores = np.zeros(len(self.docs))
+        return self.search_batch([query], filter_dict, boost_dict, num_results, with_scores)[0]
 
-        # Compute cosine similarity for each text field and apply boost
-        for field, query_vec in query_vecs.items():
-            sim = cosine_similarity(query_vec, self.text_matrices[field]).flatten()
-            boost = boost_dict.get(field, 1)
-            scores += sim * boost
+    def save(self, path, with_docs=True):
+        """
+        Saves the fitted index to a directory: the stacked TF-IDF matrix as an ``.npz`` file,
+        vocabularies and settings as JSON, and the documents as JSON lines.
+        The directory is written next to path first and renamed into place.
 
-        # Apply keyword filters
-        for field, value in filter_dict.items():
-            if field in self.keyword_fields:
-                mask = self.keyword_df[field] == value
-                scores = scores * mask.to_numpy()
+        Args:
+            path (str): Directory to save the index to. Replaced if it exists.
+            with_docs (bool): Save the documents too. Leave them out when they live in a DocStore.
+        """
+        tmp_path = f'{path}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        meta = {
+            'text_fields': self.text_fields,
+            'keyword_fields': self.keyword_fields,
+            'vectorizer_params': self.vectorizer_params,
+            'field_offsets': self.field_offsets,
+            'vocabularies': {
+                field: {term: int(col) for term, col in self.vectorizers[field].vocabulary_.items()}
+                for field in self.text_fields
+            },
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        np.savez(os.path.join(tmp_path, 'idf.npz'),
+                 **{field: self.vectorizers[field].idf_ for field in self.text_fields})
+        sparse.save_npz(os.path.join(tmp_path, 'doc_matrix.npz'), self.doc_matrix)
+
+        if with_docs:
+            with open(os.path.join(tmp_path, 'docs.jsonl'), 'w') as f:
+                for doc in self.docs:
+                    f.write(json.dumps(doc, default=str) + '\n')
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
 
-        # Use argpartition to get top num_results indices
-        top_indices = np.argpartition(scores, -num_results)[-num_results:]
-        top_indices = top_indices[np.argsort(-scores[top_indices])]
+    @classmethod
+    def load(cls, path, docs=None):
+        """
+        Loads an index saved with save() without re-fitting the vectorizers.
+
+        Args:
+            path (str): Directory the index was saved to.
+            docs (list or DocStore, optional): Documents of an index saved without them.
+
+        Returns:
+            Index: The loaded index, ready to search.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
 
-        # Filter out zero-score results
-        top_docs = [self.docs[i] for i in top_indices if scores[i] > 0]
+        index = cls(meta['text_fields'], meta['keyword_fields'], meta['vectorizer_params'])
+        index.field_offsets = {field: tuple(offsets) for field, offsets in meta['field_offsets'].items()}
+        idf = np.load(os.path.join(path, 'idf.npz'))
+        for field in index.text_fields:
+            # A fixed vocabulary plus the stored idf weights is a fitted vectorizer
+            vectorizer = TfidfVectorizer(**{**index.vectorizer_params, 'vocabulary': meta['vocabularies'][field]})
+            vectorizer.idf_ = idf[field]
+            index.vectorizers[field] = vectorizer
+        index._set_doc_matrix(sparse.load_npz(os.path.join(path, 'doc_matrix.npz')))
 
-        return top_docs
\ No newline at end of file
+        if docs is None:
+            with open(os.path.join(path, 'docs.jsonl')) as f:
+                docs = [json.loads(line) for line in f]
+        index.docs = docs
+        index._encode_keywords()
+        return index
@@ -0,0 +1,228 @@
+# models.py
+# Process-wide registry of loaded models, shared by all pipelines.
+
+import threading
+import time
+
+
+def _rss_mb():
+    """
+    Returns the current resident set size of the process in megabytes.
+
+    Returns:
+        float: RSS in MB, or 0.0 when it cannot be determined.
+    """
+    try:
+        import os
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE') / (1024 * 1024)
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        # Peak RSS is the best we can do without /proc (KB on Linux, bytes on macOS)
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    except ImportError:
+        return 0.0
+
+
+class ModelRegistry:
+    """
+    A thread-safe registry that loads each model once and keeps it for the
+    life of the process.
+
+    Models are keyed by a tuple of (kind, name, options) and loaded lazily on
+    first use. Each key has its own lock, so two threads asking for the same
+    model wait on a single load while different models can load concurrently.
+
+    Attributes:
+        models (dict): Loaded model objects keyed by registry key.
+        stats (dict): Load time (seconds) and RSS delta (MB) per registry key.
+    """
+
+    def __init__(self):
+        self.models = {}
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._key_locks = {}
+
+    def get(self, key, loader):
+        """
+        Returns the model stored under key, loading it with loader if needed.
+
+        Args:
+            key (tuple): Hashable key identifying the model and its options.
+            loader (callable): Zero-argument function that loads the model.
+
+        Returns:
+            object: The loaded model.
+        """
+        model = self.models.get(key)
+        if model is not None:
+            return model
+
+        with self._lock:
+            key_lock = self._key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            # Another thread may have finished loading while we waited
+            model = self.models.get(key)
+            if model is not None:
+                return model
+
+            print(f'[DEBUG] Loading model {key}...')
+            rss_before = _rss_mb()
+            start_time = time.time()
+            model = loader()
+            load_time = time.time() - start_time
+            rss_delta = _rss_mb() - rss_before
+
+            self.stats[key] = {'load_time': load_time, 'memory_mb': rss_delta}
+            self.models[key] = model
+            print(f'[DEBUG] Loaded model {key} in {load_time:.2f}s (+{rss_delta:.1f} MB)')
+            return model
+
+    def report(self):
+        """
+        Returns load statistics for every model loaded so far.
+
+        Returns:
+            list of dict: One entry per model with its key, load time and memory.
+        """
+        return [
+            {'model': key, 'load_time': stat['load_time'], 'memory_mb': stat['memory_mb']}
+            for key, stat in self.stats.items()
+        ]
+
+    def clear(self):
+        """
+        Drops all loaded models so they can be garbage collected.
+        """
+        with self._lock:
+            self.models.clear()
+            self.stats.clear()
+            self._key_locks.clear()
+
+
+registry = ModelRegistry()
+
+
+def get_t5_tokenizer(name):
+    """
+    Returns the shared T5 tokenizer for the given model name.
+
+    Args:
+        name (str): Hugging Face model name.
+
+    Returns:
+        T5Tokenizer: The loaded tokenizer.
+    """
+    def load():
+        from transformers import T5Tokenizer
+        return T5Tokenizer.from_pretrained(name)
+
+    return registry.get(('t5-tokenizer', name), load)
+
+
+ONNX_INSTALL_HINT = ('GENERATOR_BACKEND=onnx needs optimum, which is not installed: run '
+                     '`pip install ".[onnx]"` from the app directory (or `pip install optimum[onnxruntime]`), '
+                     'or use GENERATOR_BACKEND=torch|int8')
+
+
+def check_backend(backend):
+    """
+    Checks that a generator backend is known and its optional dependencies are
+    installed, without importing them, so a misconfigured backend fails when the
+    generator is created rather than on its first answer.
+
+    Args:
+        backend (str): One of 'torch', 'int8' or 'onnx'.
+
+    Raises:
+        ValueError: If the backend is unknown.
+        ImportError: If the backend is 'onnx' and optimum is not installed.
+    """
+    if backend not in ('torch', 'int8', 'onnx'):
+        raise ValueError(f"Unknown generator backend '{backend}', expected 'torch', 'int8' or 'onnx'")
+    if backend == 'onnx':
+        import importlib.util
+        if importlib.util.find_spec('optimum') is None:
+            raise ImportError(ONNX_INSTALL_HINT)
+
+
+def _load_onnx_model(name, cache_dir):
+    """
+    Loads the ONNX Runtime export of a seq2seq model (encoder, decoder and decoder
+    with past key values), exporting it on first use and caching it under cache_dir.
+    """
+    import os
+    import shutil
+    try:
+        from optimum.onnxruntime import ORTModelForSeq2SeqLM
+    except ImportError as e:
+        raise ImportError(ONNX_INSTALL_HINT) from e
+
+    export_path = os.path.join(cache_dir, name.replace('/', '_'))
+    if os.path.exists(os.path.join(export_path, 'config.json')):
+        return ORTModelForSeq2SeqLM.from_pretrained(export_path, use_cache=True)
+
+    print(f'[DEBUG] Exporting {name} to ONNX...')
+    model = ORTModelForSeq2SeqLM.from_pretrained(name, export=True, use_cache=True)
+    # Save next to the final path and rename so a crashed export is never loaded
+    tmp_path = f'{export_path}.tmp'
+    shutil.rmtree(tmp_path, ignore_errors=True)
+    model.save_pretrained(tmp_path)
+    shutil.rmtree(export_path, ignore_errors=True)
+    os.replace(tmp_path, export_path)
+    return model
+
+
+def get_t5_model(name, backend='torch'):
+    """
+    Returns the shared T5 model for the given model name and inference backend.
+
+    Backends:
+        torch: eager fp32 PyTorch, in eval mode.
+        int8: PyTorch with the Linear layers dynamically quantized to int8.
+        onnx: ONNX Runtime encoder and decoders with KV cache, exported once and cached on disk.
+
+    Args:
+        name (str): Hugging Face model name.
+        backend (str): One of 'torch', 'int8' or 'onnx'.
+
+    Returns:
+        object: A model with get_encoder() and generate(), like T5ForConditionalGeneration.
+    """
+    def load():
+        if backend == 'onnx':
+            from src.constants import onnx_cache_dir
+            return _load_onnx_model(name, onnx_cache_dir)
+
+        from transformers import T5ForConditionalGeneration
+        model = T5ForConditionalGeneration.from_pretrained(name).eval()
+        if backend == 'int8':
+            import torch
+            model = torch.quantization.quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+        return model
+
+    check_backend(backend)
+    return registry.get(('t5-model', name, backend), load)
+
+
+def get_embedding_model(name, truncate_dim=None):
+    """
+    Returns the shared SentenceTransformer for the given model name and dimension.
+
+    Args:
+        name (str): SentenceTransformer model name.
+        truncate_dim (int, optional): Dimension to truncate embeddings to.
+
+    Returns:
+        SentenceTransformer: The loaded embedding model.
+    """
+    def load():
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(name, truncate_dim=truncate_dim)
+
+    return registry.get(('sentence-transformer', name, truncate_dim), load)
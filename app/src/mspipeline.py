@@ -1,134 +1,67 @@
 # mspipeline.py
 
 import os
-import pandas as pd
+import time
 from src import minisearch
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-from src.constants import dataset_name, keyword_fields, text_fields, model_name
+from src.constants import keyword_fields, text_fields, minisearch_index_dir, model_name
+from src.docstore import open_docstore, remove_stale
+from src.indexmanager import schema_hash
+from src.ragpipeline import RAGPipeline
+
+class MiniSearchRAGPipeline(RAGPipeline):
+    search_type = 'MiniSearch'
 
-class MiniSearchRAGPipeline:
     def __init__(self): 
-        self.query = None
-        self.response = None
-        self.tokenizer = T5Tokenizer.from_pretrained(model_name)
-        self.model = T5ForConditionalGeneration.from_pretrained(model_name) 
+        super().__init__()
+        self.index = None
+        self.store = None
 
-    def read_data(self):
-        """
-        Reads data from csv file and converts it into list of dictionaries
+    def create_index(self):
         """
-        print('[DEBUG] Reading data...')
-        # Read data into dataframe 
-        data_file_path = os.path.join('data', 'data.csv')
-        df = pd.read_csv(data_file_path).dropna()
+        Syncs the doc store with the data file, then loads the MiniSearch index
+        saved for the current settings and store version, or fits it over the
+        store if there is none yet. The index holds no documents of its own:
+        searches return store rows.
 
-        # Convert dataframe to list of dictionaries
-        data_dict = df.to_dict(orient="records")
-        return data_dict
-    
-    def search(self, data_dict, query, num_results):
+        :return: None
         """
-        Retrieves results from the index based on the query.
+        self.store, self.sync_report = open_docstore(self.add_answer_ids)
+        schema = schema_hash(text_fields, keyword_fields, model_name, minisearch.Index.format_version)
+        self.index_version = f'{schema}-{self.store.version}'
+        index_path = os.path.join(minisearch_index_dir, self.index_version)
 
-        Args:
-            data_dict (list of dict): List of dictionaries containing the data to be indexed.
-            query (str): The search query string.
-            num_results (int): The number of top results to return.
+        if os.path.exists(index_path):
+            print('[DEBUG] Loading Index...')
+            self.index = minisearch.Index.load(index_path, docs=self.store)
+            return
 
-        Returns:
-            list of str: List of results matching the search criteria, ranked by relevance.
-        """
-        
         print('[DEBUG] Creating Index...')
-        # Create Index
-        ms = minisearch.Index(
+        self.index = minisearch.Index(
             text_fields=text_fields,
-            # keyword_fields=keyword_fields,
-        )
-
-        # Retrieve Results
-        print('[DEBUG] Retrieving Search Results...')
-        ms.fit(data_dict)
-        
-        results = ms.search( query = query,
-                            num_results = num_results)
-        response = [result['answer'] for result in results]
-        print('\n\n[DEBUG] Retrieved results:', response)
-        return response
-    
-    def generate_prompt(self, query, response):
-        """
-        Generates a prompt for the LLM based on the query and response.
-
-        Args:
-            query (str): The search query string.
-            response (str): The response from the retrieval model.
-
-        Returns:
-            str: The prompt to be sent to the LLM.
-        """
-
-        prompt_template = """
-            You're a data science expert.
-            Provide concise and complete answers to the questions based on the context given below.
-            QUESTION: {question}
-
-            CONTEXT: 
-            {response}
-            """.strip()
-
-        prompt = prompt_template.format(question=query, response=response)
-        return prompt
+            keyword_fields=keyword_fields,
+        ).fit(self.store)
+        self.index.save(index_path, with_docs=False)
+        remove_stale(minisearch_index_dir, f'{schema}-', self.index_version)
     
-    def generate_response(self, prompt): 
+    def search_batch(self, queries, num_results, query_vectors=None):
         """
-        Generates a response using the LLM based on the given prompt.
+        Retrieves results for several queries, scored together with one sparse matrix product.
 
         Args:
-            prompt (str): The prompt to generate a response for.
+            queries (list of str): The search query strings.
+            num_results (int): The number of top results to return per query.
+            query_vectors (np.ndarray, optional): Not used by text search.
 
         Returns:
-            str: The generated response from the LLM.
-        """
-
-        print('[DEBUG] Generating LLM response...')
-        inputs = self.tokenizer(
-            prompt, 
-            return_tensors="pt", 
-            max_length=512, 
-            truncation=True, 
-            padding='max_length'
-        )
-
-        # Generate Response
-        outputs = self.model.generate(
-            **inputs,
-            max_new_tokens=1024,
-            min_length=100,
-            no_repeat_ngram_size=3,
-            do_sample=True, 
-            num_beams=4,        
-            early_stopping = True # Stop once all beams are finished 
-            # early_stopping = False # Stop once max_new_tokens is reached
-        )
-        
-        llm_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        return llm_response
-    
-    def get_response(self,query, num_results=3):
+            list of dict: One retrieval result per query, ranked by relevance, in input order.
         """
-        Retrieves and generates a response for a given query.
+        if self.index is None:
+            self.create_index()
 
-        Args:
-            query (str): The search query string.
-            num_results (int, optional): The number of top results to return. Defaults to 5.
+        # Retrieve Results
+        print('[DEBUG] Retrieving Search Results...')
+        start_time = time.time()
+        results = self.index.score_batch(queries, num_results=num_results)
+        time_taken = int((time.time() - start_time) * 1000)
 
-        Returns:
-            str: The generated response from the LLM.
-        """
-        data_dict = self.read_data()
-        results = self.search(data_dict, query, num_results)
-        prompt = self.generate_prompt(query, results)
-        llm_response = self.generate_response(prompt)
-        return llm_response
\ No newline at end of file
+        return [self.store.retrieval(rows, scores, time_taken) for rows, scores in results]
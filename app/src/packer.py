@@ -0,0 +1,110 @@
+# packer.py
+# Token-budgeted packing of retrieved passages into the prompt context.
+
+from src.constants import pack_dedupe_threshold, pack_min_fragment
+
+
+def jaccard(a, b):
+    """
+    Returns the Jaccard similarity of two token id sets.
+
+    Args:
+        a (set): Token ids of the first passage.
+        b (set): Token ids of the second passage.
+
+    Returns:
+        float: Size of the intersection divided by the size of the union.
+    """
+    union = len(a | b)
+    return len(a & b) / union if union else 1.0
+
+
+class ContextPacker:
+    """
+    Selects the retrieved passages that go into a prompt.
+
+    Passages are taken in rank order (by score when scores are given, otherwise
+    in retrieval order). A passage whose token set is a near-duplicate of one
+    already selected is dropped. Passages are added whole while they fit in the
+    token budget; one that does not fit is skipped so a shorter, lower-ranked
+    passage can still use the room. If at least min_fragment tokens remain at
+    the end, the best skipped passage is cut to fill them. The best passage is
+    never skipped: if it alone exceeds the budget, it is cut to the budget.
+    Passages are joined with separator token ids, which count against the budget.
+
+    Token counts come from the passages' token ids, which the pipelines store at
+    index time, so packing never tokenizes the answers.
+
+    Attributes:
+        dedupe_threshold (float): Jaccard similarity from which two passages are near-duplicates.
+        min_fragment (int): Smallest cut of a passage worth adding.
+    """
+
+    def __init__(self, dedupe_threshold=pack_dedupe_threshold, min_fragment=pack_min_fragment):
+        self.dedupe_threshold = dedupe_threshold
+        self.min_fragment = min_fragment
+
+    def rank(self, passage_ids, scores=None):
+        """
+        Returns passage positions in rank order.
+
+        Args:
+            passage_ids (list of list of int): Token ids of each passage.
+            scores (list of float, optional): Retrieval score of each passage.
+
+        Returns:
+            list of int: Passage positions, best first.
+        """
+        positions = list(range(len(passage_ids)))
+        if scores is not None:
+            positions.sort(key=lambda i: scores[i], reverse=True)
+        return positions
+
+    def pack(self, passage_ids, budget, scores=None, separator=()):
+        """
+        Packs passages into a token budget.
+
+        Args:
+            passage_ids (list of list of int): Token ids of each passage.
+            budget (int): Number of context tokens available.
+            scores (list of float, optional): Retrieval score of each passage.
+            separator (list of int, optional): Token ids put between passages.
+
+        Returns:
+            tuple: The context token ids and the positions of the passages used, in context order.
+        """
+        selected, skipped, token_sets = [], [], []
+        remaining = budget
+        for i in self.rank(passage_ids, scores):
+            ids = passage_ids[i]
+            token_set = set(ids)
+            if any(jaccard(token_set, other) >= self.dedupe_threshold for other in token_sets):
+                continue
+            if not selected and not skipped and len(ids) > budget:
+                # The best passage alone exceeds the budget: cut it rather than lose it
+                return ids[:max(budget, 0)], [i]
+            cost = len(ids) + (len(separator) if selected else 0)
+            if cost <= remaining:
+                selected.append(i)
+                token_sets.append(token_set)
+                remaining -= cost
+            else:
+                skipped.append(i)
+
+        # A fragment after the selected passages needs a separator too
+        room = remaining - (len(separator) if selected else 0)
+        fragment = None
+        if skipped and room >= self.min_fragment:
+            fragment = skipped[0]
+
+        context = []
+        for n, i in enumerate(selected):
+            if n:
+                context.extend(separator)
+            context.extend(passage_ids[i])
+        if fragment is not None:
+            if selected:
+                context.extend(separator)
+            context.extend(passage_ids[fragment][:room])
+            selected.append(fragment)
+        return context, selected
@@ -0,0 +1,30 @@
+# pipelines.py
+# Maps search types to RAG pipeline classes.
+
+# Search type -> (module, class). Modules are imported on first use, so a
+# process only loads the backends it serves.
+PIPELINES = {
+    'Text': ('src.espipeline', 'ElSearchRAGPipeline'),
+    'Vector': ('src.vectorpipeline', 'VecSearchRAGPipeline'),
+    'Hybrid': ('src.hybridpipeline', 'HybridSearchRAGPipeline'),
+    'MiniSearch': ('src.mspipeline', 'MiniSearchRAGPipeline'),
+}
+
+
+def make_pipeline(search_type):
+    """
+    Creates the RAG pipeline of a search type. The index is not prepared;
+    call create_index() on the result.
+
+    Args:
+        search_type (str): One of the keys of PIPELINES.
+
+    Returns:
+        RAGPipeline: A new pipeline instance.
+    """
+    import importlib
+
+    if search_type not in PIPELINES:
+        raise ValueError(f"Unknown search type '{search_type}', expected one of {list(PIPELINES)}")
+    module_name, class_name = PIPELINES[search_type]
+    return getattr(importlib.import_module(module_name), class_name)()
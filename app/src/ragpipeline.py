@@ -0,0 +1,336 @@
+# ragpipeline.py
+# Retrieval-augmented generation flow shared by the search backends.
+
+import time
+
+from src.constants import embedding_model, embedding_size
+from src.generator import Generator
+from src.models import get_embedding_model
+from src.tracing import stage
+
+
+class RAGPipeline:
+    """
+    Base class of the RAG pipelines. Subclasses implement retrieval in
+    search_batch(); prompting, generation and the single and batch query
+    entry points are shared.
+
+    A retrieval result is a dictionary with the retrieved ``answers`` and the
+    metadata ``time_taken`` (ms), ``total_hits``, ``relevance_score`` and ``topic``,
+    and the ``scores`` of the answers, which rank them when the prompt is packed.
+    Backends that store the answers' token ids at index time also return them
+    as ``answer_ids``, so prompts are assembled without re-tokenizing the answers.
+
+    When a ResponseCache is assigned to ``cache``, responses are looked up there
+    first and only cache misses are retrieved and generated. Pipelines that
+    embed queries for retrieval (``embeds_queries``) also use the semantic tier
+    of the cache; the others match the normalized query text only, so the
+    cache never loads the embedding model for them.
+
+    search() and get_response() keep their original tuple results; the batch
+    and streaming entry points return dictionaries with the full metadata.
+
+    Embedding, retrieval, prompt building and generation are timed as stages of
+    the current tracing.trace(), if one is active.
+    """
+
+    search_type = None
+
+    # Whether retrieval uses query embeddings, which the cache then reuses for semantic lookups
+    embeds_queries = False
+
+    prompt_template = """
+            You're a data science expert.
+            Provide concise and complete answers to the questions based on the context given below.
+            QUESTION: {question}
+
+            CONTEXT:
+            {response}
+            """.strip()
+
+    def __init__(self):
+        self.query = None
+        self.response = None
+        self.generator = Generator()
+        self.index_version = None
+        self.sync_report = None
+        self.cache = None
+
+    def add_answer_ids(self, docs):
+        """
+        Tokenizes the answers of documents and stores the token ids with them as
+        ``answer_ids``, so prompts are built from stored token ids.
+
+        Args:
+            docs (list of dict): Documents to tokenize, updated in place.
+        """
+        answer_ids = self.generator.tokenize_passages([doc['answer'] for doc in docs])
+        for doc, ids in zip(docs, answer_ids):
+            doc['answer_ids'] = ids
+
+    @property
+    def tokenizer(self):
+        """Shared T5 tokenizer, loaded from the model registry on first use."""
+        return self.generator.tokenizer
+
+    @property
+    def model(self):
+        """Shared T5 model, loaded from the model registry on first use."""
+        return self.generator.model
+
+    @property
+    def emb_model(self):
+        """Shared SentenceTransformer, loaded from the model registry on first use."""
+        return get_embedding_model(embedding_model, embedding_size)
+
+    def embed_queries(self, queries):
+        """
+        Encodes all queries in one call.
+
+        Args:
+            queries (list of str): The search query strings.
+
+        Returns:
+            np.ndarray: One embedding per query.
+        """
+        with stage('embed'):
+            return self.emb_model.encode(queries, batch_size=len(queries), show_progress_bar=False)
+
+    def search_batch(self, queries, num_results, query_vectors=None):
+        """
+        Retrieves results for several queries.
+
+        Args:
+            queries (list of str): The search query strings.
+            num_results (int): The number of top results to return per query.
+            query_vectors (np.ndarray, optional): Query embeddings, for backends that use them.
+
+        Returns:
+            list of dict: One retrieval result per query, in the same order.
+        """
+        raise NotImplementedError
+
+    def search(self, query, num_results=3):
+        """
+        Retrieves results from the index based on the query.
+
+        Args:
+            query (str): The search query string.
+            num_results (int): The number of top results to return.
+
+        Returns:
+            tuple: The retrieved answers, ranked by relevance, time_taken, total_hits,
+            relevance_score and topic.
+        """
+        with stage('retrieve'):
+            retrieval = self.search_batch([query], num_results)[0]
+        return (retrieval['answers'], retrieval['time_taken'], retrieval['total_hits'],
+                retrieval['relevance_score'], retrieval['topic'])
+
+    def generate_prompt(self, query, response, response_ids=None, scores=None):
+        """
+        Generates a prompt for the LLM based on the query and response. The
+        retrieved answers are added in rank order until the token budget is used up.
+
+        Args:
+            query (str): The search query string.
+            response (list of str): The answers from the retrieval model, most relevant first.
+            response_ids (list, optional): Token ids of the answers, stored at index time.
+            scores (list of float, optional): Retrieval scores of the answers.
+
+        Returns:
+            str: The prompt to be sent to the LLM.
+        """
+        with stage('prompt'):
+            prompt = self.generator.build_prompt(self.prompt_template, query, response, response_ids, scores)
+        return prompt
+
+    def generate_prompt_ids(self, query, response, response_ids=None, scores=None):
+        """
+        Generates the token ids of the prompt for the LLM. Answers with token ids
+        stored at index time are not tokenized again.
+
+        Args:
+            query (str): The search query string.
+            response (list of str): The answers from the retrieval model, most relevant first.
+            response_ids (list, optional): Token ids of the answers, stored at index time.
+            scores (list of float, optional): Retrieval scores of the answers.
+
+        Returns:
+            list of int: The prompt token ids.
+        """
+        with stage('prompt'):
+            return self.generator.build_prompt_ids(self.prompt_template, query, response, response_ids, scores)
+
+    def generate_response(self, prompt, profile=None):
+        """
+        Generates a response using the LLM based on the given prompt.
+
+        Args:
+            prompt (str): The prompt to generate a response for.
+            profile (str, optional): Decoding profile. Defaults to the generator's default profile.
+
+        Returns:
+            str: The generated response from the LLM.
+        """
+        return self.generator.generate(prompt, profile)['response']
+
+    def answer_batch(self, queries, num_results=3, profile=None, query_vectors=None):
+        """
+        Retrieves and generates responses for several queries, without the cache.
+
+        Args:
+            queries (list of str): The search query strings.
+            num_results (int, optional): The number of top results to retrieve per query. Defaults to 3.
+            profile (str, optional): Decoding profile. Defaults to the generator's default profile.
+            query_vectors (np.ndarray, optional): Query embeddings, if already computed.
+
+        Returns:
+            list of dict: For each query, in input order, the ``query``, the generated
+            ``response``, the decoding metadata and the retrieval metadata.
+        """
+        with stage('retrieve'):
+            retrievals = self.search_batch(queries, num_results, query_vectors=query_vectors)
+        prompts = [
+            self.generate_prompt_ids(query, retrieval['answers'], retrieval.get('answer_ids'), retrieval.get('scores'))
+            for query, retrieval in zip(queries, retrievals)
+        ]
+        generations = self.generator.generate_batch(prompts, profile)
+        return [
+            {'query': query, **generation, **retrieval}
+            for query, generation, retrieval in zip(queries, generations, retrievals)
+        ]
+
+    def lookup_cache(self, queries, profile):
+        """
+        Looks queries up in the response cache.
+
+        Args:
+            queries (list of str): The search query strings.
+            profile (str): Resolved decoding profile name.
+
+        Returns:
+            tuple: The cached results (None for misses) and the query embeddings,
+            or None if the pipeline does not embed queries.
+        """
+        query_vectors = self.embed_queries(queries) if self.embeds_queries else None
+        results = [None] * len(queries)
+        for i, query in enumerate(queries):
+            query_vector = None if query_vectors is None else query_vectors[i]
+            cached, status = self.cache.get(query, self.search_type, profile, self.index_version, query_vector)
+            if cached is not None:
+                results[i] = {**cached, 'query': query, 'cache_status': status}
+        return results, query_vectors
+
+    def get_responses(self, queries, num_results=3, profile=None):
+        """
+        Retrieves and generates responses for several queries at once. Retrieval
+        is batched by the backend and generation runs on padded batches of
+        prompts grouped by length. Cached responses are served from the cache.
+
+        Args:
+            queries (list of str): The search query strings.
+            num_results (int, optional): The number of top results to retrieve per query. Defaults to 3.
+            profile (str, optional): Decoding profile. Defaults to the generator's default profile.
+
+        Returns:
+            list of dict: For each query, in input order, the ``query``, the generated
+            ``response``, the decoding metadata, the retrieval metadata and the
+            ``cache_status`` ('exact', 'semantic', 'miss' or None without a cache).
+        """
+        if self.cache is None:
+            return [{**result, 'cache_status': None} for result in self.answer_batch(queries, num_results, profile)]
+
+        profile, _ = self.generator.profile_kwargs(profile)
+        results, query_vectors = self.lookup_cache(queries, profile)
+
+        misses = [i for i, result in enumerate(results) if result is None]
+        if misses:
+            miss_vectors = None if query_vectors is None else query_vectors[misses]
+            answers = self.answer_batch([queries[i] for i in misses], num_results, profile, miss_vectors)
+            for position, (i, answer) in enumerate(zip(misses, answers)):
+                query_vector = None if miss_vectors is None else miss_vectors[position]
+                self.cache.put(queries[i], self.search_type, profile, self.index_version, answer, query_vector)
+                results[i] = {**answer, 'cache_status': 'miss'}
+        return results
+
+    def stream_response(self, query, num_results=3, profile=None):
+        """
+        Retrieves results for a query and streams the generated response.
+
+        The returned result holds the retrieval metadata right away. Once the
+        chunk iterator is exhausted it also holds the full ``response``, the
+        decoding metadata, the time to first chunk ``ttft`` and the ``total_time``
+        (both in seconds, measured from the call).
+
+        Args:
+            query (str): The search query string.
+            num_results (int, optional): The number of top results to return. Defaults to 3.
+            profile (str, optional): Decoding profile. Defaults to the generator's default profile.
+
+        Returns:
+            tuple: The result dict and an iterator of response text chunks.
+        """
+        start_time = time.time()
+        profile, _ = self.generator.profile_kwargs(profile)
+
+        query_vectors = None
+        if self.cache is not None:
+            cached, query_vectors = self.lookup_cache([query], profile)
+            if cached[0] is not None:
+                result = cached[0]
+
+                def cached_chunks():
+                    result['ttft'] = result['total_time'] = time.time() - start_time
+                    yield result['response']
+
+                return result, cached_chunks()
+
+        with stage('retrieve'):
+            retrieval = self.search_batch([query], num_results, query_vectors=query_vectors)[0]
+        prompt = self.generate_prompt_ids(query, retrieval['answers'], retrieval.get('answer_ids'),
+                                          retrieval.get('scores'))
+        result = {
+            'query': query,
+            'decoding_profile': profile,
+            'prompt_tokens': len(prompt),
+            'cache_status': 'miss' if self.cache is not None else None,
+            **retrieval,
+        }
+
+        def chunks():
+            parts = []
+            decode_start = time.time()
+            for chunk in self.generator.stream(prompt, profile):
+                if not parts:
+                    result['ttft'] = time.time() - start_time
+                parts.append(chunk)
+                yield chunk
+
+            result['response'] = ''.join(parts)
+            result['decode_time'] = time.time() - decode_start
+            result['decode_tokens'] = self.generator.count_tokens(result['response'])
+            result['total_time'] = time.time() - start_time
+            result.setdefault('ttft', result['total_time'])
+            if self.cache is not None:
+                query_vector = None if query_vectors is None else query_vectors[0]
+                self.cache.put(query, self.search_type, profile, self.index_version, dict(result), query_vector)
+
+        return result, chunks()
+
+    def get_response(self, query, num_results=3, profile=None):
+        """
+        Retrieves and generates a response for a given query.
+
+        Args:
+            query (str): The search query string.
+            num_results (int, optional): The number of top results to return. Defaults to 3.
+            profile (str, optional): Decoding profile. Defaults to the generator's default profile.
+
+        Returns:
+            tuple: The generated response, time_taken, total_hits, relevance_score and topic.
+            get_responses() returns the full metadata.
+        """
+        result = self.get_responses([query], num_results, profile)[0]
+        return (result['response'], result['time_taken'], result['total_hits'],
+                result['relevance_score'], result['topic'])
@@ -0,0 +1,309 @@
+# server.py
+# Standalone asyncio inference server: one copy of the models, requests micro-batched per pipeline.
+#
+# Usage (from the app directory):
+#     python -m src.server --port 8000 --search-types MiniSearch Text
+#     python -m src.server --socket /tmp/rag.sock
+
+import argparse
+import asyncio
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from src.cache import ResponseCache
+from src.constants import (
+    inference_host,
+    inference_port,
+    inference_search_types,
+    batch_max_size,
+    batch_wait_ms,
+    inference_queue_size,
+    request_timeout,
+    decoding_profiles,
+)
+from src.pipelines import make_pipeline
+from src.tracing import trace, render_prometheus
+
+
+class Overloaded(Exception):
+    """Raised when a request is refused because the pipeline's queue is full."""
+
+
+class MicroBatcher:
+    """
+    Gathers the requests of one pipeline into micro-batches.
+
+    Requests wait in a bounded queue. A batch starts with the oldest request
+    and takes whatever else arrives within max_wait_ms, up to max_batch_size
+    requests. The batch is answered with one get_responses() call per
+    (profile, num_results) group, so query embedding, retrieval and generate()
+    run batched. Batches of all pipelines share one inference executor, so
+    they never compete for the CPU.
+
+    Admission control: a request that finds the queue full is refused at once
+    instead of waiting. A request that times out is dropped from its batch if
+    the batch has not started yet.
+
+    Attributes:
+        search_type (str): Search type of the pipeline.
+        pipeline (RAGPipeline): The pipeline answering the requests.
+        max_batch_size (int): Requests per batch.
+        max_wait_ms (float): How long a batch waits for more requests.
+        stats (dict): Number of requests, batches, rejected and timed out requests.
+    """
+
+    def __init__(self, search_type, pipeline, executor, max_batch_size=batch_max_size,
+                 max_wait_ms=batch_wait_ms, queue_size=inference_queue_size):
+        self.search_type = search_type
+        self.pipeline = pipeline
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.stats = {'requests': 0, 'batches': 0, 'rejected': 0, 'timeouts': 0}
+        self._executor = executor
+        self._queue = asyncio.Queue(maxsize=queue_size)
+        self._task = None
+
+    def start(self):
+        """Starts the batching loop on the running event loop."""
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    def queue_depth(self):
+        """Returns the number of requests waiting for a batch."""
+        return self._queue.qsize()
+
+    async def submit(self, request, timeout=request_timeout):
+        """
+        Queues a request and waits for its answer.
+
+        Args:
+            request (dict): The ``query``, and optionally ``profile`` and ``num_results``.
+            timeout (float): Seconds to wait for the answer.
+
+        Returns:
+            dict: The pipeline's response for the query.
+
+        Raises:
+            Overloaded: If the queue is full.
+            asyncio.TimeoutError: If no answer came within timeout.
+        """
+        future = asyncio.get_running_loop().create_future()
+        try:
+            self._queue.put_nowait((request, future))
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            raise Overloaded(f'{self.search_type} queue is full')
+        self.stats['requests'] += 1
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            self.stats['timeouts'] += 1
+            raise
+
+    async def _next_batch(self):
+        loop = asyncio.get_running_loop()
+        batch = [await self._queue.get()]
+        deadline = loop.time() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - loop.time()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+            except asyncio.TimeoutError:
+                break
+        # Timed out requests have a cancelled future and are not answered
+        return [(request, future) for request, future in batch if not future.done()]
+
+    def _answer(self, queries, num_results, profile):
+        with trace(self.search_type) as request_trace:
+            results = self.pipeline.get_responses(queries, num_results, profile)
+        # The stages ran once for the whole batch, so their timings belong to the batch, not to one request
+        batch_stage_ms = request_trace.stage_ms()
+        return [{**result, 'batch_stage_ms': batch_stage_ms, 'batch_size': len(queries)} for result in results]
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = await self._next_batch()
+            groups = {}
+            for request, future in batch:
+                key = (request.get('profile'), request.get('num_results', 3))
+                groups.setdefault(key, []).append((request, future))
+
+            for (profile, num_results), items in groups.items():
+                self.stats['batches'] += 1
+                queries = [request['query'] for request, _ in items]
+                try:
+                    results = await loop.run_in_executor(self._executor, self._answer, queries, num_results, profile)
+                except Exception as e:
+                    print(f'[DEBUG] {self.search_type} batch of {len(items)} failed: {e}')
+                    for _, future in items:
+                        if not future.done():
+                            future.set_exception(e)
+                    continue
+                for (_, future), result in zip(items, results):
+                    if not future.done():
+                        future.set_result(result)
+
+
+def _json_default(value):
+    # numpy scalars and arrays in retrieval metadata
+    if hasattr(value, 'tolist'):
+        return value.tolist()
+    return str(value)
+
+
+class InferenceServer:
+    """
+    Minimal HTTP/1.1 server over TCP or a Unix socket, one request per connection.
+
+    Endpoints:
+        POST /answer: ``{"query", "search_type", "profile", "num_results"}`` -> the response,
+            with the ``batch_size`` and ``batch_stage_ms`` (stage timings of the whole batch) it was answered in.
+        GET /health: status and queue depth of every pipeline.
+        GET /metrics: stage latency histograms in Prometheus text format.
+
+    Attributes:
+        batchers (dict): MicroBatcher per search type.
+        timeout (float): Seconds a request may take, queueing included.
+    """
+
+    def __init__(self, batchers, timeout=request_timeout):
+        self.batchers = batchers
+        self.timeout = timeout
+
+    async def _respond(self, writer, status, body, content_type='application/json', headers=()):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 503: 'Service Unavailable',
+                   504: 'Gateway Timeout', 500: 'Internal Server Error'}
+        if not isinstance(body, (bytes, str)):
+            body = json.dumps(body, default=_json_default)
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        head = [f'HTTP/1.1 {status} {reasons.get(status, "")}', f'Content-Type: {content_type}',
+                f'Content-Length: {len(body)}', 'Connection: close', *headers]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+    async def _answer(self, body):
+        try:
+            request = json.loads(body or b'{}')
+            query = request['query']
+            num_results = request.get('num_results', 3)
+        except (ValueError, KeyError, TypeError, AttributeError):
+            return 400, {'error': 'expected a JSON body with a query'}
+        if not isinstance(query, str) or not query.strip():
+            return 400, {'error': 'query must be a non-empty string'}
+        if isinstance(num_results, bool) or not isinstance(num_results, int) or num_results < 1:
+            return 400, {'error': 'num_results must be a positive integer'}
+        batcher = self.batchers.get(request.get('search_type', next(iter(self.batchers))))
+        if batcher is None:
+            return 404, {'error': f"search type not served, expected one of {list(self.batchers)}"}
+        profile = request.get('profile')
+        if profile is not None and profile not in decoding_profiles:
+            return 400, {'error': f"unknown decoding profile, expected one of {list(decoding_profiles)}"}
+
+        try:
+            result = await batcher.submit(
+                {'query': query, 'profile': profile, 'num_results': num_results},
+                self.timeout,
+            )
+        except Overloaded as e:
+            return 503, {'error': str(e)}
+        except asyncio.TimeoutError:
+            return 504, {'error': f'no answer within {self.timeout} seconds'}
+        except Exception as e:
+            return 500, {'error': str(e)}
+        return 200, result
+
+    async def handle(self, reader, writer):
+        """Serves one HTTP request on a connection."""
+        try:
+            request_line = (await reader.readline()).decode('latin-1').strip()
+            if not request_line:
+                return
+            method, path = request_line.split(' ')[:2]
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode('latin-1').strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+
+            if method == 'POST' and path == '/answer':
+                status, payload = await self._answer(body)
+                extra = ('Retry-After: 1',) if status == 503 else ()
+                await self._respond(writer, status, payload, headers=extra)
+            elif method == 'GET' and path == '/health':
+                await self._respond(writer, 200, {
+                    'status': 'ok',
+                    'pipelines': {
+                        name: {'queue_depth': batcher.queue_depth(), **batcher.stats}
+                        for name, batcher in self.batchers.items()
+                    },
+                })
+            elif method == 'GET' and path == '/metrics':
+                await self._respond(writer, 200, render_prometheus(), 'text/plain; version=0.0.4')
+            else:
+                await self._respond(writer, 404, {'error': f'no route for {method} {path}'})
+        except (ValueError, asyncio.IncompleteReadError, ConnectionError) as e:
+            print(f'[DEBUG] Bad request: {e}')
+        finally:
+            writer.close()
+
+
+async def serve(search_types, host=inference_host, port=inference_port, socket_path=None):
+    """
+    Loads the pipelines, starts their micro-batchers and serves requests until cancelled.
+
+    Args:
+        search_types (list of str): Search types to serve.
+        host (str): Interface to listen on.
+        port (int): TCP port to listen on.
+        socket_path (str, optional): Listen on this Unix socket instead of TCP.
+    """
+    loop = asyncio.get_running_loop()
+    # One inference thread: batches run one after another instead of contending for the CPU
+    executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='inference')
+    cache = ResponseCache()
+
+    batchers = {}
+    for search_type in search_types:
+        print(f'[DEBUG] Preparing {search_type} pipeline...')
+        pipeline = make_pipeline(search_type)
+        await loop.run_in_executor(executor, pipeline.create_index)
+        pipeline.cache = cache
+        batchers[search_type] = MicroBatcher(search_type, pipeline, executor)
+        batchers[search_type].start()
+
+    server = InferenceServer(batchers)
+    if socket_path:
+        if os.path.exists(socket_path):
+            os.remove(socket_path)
+        listener = await asyncio.start_unix_server(server.handle, path=socket_path)
+        print(f'[DEBUG] Inference server listening on unix:{socket_path}')
+    else:
+        listener = await asyncio.start_server(server.handle, host, port)
+        print(f'[DEBUG] Inference server listening on http://{host}:{port}')
+    async with listener:
+        await listener.serve_forever()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve RAG answers from one copy of the models, micro-batching requests.')
+    parser.add_argument('--host', default=inference_host)
+    parser.add_argument('--port', type=int, default=inference_port)
+    parser.add_argument('--socket', default=None, help='Listen on a Unix socket instead of TCP.')
+    parser.add_argument('--search-types', nargs='+', default=inference_search_types,
+                        help='Pipelines to load, e.g. Text Vector Hybrid MiniSearch.')
+    args = parser.parse_args()
+    try:
+        asyncio.run(serve(args.search_types, args.host, args.port, args.socket))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
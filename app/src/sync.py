@@ -0,0 +1,235 @@
+# sync.py
+# Incremental sync of the search indices with the corpus file, keyed on stable document ids.
+#
+# Usage (from the app directory):
+#     python -m src.sync --search-types Text Vector MiniSearch
+
+import argparse
+import hashlib
+import json
+import os
+import time
+from itertools import chain
+
+from src.constants import corpus_path, document_fields, manifest_dir
+from src.loader import iter_records
+
+
+def document_id(doc):
+    """
+    Returns the stable id of a document: its ``id`` column if the corpus has one,
+    as ml_indexed.csv does, otherwise a hash of its question and answer. The hash
+    is stable across syncs but does not match the ids of ml_indexed.csv or
+    ground_truth.csv, so corpora without an id column cannot be scored against them.
+
+    Args:
+        doc (dict): The document.
+
+    Returns:
+        str: The document id.
+    """
+    if doc.get('id'):
+        return str(doc['id'])
+    return hashlib.sha1(f"{doc['question']}|{doc['answer']}".encode('utf-8')).hexdigest()[:8]
+
+
+def document_hash(doc, fields=document_fields):
+    """
+    Returns a hash of the indexed fields of a document.
+
+    Args:
+        doc (dict): The document.
+        fields (list of str): Fields that are indexed.
+
+    Returns:
+        str: Hex digest of the field values.
+    """
+    values = json.dumps([doc.get(field) for field in fields], default=str)
+    return hashlib.sha1(values.encode('utf-8')).hexdigest()
+
+
+class Manifest:
+    """
+    The id -> content hash of every document an index holds, saved as JSON.
+
+    Attributes:
+        name (str): Name of the index the manifest describes.
+        path (str): Path of the manifest file.
+    """
+
+    def __init__(self, name, directory=manifest_dir):
+        self.name = name
+        self.path = os.path.join(directory, f'{name}.json')
+
+    def load(self):
+        """
+        Returns the saved hashes, or an empty dict if the index has none yet.
+
+        Returns:
+            dict: Content hash per document id.
+        """
+        if not os.path.exists(self.path):
+            return {}
+        with open(self.path) as f:
+            return json.load(f)
+
+    def save(self, hashes):
+        """
+        Saves the hashes, writing a temporary file first so readers never see a partial manifest.
+
+        Args:
+            hashes (dict): Content hash per document id.
+        """
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(hashes, f)
+        os.replace(tmp_path, self.path)
+
+
+def changed_chunks(chunks, previous, hashes, counts=None):
+    """
+    Filters chunks of documents down to the new and changed ones. Each document
+    gets its stable ``id``; documents whose id was already seen are skipped and
+    counted as duplicates, and a duplicate whose content differs from the first
+    document with its id is logged.
+
+    Args:
+        chunks (iterable of list of dict): The current documents, in chunks.
+        previous (dict): Content hash per document id in the index.
+        hashes (dict): Filled with the content hash of every current document.
+        counts (dict, optional): Its ``duplicates`` count is increased per skipped document.
+
+    Yields:
+        list of dict: The documents to upsert from each chunk that has any.
+    """
+    counts = {} if counts is None else counts
+    counts.setdefault('duplicates', 0)
+    for chunk in chunks:
+        upserts = []
+        for doc in chunk:
+            doc['id'] = document_id(doc)
+            if doc['id'] in hashes:
+                counts['duplicates'] += 1
+                if document_hash(doc) != hashes[doc['id']]:
+                    print(f"[DEBUG] Document {doc['id']} appears again with different content, keeping the first")
+                continue
+            hashes[doc['id']] = document_hash(doc)
+            if previous.get(doc['id']) != hashes[doc['id']]:
+                upserts.append(doc)
+        if upserts:
+            yield upserts
+
+
+def read_documents(path=corpus_path):
+    """
+    Reads every document of a corpus file into memory, each with its stable id.
+    Meant for small corpora, e.g. in benchmarks; indexing streams with iter_records().
+
+    Args:
+        path (str): Path of the corpus file.
+
+    Returns:
+        list of dict: The unique documents, in file order.
+    """
+    counts = {}
+    docs = list(chain.from_iterable(changed_chunks(iter_records(path), {}, {}, counts)))
+    print(f"[DEBUG] Read {len(docs)} documents from {path}, skipped {counts['duplicates']} duplicate ids")
+    return docs
+
+
+def sync_documents(name, apply_fn, chunks=None, rebuild=False):
+    """
+    Brings an index in line with the corpus file by applying only the difference
+    to its manifest. Documents stream through in chunks, so only the manifest
+    and one chunk are held in memory. The manifest is updated once the changes
+    are applied.
+
+    apply_fn receives an iterator over chunks of documents to upsert and an
+    iterator over the ids to delete. The ids to delete are only known once every
+    chunk has been read, so apply_fn must consume the upserts first. It may
+    return the ids of the documents it failed to upsert or delete; those are left
+    out of the manifest, or keep their previous entry, so the next sync retries them.
+
+    Args:
+        name (str): Name of the index, which names its manifest.
+        apply_fn (callable): Takes the upsert chunks and the ids to delete and applies them.
+        chunks (iterable of list of dict, optional): The current documents. Defaults to iter_records().
+        rebuild (bool): Treat the index as empty, e.g. right after it was created.
+
+    Returns:
+        dict: Numbers of upserted, deleted, unchanged, duplicate and failed documents, and seconds taken.
+    """
+    start_time = time.time()
+    manifest = Manifest(name)
+    previous = {} if rebuild else manifest.load()
+    hashes = {}
+    counts = {'upserted': 0, 'deleted': 0, 'duplicates': 0}
+
+    def upserts():
+        for chunk in changed_chunks(iter_records() if chunks is None else chunks, previous, hashes, counts):
+            counts['upserted'] += len(chunk)
+            yield chunk
+
+    def deletes():
+        for doc_id in previous:
+            if doc_id not in hashes:
+                counts['deleted'] += 1
+                yield doc_id
+
+    upsert_chunks = upserts()
+    first = next(upsert_chunks, None)
+    # Everything has been read when there is nothing to upsert
+    failed = None
+    if first is not None or any(doc_id not in hashes for doc_id in previous):
+        failed = apply_fn(upsert_chunks if first is None else chain([first], upsert_chunks), deletes())
+    failed = set(failed or ())
+    unchanged = len(hashes) - counts['upserted']
+    for doc_id in failed:
+        if doc_id in hashes:
+            # A failed upsert: without an entry, the next sync upserts it again
+            del hashes[doc_id]
+            counts['upserted'] -= 1
+        elif doc_id in previous:
+            # A failed delete: keeping the entry makes the next sync delete it again
+            hashes[doc_id] = previous[doc_id]
+            counts['deleted'] -= 1
+    manifest.save(hashes)
+
+    report = {
+        'upserted': counts['upserted'],
+        'deleted': counts['deleted'],
+        'unchanged': unchanged,
+        'duplicates': counts['duplicates'],
+        'failed': len(failed),
+        'seconds': time.time() - start_time,
+    }
+    print(f"[DEBUG] Synced {name}: {report['upserted']} upserted, {report['deleted']} deleted, "
+          f"{report['unchanged']} unchanged, {report['duplicates']} duplicate ids skipped, "
+          f"{report['failed']} failed in {report['seconds']:.2f}s")
+    return report
+
+
+def main():
+    from src.pipelines import make_pipeline
+
+    parser = argparse.ArgumentParser(description='Apply corpus file changes to the search indices incrementally.')
+    parser.add_argument('--search-types', nargs='+', default=['Text', 'Vector', 'MiniSearch'],
+                        help='Pipelines whose indices to sync.')
+    args = parser.parse_args()
+
+    for search_type in args.search_types:
+        pipeline = make_pipeline(search_type)
+        # create_index() builds a missing index and syncs an existing one
+        pipeline.create_index()
+        print(f'{search_type:<12}{pipeline.index_version}: {pipeline.sync_report}')
+
+    from src.embeddings import BatchEncoder
+
+    # Evict the cached embeddings of documents that are gone or changed
+    texts = (doc['question'] + ' ' + doc['answer'] for chunk in iter_records() for doc in chunk)
+    print(f'Embedding cache: {BatchEncoder().compact(texts)}')
+
+
+if __name__ == '__main__':
+    main()
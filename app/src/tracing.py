@@ -0,0 +1,279 @@
+# tracing.py
+# Per-stage latency tracing with Prometheus histograms and opt-in profiling of slow requests.
+
+import contextvars
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from src.constants import metrics_port, trace_profile, trace_sample_rate, trace_slow_ms, trace_dir
+
+# Stages of a request, in pipeline order
+STAGES = ('embed', 'retrieve', 'prompt', 'tokenize', 'encode', 'decode', 'detokenize', 'db_write')
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+
+class Histogram:
+    """
+    A thread-safe cumulative histogram in the Prometheus sense.
+
+    Attributes:
+        buckets (tuple): Upper bounds of the buckets, in seconds.
+        counts (list): Observations per bucket, plus one for +Inf.
+        sum (float): Sum of all observations.
+        count (int): Number of observations.
+    """
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def observe(self, seconds):
+        """
+        Records one observation.
+
+        Args:
+            seconds (float): The observed duration.
+        """
+        position = len(self.buckets)
+        for i, bound in enumerate(self.buckets):
+            if seconds <= bound:
+                position = i
+                break
+        with self._lock:
+            self.counts[position] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def render(self, name, labels):
+        """
+        Renders the histogram in the Prometheus text exposition format.
+
+        Args:
+            name (str): Metric name.
+            labels (str): Label pairs without braces, e.g. 'stage="embed"'.
+
+        Returns:
+            list of str: The bucket, sum and count lines.
+        """
+        with self._lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        lines = []
+        cumulative = 0
+        for bound, bucket_count in zip(list(self.buckets) + ['+Inf'], counts):
+            cumulative += bucket_count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_sum{{{labels}}} {total}')
+        lines.append(f'{name}_count{{{labels}}} {count}')
+        return lines
+
+
+stage_histograms = {stage: Histogram() for stage in STAGES}
+request_histograms = {}
+_request_lock = threading.Lock()
+
+
+class Trace:
+    """
+    Per-request stage timings. Stages are timed exclusively: the time of a
+    stage nested in another (e.g. embedding inside retrieval) is not counted
+    in the outer one, so the stage times of a request add up.
+
+    Attributes:
+        name (str): Label of the request kind, e.g. the search type.
+        stages (dict): Milliseconds spent per stage.
+        total_ms (float): Wall time of the request, set when it ends.
+        profile_path (str): File the profile of the request was dumped to, if any.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.total_ms = None
+        self.profile_path = None
+
+    def stage_ms(self):
+        """
+        Returns the stage timings rounded to whole milliseconds.
+
+        Returns:
+            dict: Milliseconds per stage, for every stage in STAGES (None if not run).
+        """
+        return {stage: round(self.stages[stage]) if stage in self.stages else None for stage in STAGES}
+
+
+_current_trace = contextvars.ContextVar('current_trace', default=None)
+_local = threading.local()
+
+
+@contextmanager
+def stage(name):
+    """
+    Times a stage: observes its exclusive duration in the stage histogram and adds
+    it to the current trace, if any. Overhead is two perf_counter() calls.
+
+    Args:
+        name (str): One of STAGES.
+    """
+    stack = getattr(_local, 'stack', None)
+    if stack is None:
+        stack = _local.stack = []
+    # Time spent in nested stages, subtracted on exit
+    stack.append(0.0)
+    start_time = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start_time
+        exclusive = elapsed - stack.pop()
+        if stack:
+            stack[-1] += elapsed
+        stage_histograms[name].observe(exclusive)
+        current = _current_trace.get()
+        if current is not None:
+            current.stages[name] = current.stages.get(name, 0.0) + exclusive * 1000
+
+
+_profile_lock = threading.Lock()
+
+
+def _start_profiler():
+    """
+    Starts a cProfile or torch.profiler profile if this request is sampled.
+    Only one request is profiled at a time.
+    """
+    if trace_profile == 'off' or random.random() >= trace_sample_rate:
+        return None
+    if not _profile_lock.acquire(blocking=False):
+        return None
+    if trace_profile == 'torch':
+        from torch.profiler import profile, ProfilerActivity
+        profiler = profile(activities=[ProfilerActivity.CPU], record_shapes=True)
+        profiler.__enter__()
+    else:
+        import cProfile
+        profiler = cProfile.Profile()
+        profiler.enable()
+    return profiler
+
+
+def _stop_profiler(profiler, current):
+    """
+    Stops a profile and dumps it to trace_dir if the request was slower than trace_slow_ms.
+    """
+    try:
+        if trace_profile == 'torch':
+            profiler.__exit__(None, None, None)
+        else:
+            profiler.disable()
+        if current.total_ms < trace_slow_ms:
+            return
+        os.makedirs(trace_dir, exist_ok=True)
+        base = os.path.join(trace_dir, f'{time.strftime("%Y%m%d-%H%M%S")}-{current.name}-{int(current.total_ms)}ms')
+        if trace_profile == 'torch':
+            current.profile_path = f'{base}.json'
+            profiler.export_chrome_trace(current.profile_path)
+        else:
+            current.profile_path = f'{base}.prof'
+            profiler.dump_stats(current.profile_path)
+        print(f'[DEBUG] Slow request ({current.total_ms:.0f} ms), profile written to {current.profile_path}')
+    finally:
+        _profile_lock.release()
+
+
+@contextmanager
+def trace(name='request'):
+    """
+    Traces one request: stages timed inside the block are collected on the yielded
+    Trace, and the request duration is observed in a per-name histogram.
+
+    With TRACE_PROFILE set to cprofile or torch, a TRACE_SAMPLE_RATE share of
+    requests is profiled and the profiles of requests slower than TRACE_SLOW_MS
+    are written to TRACE_DIR.
+
+    Args:
+        name (str): Label of the request kind, e.g. the search type.
+
+    Yields:
+        Trace: The trace of the request.
+    """
+    current = Trace(name)
+    token = _current_trace.set(current)
+    profiler = _start_profiler()
+    start_time = time.perf_counter()
+    try:
+        yield current
+    finally:
+        elapsed = time.perf_counter() - start_time
+        current.total_ms = elapsed * 1000
+        _current_trace.reset(token)
+        with _request_lock:
+            histogram = request_histograms.setdefault(name, Histogram())
+        histogram.observe(elapsed)
+        if profiler is not None:
+            _stop_profiler(profiler, current)
+
+
+def render_prometheus():
+    """
+    Renders all histograms in the Prometheus text exposition format.
+
+    Returns:
+        str: The metrics page.
+    """
+    lines = [
+        '# HELP rag_stage_seconds Exclusive time spent per request stage.',
+        '# TYPE rag_stage_seconds histogram',
+    ]
+    for name, histogram in stage_histograms.items():
+        lines.extend(histogram.render('rag_stage_seconds', f'stage="{name}"'))
+    lines.append('# HELP rag_request_seconds Wall time of a traced request.')
+    lines.append('# TYPE rag_request_seconds histogram')
+    with _request_lock:
+        requests = list(request_histograms.items())
+    for name, histogram in requests:
+        lines.extend(histogram.render('rag_request_seconds', f'name="{name}"'))
+    return '\n'.join(lines) + '\n'
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path != '/metrics':
+            self.send_error(404)
+            return
+        body = render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes are too frequent to log
+        pass
+
+
+def start_metrics_server(port=metrics_port):
+    """
+    Serves /metrics for Prometheus from a background thread.
+
+    Args:
+        port (int): Port to listen on. 0 disables the server.
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if disabled.
+    """
+    if not port:
+        return None
+    server = ThreadingHTTPServer(('0.0.0.0', port), _MetricsHandler)
+    threading.Thread(target=server.serve_forever, name='metrics-server', daemon=True).start()
+    print(f'[DEBUG] Serving Prometheus metrics on port {port}')
+    return server
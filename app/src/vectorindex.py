@@ -0,0 +1,342 @@
+# vectorindex.py
+# In-process cosine-similarity vector index with exact and IVF search.
+
+import json
+import os
+import shutil
+
+import numpy as np
+
+
+class VectorIndex:
+    """
+    An in-memory vector index over unit-normalized embeddings, scored by cosine similarity.
+    Scores are reported on Elasticsearch's scale for cosine kNN, (1 + cosine) / 2, so local
+    and Elasticsearch results can be compared and fused.
+
+    Vectors are kept in one contiguous matrix, either as float32 or quantized to int8 with
+    one scale per row. The exact method scores every row with a single matrix product, which
+    is the fastest option for corpora of a few thousand documents. An int8 matrix is
+    dequantized block by block while scoring, so it is never copied as a whole. The IVF method clusters the
+    rows with spherical k-means and, at query time, only scores the rows of the nprobe
+    clusters whose centroids are closest to the query.
+
+    Keyword fields (topic by default) are integer-coded, so filters compare small ints.
+
+    Attributes:
+        dtype (str): Storage dtype of the matrix, 'float32' or 'int8'.
+        method (str): 'exact' or 'ivf'.
+        nlist (int): Number of IVF clusters; defaults to the square root of the corpus size.
+        nprobe (int): Number of IVF clusters scored per query.
+        keyword_fields (list): Document fields that can be filtered on.
+        matrix (np.ndarray): Stored vectors (documents x dimension).
+        scales (np.ndarray): Per-row dequantization scale of an int8 matrix.
+        centroids (np.ndarray): Unit IVF centroids (nlist x dimension).
+        list_ids (np.ndarray): Row ids grouped by cluster.
+        list_offsets (np.ndarray): Start of each cluster in list_ids, plus the end of the last one.
+        keyword_values (dict): Sorted distinct values of each keyword field.
+        keyword_codes (dict): Integer code of each document's value, per keyword field.
+        docs (list or DocStore): Documents indexed, in row order.
+    """
+
+    # Bumped whenever the on-disk layout written by save() changes
+    format_version = 1
+
+    # Rows of an int8 matrix converted to float32 at a time while scoring
+    score_block_rows = 4096
+
+    def __init__(self, dtype='float32', method='exact', nlist=None, nprobe=8, keyword_fields=('topic',)):
+        """
+        Initializes an empty VectorIndex.
+
+        Args:
+            dtype (str): Storage dtype of the matrix, 'float32' or 'int8'.
+            method (str): 'exact' or 'ivf'.
+            nlist (int, optional): Number of IVF clusters.
+            nprobe (int): Number of IVF clusters scored per query.
+            keyword_fields (tuple): Document fields that can be filtered on.
+        """
+        if dtype not in ('float32', 'int8'):
+            raise ValueError(f"Unsupported vector dtype '{dtype}', expected 'float32' or 'int8'")
+        if method not in ('exact', 'ivf'):
+            raise ValueError(f"Unknown search method '{method}', expected 'exact' or 'ivf'")
+        self.dtype = dtype
+        self.method = method
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.keyword_fields = list(keyword_fields)
+
+        self.matrix = None
+        self.scales = None
+        self.centroids = None
+        self.list_ids = None
+        self.list_offsets = None
+        self.keyword_values = {}
+        self.keyword_codes = {}
+        self.docs = []
+
+    @staticmethod
+    def _unit(vectors):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+    def fit(self, vectors, docs, seed=42, normalized=False):
+        """
+        Fits the index with the provided embeddings and documents.
+
+        Args:
+            vectors (np.ndarray): One embedding per document.
+            docs (list of dict or DocStore): Documents to index, in the same order as vectors.
+            seed (int): Random seed of the IVF clustering.
+            normalized (bool): The vectors are float32 and unit length already. A float32
+                index then searches them in place, e.g. a DocStore's memory-mapped embeddings.
+
+        Returns:
+            VectorIndex: The fitted index.
+        """
+        vectors = vectors if normalized else self._unit(vectors)
+        self.docs = docs
+
+        if self.dtype == 'int8':
+            # Symmetric per-row quantization: row ~= matrix[row] * scales[row]
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self.matrix = np.round(vectors / scales[:, None]).astype(np.int8)
+            self.scales = scales.astype(np.float32)
+        else:
+            self.matrix = vectors
+
+        if self.method == 'ivf':
+            self._fit_ivf(vectors, seed)
+        self._encode_keywords()
+        return self
+
+    def _fit_ivf(self, vectors, seed, iterations=10):
+        """
+        Clusters the rows with spherical k-means and builds the inverted lists.
+        """
+        nlist = min(self.nlist or max(1, int(np.sqrt(len(vectors)))), len(vectors))
+        rng = np.random.default_rng(seed)
+        centroids = vectors[rng.choice(len(vectors), nlist, replace=False)]
+        for _ in range(iterations):
+            assignments = np.argmax(vectors @ centroids.T, axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assignments, vectors)
+            # Keep the previous centroid of a cluster that lost all its rows
+            empty = np.bincount(assignments, minlength=nlist) == 0
+            sums[empty] = centroids[empty]
+            centroids = self._unit(sums)
+
+        assignments = np.argmax(vectors @ centroids.T, axis=1)
+        self.nlist = nlist
+        self.centroids = centroids
+        self.list_ids = np.argsort(assignments, kind='stable').astype(np.int32)
+        self.list_offsets = np.searchsorted(assignments[self.list_ids], np.arange(nlist + 1)).astype(np.int64)
+
+    def _encode_keywords(self):
+        """
+        Integer-codes every keyword field so filters compare small ints instead of strings.
+        """
+        for field in self.keyword_fields:
+            if hasattr(self.docs, 'keyword_codes'):
+                # A DocStore has the codes already
+                self.keyword_values[field], self.keyword_codes[field] = self.docs.keyword_codes(field)
+                continue
+            values = np.array([str(doc.get(field, '')) for doc in self.docs], dtype=object)
+            self.keyword_values[field], codes = np.unique(values, return_inverse=True)
+            self.keyword_codes[field] = codes.astype(np.int32)
+
+    def _keyword_code(self, field, value):
+        """
+        Returns the integer code of value in a keyword field, or -1 if no document has it.
+        """
+        values = self.keyword_values[field]
+        pos = np.searchsorted(values, str(value))
+        if pos < len(values) and values[pos] == str(value):
+            return pos
+        return -1
+
+    def _score(self, rows, query_vectors):
+        """
+        Returns the cosine similarities of query_vectors with the given rows (all rows if None).
+        """
+        if self.scales is None:
+            matrix = self.matrix if rows is None else self.matrix[rows]
+            return query_vectors @ matrix.T
+
+        num_rows = len(self.matrix) if rows is None else len(rows)
+        scores = np.empty((len(query_vectors), num_rows), dtype=np.float32)
+        for start in range(0, num_rows, self.score_block_rows):
+            end = min(start + self.score_block_rows, num_rows)
+            block_rows = slice(start, end) if rows is None else rows[start:end]
+            scores[:, start:end] = query_vectors @ self.matrix[block_rows].astype(np.float32).T
+            scores[:, start:end] *= self.scales[block_rows]
+        return scores
+
+    def _top_docs(self, doc_ids, scores, filter_dict, num_results):
+        """
+        Applies keyword filters to the candidate rows and returns the ids and scores
+        of the top num_results of them, best first.
+        """
+        keep = np.ones(len(doc_ids), dtype=bool)
+        for field, value in filter_dict.items():
+            if field in self.keyword_fields:
+                keep &= self.keyword_codes[field][doc_ids] == self._keyword_code(field, value)
+        doc_ids, scores = doc_ids[keep], scores[keep]
+
+        num_results = min(num_results, len(doc_ids))
+        if num_results < len(doc_ids):
+            top = np.argpartition(-scores, num_results - 1)[:num_results]
+            doc_ids, scores = doc_ids[top], scores[top]
+        order = np.argsort(-scores, kind='stable')
+
+        # Elasticsearch's cosine kNN score
+        return doc_ids[order], (1 + scores[order]) / 2
+
+    def search_batch(self, query_vectors, filter_dict={}, num_results=10):
+        """
+        Searches the index with several query embeddings at once.
+
+        Args:
+            query_vectors (np.ndarray): One embedding per query.
+            filter_dict (dict): Dictionary of keyword fields to filter by, applied to every query.
+            num_results (int): The number of top results to return per query. Defaults to 10.
+
+        Returns:
+            list of tuple: For each query, the row ids of the top documents and their scores
+            ((1 + cosine) / 2), best first.
+        """
+        query_vectors = self._unit(np.atleast_2d(query_vectors))
+
+        if self.method == 'exact':
+            scores = self._score(None, query_vectors)
+            all_ids = np.arange(len(self.docs))
+            return [self._top_docs(all_ids, row, filter_dict, num_results) for row in scores]
+
+        nprobe = min(self.nprobe, self.nlist)
+        probes = np.argpartition(-(query_vectors @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        results = []
+        for query_vector, clusters in zip(query_vectors, probes):
+            doc_ids = np.concatenate([
+                self.list_ids[self.list_offsets[c]:self.list_offsets[c + 1]] for c in clusters
+            ])
+            scores = self._score(doc_ids, query_vector[None, :])[0]
+            results.append(self._top_docs(doc_ids, scores, filter_dict, num_results))
+        return results
+
+    def search(self, query_vector, filter_dict={}, num_results=10):
+        """
+        Searches the index with one query embedding.
+
+        Args:
+            query_vector (np.ndarray): Embedding of the search query.
+            filter_dict (dict): Dictionary of keyword fields to filter by.
+            num_results (int): The number of top results to return. Defaults to 10.
+
+        Returns:
+            tuple: The row ids of the top documents and their scores ((1 + cosine) / 2), best first.
+        """
+        return self.search_batch(query_vector, filter_dict, num_results)[0]
+
+    def save(self, path, with_docs=True):
+        """
+        Saves the fitted index to a directory: the arrays as ``.npy`` files, settings as
+        JSON and the documents as JSON lines. The directory is written next to path
+        first and renamed into place.
+
+        Args:
+            path (str): Directory to save the index to. Replaced if it exists.
+            with_docs (bool): Save the documents too. Leave them out when they live in a DocStore.
+        """
+        tmp_path = f'{path}.tmp'
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+
+        meta = {
+            'dtype': self.dtype,
+            'method': self.method,
+            'nlist': self.nlist,
+            'nprobe': self.nprobe,
+            'keyword_fields': self.keyword_fields,
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+        arrays = {
+            'matrix': self.matrix,
+            'scales': self.scales,
+            'centroids': self.centroids,
+            'list_ids': self.list_ids,
+            'list_offsets': self.list_offsets,
+        }
+        for name, array in arrays.items():
+            if array is not None:
+                np.save(os.path.join(tmp_path, f'{name}.npy'), array)
+
+        if with_docs:
+            with open(os.path.join(tmp_path, 'docs.jsonl'), 'w') as f:
+                for doc in self.docs:
+                    f.write(json.dumps(doc, default=str) + '\n')
+
+        shutil.rmtree(path, ignore_errors=True)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, mmap=True, docs=None):
+        """
+        Loads an index saved with save(). The arrays are memory-mapped by default,
+        so several processes share one copy through the page cache.
+
+        Args:
+            path (str): Directory the index was saved to.
+            mmap (bool): Memory-map the arrays instead of reading them into memory.
+            docs (list or DocStore, optional): Documents of an index saved without them.
+
+        Returns:
+            VectorIndex: The loaded index, ready to search.
+        """
+        with open(os.path.join(path, 'meta.json')) as f:
+            meta = json.load(f)
+
+        index = cls(meta['dtype'], meta['method'], meta['nlist'], meta['nprobe'], meta['keyword_fields'])
+        for name in ('matrix', 'scales', 'centroids', 'list_ids', 'list_offsets'):
+            array_file = os.path.join(path, f'{name}.npy')
+            if os.path.exists(array_file):
+                setattr(index, name, np.load(array_file, mmap_mode='r' if mmap else None))
+
+        if docs is None:
+            with open(os.path.join(path, 'docs.jsonl')) as f:
+                docs = [json.loads(line) for line in f]
+        index.docs = docs
+        index._encode_keywords()
+        return index
+
+
+def to_es_response(index, doc_ids, scores, took):
+    """
+    Wraps a VectorIndex result in the shape of an Elasticsearch search response,
+    so it can be parsed like a kNN search result.
+
+    Args:
+        index (VectorIndex): The index that was searched.
+        doc_ids (np.ndarray): Row ids of the top documents, best first.
+        scores (np.ndarray): Their scores, on Elasticsearch's scale already.
+        took (int): Search time in ms.
+
+    Returns:
+        dict: Response with ``took`` and ``hits`` (total, max_score and the hits with _id, _score and _source).
+        A hit's _id is its document's ``id``, or its row id if the document has none.
+    """
+    hits = []
+    for doc_id, score in zip(doc_ids, scores):
+        doc = index.docs[doc_id]
+        hits.append({'_id': str(doc.get('id', doc_id)), '_score': float(score), '_source': doc})
+    return {
+        'took': took,
+        'hits': {
+            'total': {'value': len(hits)},
+            'max_score': hits[0]['_score'] if hits else None,
+            'hits': hits,
+        },
+    }
@@ -1,186 +1,247 @@
 # vectorpipeline.py
 
 import os
-import pandas as pd
-from elasticsearch import Elasticsearch
-from tqdm import tqdm
-from transformers import T5Tokenizer, T5ForConditionalGeneration
-from src.constants import model_name,index_name, embedding_model, embedding_size
-from sentence_transformers import SentenceTransformer
-
-class VecSearchRAGPipeline:
-    def __init__(self): 
-        self.query = None
-        self.response = None
-        self.tokenizer = T5Tokenizer.from_pretrained(model_name)
-        self.model = T5ForConditionalGeneration.from_pretrained(model_name)
-        self.es = Elasticsearch("http://elasticsearch:9200")
-        self.emb_model = SentenceTransformer(embedding_model,truncate_dim=embedding_size) 
-        self.data_dict = None
-
-    def read_data(self):
-        """
-        Reads data from csv file and converts it into list of dictionaries.
-        Additionally, generates vector embeddings for the question and answer
-        using the SentenceTransformer model and adds them to the dictionary.
+import time
+from itertools import chain
+
+from src.constants import (
+    vector_index_alias,
+    embedding_model,
+    embedding_size,
+    model_name,
+    knn_min_candidates,
+    vector_backend,
+    vector_index_dir,
+    vector_index_dtype,
+    vector_index_method,
+    ann_min_docs,
+    ivf_nprobe,
+)
+from src.espipeline import parse_es_results
+from src.indexmanager import IndexManager, schema_hash
+from src.ingest import BulkIngestor, make_actions, delete_actions, failed_ids
+from src.ragpipeline import RAGPipeline
+from src.sync import sync_documents
+
+def knn_query(query_vector, num_results):
+    """
+    Builds the kNN search body for a query embedding. Each shard considers
+    at least ten candidates per requested result, and never fewer than
+    knn_min_candidates, so approximate search keeps a high recall.
+
+    Args:
+        query_vector (np.ndarray): Embedding of the search query.
+        num_results (int): The number of top results to return.
+
+    Returns:
+        dict: Search body with size and knn.
+    """
+    return {
+        "size": num_results,
+        "knn": {
+            "field": "question_answer_vector",
+            "query_vector": query_vector.tolist(),
+            "k": num_results,
+            "num_candidates": max(num_results * 10, knn_min_candidates),
+        },
+    }
+
+
+class VecSearchRAGPipeline(RAGPipeline):
+    """
+    RAG pipeline on kNN search over the question and answer embeddings.
+
+    The ``backend`` decides where the kNN search runs: 'elasticsearch' queries
+    the vector index alias, 'local' searches an in-process VectorIndex over the
+    shared DocStore. Both return the same result shape.
+    """
+
+    search_type = 'Vector'
+    embeds_queries = True
+
+    prompt_template = """
+            You're a data science expert and assistant.
+            Provide concise and complete answers to the questions based on the context given below.
+            QUESTION: {question}
+
+            CONTEXT:
+            {response}
+            """.strip()
+
+    def __init__(self, backend=vector_backend):
+        super().__init__()
+        if backend not in ('elasticsearch', 'local'):
+            raise ValueError(f"Unknown vector backend '{backend}', expected 'elasticsearch' or 'local'")
+        self.backend = backend
+        self.es = None
+        if backend == 'elasticsearch':
+            from elasticsearch import Elasticsearch
+
+            self.es = Elasticsearch("http://elasticsearch:9200")
+        self.ingest_report = None
+        self.vector_index = None
+        self.store = None
+
+    def add_vectors(self, docs):
         """
-        
-        print('[DEBUG] Reading data...')
-        # Read data into dataframe 
-        data_file_path = os.path.join('data', 'data.csv')
-        df = pd.read_csv(data_file_path).dropna()
+        Adds the question and answer embedding of each document as ``question_answer_vector``.
+        Embeddings already in the on-disk cache are not recomputed.
 
-        # Convert dataframe to list of dictionaries
-        data_dict = df.to_dict(orient="records")
+        Args:
+            docs (list of dict): Documents to embed, updated in place.
+        """
+        from src.embeddings import BatchEncoder
 
         print('[DEBUG] Generating vector embeddings...')
-        # Add answer and question vector embeddings
-        vector_data_dict = []
-        for data in tqdm(data_dict):
-            question_answer = data['question'] + ' ' + data['answer']
-            data['question_answer_vector'] = self.emb_model.encode(question_answer)
-            vector_data_dict.append(data)
-        self.data_dict = vector_data_dict
+        # Encoded in batches and cached on disk
+        vectors = BatchEncoder().encode([doc['question'] + ' ' + doc['answer'] for doc in docs])
+        for doc, vector in zip(docs, vectors):
+            doc['question_answer_vector'] = vector
     
     def create_index(self):
         """
-        Creates an Elasticsearch index with the specified settings and mappings,
-        and adds data from the data_dict to the index.
+        Makes sure the vector index alias points at an index with the current
+        mappings and embedding model, building it when one of them changed, and
+        applies the rows of the data file that changed since the last sync. Only
+        those rows are embedded.
 
         :return: None
         """
+        if self.backend == 'local':
+            self.create_vector_index()
+            return
+
         print('\n\n[[DEBUG] Creating Index...')
-        index_settings={
-            "settings": {
-                    "number_of_shards": 1,
-                    "number_of_replicas": 0
-            },
-            "mappings": {
-                "properties": {
-                "question": {"type": "text"},
-                "answer": {"type": "text"}, 
-                "topic": {"type": "text"}, 
-                "question_answer_vector": {"type": "dense_vector", "dims": embedding_size, "index": True, "similarity": "cosine"},
-                }
+        settings = {
+            "number_of_shards": 1,
+            "number_of_replicas": 0
+        }
+        mappings = {
+            "properties": {
+            "question": {"type": "text"},
+            "answer": {"type": "text"}, 
+            "topic": {"type": "text"}, 
+            "question_answer_vector": {"type": "dense_vector", "dims": embedding_size, "index": True, "similarity": "cosine"},
+            # Stored for prompt building only, never searched
+            "answer_ids": {"type": "integer", "index": False, "doc_values": False},
             }
         }
-        
-        # Create Index and delete if it already exists
-        self.es.indices.delete(index=index_name, ignore_unavailable=True)
-        self.es.indices.create(index=index_name, body = index_settings)
 
-        # Add Data to Index using index()
-        print('\n\n[[DEBUG] Adding data to index...')
-        for i in tqdm(range(len(self.data_dict))):
-            row = self.data_dict[i]
-            self.es.index(index=index_name, id=i, document=row)
+        manager = IndexManager(self.es, vector_index_alias, mappings,
+                               settings=settings, extra=(embedding_model, embedding_size, model_name))
+        self.sync_report = None
+        self.index_version = manager.ensure_index(self.add_documents)
+        if self.sync_report is None:
+            # The index already existed: apply only what changed
+            self.sync_report = sync_documents(self.index_version, self.apply_changes(self.index_version))
 
-        # helpers.bulk(es, data_dict)
-
-    def search(self, query, num_results):
+    def create_vector_index(self):
         """
-        Retrieves results from the index based on the query.
-
-        Args: 
-            query (str): The search query string.
-            num_results (int): The number of top results to return.
+        Syncs the doc store with the data file and sets up the in-process vector
+        index over its embedding matrix. An exact float32 index searches the
+        store's memory-mapped matrix in place; IVF and int8 indices are loaded
+        for the current store version, or fitted and saved if there is none yet.
+        The index holds no documents of its own: searches return store rows.
 
-        Returns:
-            list of str: List of results matching the search criteria, ranked by relevance.
+        :return: None
         """
-        # Retrieve Search Results
-        print('\n\n[[DEBUG] Retrieving Search Results...') 
-        query_vector = self.emb_model.encode(query)
-        knn_query = {
-            "field": "question_answer_vector",
-            "query_vector": query_vector,
-            "k": num_results,
-            "num_candidates": 5
-        }
-
-        results = self.es.search(index=index_name, knn=knn_query, size = num_results)
-
-        time_taken = results['took']
-        relevance_score = results['hits']['max_score']
-        total_hits = results['hits']['total']['value']
-        topic = results['hits']['hits'][0]['_source']['topic']
-        result_docs = [hit['_source'] for hit in results['hits']['hits']] 
-
-        response = [result['answer'] for result in result_docs]
- 
-        return response, time_taken, relevance_score, total_hits, topic
-    
-    def generate_prompt(self, query, response):
+        from src.docstore import open_docstore, remove_stale
+        from src.vectorindex import VectorIndex
+
+        self.store, self.sync_report = open_docstore(self.add_answer_ids, with_embeddings=True)
+
+        method = vector_index_method
+        if method == 'auto':
+            method = 'ivf' if len(self.store) >= ann_min_docs else 'exact'
+        schema = schema_hash(embedding_model, embedding_size, model_name, VectorIndex.format_version,
+                             vector_index_dtype, method, ivf_nprobe)
+        self.index_version = f'{schema}-{self.store.version}'
+
+        if method == 'exact' and vector_index_dtype == 'float32':
+            self.vector_index = VectorIndex().fit(self.store.embeddings, self.store, normalized=True)
+            return
+
+        index_path = os.path.join(vector_index_dir, self.index_version)
+        if os.path.exists(index_path):
+            print('[DEBUG] Loading Vector Index...')
+            self.vector_index = VectorIndex.load(index_path, docs=self.store)
+            return
+
+        print(f'[DEBUG] Creating {method} Vector Index...')
+        self.vector_index = VectorIndex(vector_index_dtype, method, nprobe=ivf_nprobe).fit(
+            self.store.embeddings, self.store, normalized=True)
+        self.vector_index.save(index_path, with_docs=False)
+        remove_stale(vector_index_dir, f'{schema}-', self.index_version)
+
+    def add_documents(self, index):
         """
-        Generates a prompt for the LLM based on the query and response.
+        Adds all documents to a new index, streamed from the data file.
 
         Args:
-            query (str): The search query string.
-            response (str): The response from the retrieval model.
-
-        Returns:
-            str: The prompt to be sent to the LLM.
+            index (str): Name of the concrete index to add documents to.
         """
+        # Add Data to Index in bulk batches
+        print('\n\n[[DEBUG] Adding data to index...')
+        self.sync_report = sync_documents(index, self.apply_changes(index), rebuild=True)
 
-        prompt_template = """
-            You're a data science expert and assistant.
-            Provide concise and complete answers to the questions based on the context given below.
-            QUESTION: {question}
-
-            CONTEXT: 
-            {response}
-            """.strip()
-
-        prompt = prompt_template.format(question=query, response=response)
-        return prompt
-    
-    def generate_response(self, prompt): 
+    def apply_changes(self, index):
         """
-        Generates a response using the LLM based on the given prompt.
+        Returns a function that applies document changes to index in bulk batches.
+        Only the upserted documents are embedded and tokenized, one chunk at a
+        time as the bulk requests consume them, so the vectors of a single chunk
+        are in memory at once.
 
         Args:
-            prompt (str): The prompt to generate a response for.
+            index (str): Name of the concrete index.
 
         Returns:
-            str: The generated response from the LLM.
+            callable: Takes the chunks of documents to upsert and the ids to delete, and
+            returns the ids of the documents that failed.
         """
-
-        print('[DEBUG] Generating LLM response...')
-        inputs = self.tokenizer(
-            prompt, 
-            return_tensors="pt", 
-            max_length=512, 
-            truncation=True, 
-            padding='max_length'
-        )
-
-        # Generate Response
-        outputs = self.model.generate(
-            **inputs,
-            max_new_tokens=1024,
-            min_length=100,
-            no_repeat_ngram_size=3,
-            do_sample=True, 
-            num_beams=4,        
-            early_stopping = True # Stop once all beams are finished  
-        )
-        
-        llm_response = self.tokenizer.decode(outputs[0], skip_special_tokens=True)
-        
-        return llm_response
-    
-    def get_response(self,query, num_results=3):
+        def prepared(upsert_chunks):
+            for chunk in upsert_chunks:
+                self.add_vectors(chunk)
+                # Pre-tokenize answers so prompts are built from stored token ids
+                self.add_answer_ids(chunk)
+                yield from chunk
+
+        def apply(upsert_chunks, deletes):
+            actions = chain(make_actions(prepared(upsert_chunks), id_field='id'), delete_actions(deletes))
+            self.ingest_report = BulkIngestor(self.es).ingest(index, actions)
+            return failed_ids(self.ingest_report)
+        return apply
+
+    def search_batch(self, queries, num_results, query_vectors=None):
         """
-        Retrieves and generates a response for a given query.
+        Retrieves results for several queries. All query embeddings are encoded
+        in one call; the kNN searches are sent in a single msearch request, or
+        scored together against the local vector index.
 
-        Args:
-            query (str): The search query string.
-            num_results (int, optional): The number of top results to return. Defaults to 5.
+        Args: 
+            queries (list of str): The search query strings.
+            num_results (int): The number of top results to return per query.
+            query_vectors (np.ndarray, optional): Query embeddings, if already computed.
 
         Returns:
-            str: The generated response from the LLM.
-        """ 
-        results, time_taken, total_hits, relevance_score, topic  = self.search(query, num_results)
-        prompt = self.generate_prompt(query, results)
-        llm_response = self.generate_response(prompt)
-        return llm_response, time_taken, total_hits, relevance_score , topic
\ No newline at end of file
+            list of dict: One retrieval result per query, ranked by relevance, in input order.
+        """
+        # Retrieve Search Results
+        print('\n\n[[DEBUG] Retrieving Search Results...') 
+        if query_vectors is None:
+            query_vectors = self.embed_queries(queries)
+
+        if self.backend == 'local':
+            if self.vector_index is None:
+                self.create_vector_index()
+            start_time = time.time()
+            results = self.vector_index.search_batch(query_vectors, num_results=num_results)
+            took = int((time.time() - start_time) * 1000)
+            return [self.store.retrieval(rows, scores, took) for rows, scores in results]
+
+        searches = []
+        for query_vector in query_vectors:
+            searches.append({"index": vector_index_alias})
+            searches.append(knn_query(query_vector, num_results))
+        results = self.es.msearch(searches=searches)
+
+        return [parse_es_results(result) for result in results['responses']]
@@ -0,0 +1,84 @@
+# test_db.py
+
+import pytest
+
+from src.db import MIGRATIONS, migrate
+
+
+class FakeConnection:
+    """Records the statements and transaction boundaries of a psycopg2 connection."""
+
+    def __init__(self, applied=(), fail_on=None):
+        self.applied = list(applied)
+        self.fail_on = fail_on
+        self.log = []
+        self.closed = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.log.append('COMMIT')
+
+    def rollback(self):
+        self.log.append('ROLLBACK')
+
+
+class FakeCursor:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, statement, params=None):
+        statement = ' '.join(statement.split())
+        if self.conn.fail_on and self.conn.fail_on in statement:
+            raise RuntimeError(f'failed: {statement}')
+        self.conn.log.append(statement)
+
+    def fetchall(self):
+        return [(version,) for version in self.conn.applied]
+
+
+def versions_committed(log):
+    """Returns the migration versions whose INSERT was followed by a commit."""
+    committed, pending = [], None
+    for entry in log:
+        if entry.startswith('INSERT INTO schema_migrations'):
+            pending = len(committed) + 1
+        elif entry == 'COMMIT' and pending is not None:
+            committed.append(pending)
+            pending = None
+    return committed
+
+
+def test_lock_is_taken_before_any_ddl_and_released():
+    conn = FakeConnection()
+    migrate(conn)
+    assert conn.log[0].startswith('SELECT pg_advisory_lock')
+    assert conn.log[1].startswith('CREATE TABLE IF NOT EXISTS schema_migrations')
+    assert any(entry.startswith('SELECT pg_advisory_unlock') for entry in conn.log[-3:])
+
+
+def test_each_version_is_committed_on_its_own():
+    conn = FakeConnection()
+    migrate(conn)
+    assert versions_committed(conn.log) == [version for version, _ in MIGRATIONS]
+
+
+def test_applied_versions_are_skipped():
+    conn = FakeConnection(applied=[version for version, _ in MIGRATIONS])
+    migrate(conn)
+    assert not any(entry.startswith('INSERT INTO schema_migrations') for entry in conn.log)
+
+
+def test_failed_migration_keeps_earlier_versions_and_releases_the_lock():
+    conn = FakeConnection(fail_on='feedback_summary')
+    with pytest.raises(RuntimeError):
+        migrate(conn)
+    assert versions_committed(conn.log) == [1, 2, 3]
+    assert conn.log[-3:] == ['ROLLBACK', "SELECT pg_advisory_unlock(hashtext(%s))", 'COMMIT']
@@ -0,0 +1,89 @@
+# test_docstore.py
+
+import numpy as np
+import pytest
+
+from src import docstore
+from src.constants import embedding_size
+from src.docstore import DocStore, open_docstore
+
+
+def make_docs():
+    return [
+        {'id': f'd{i}', 'question': f'Question {i}?', 'answer': f'Answer {i} é.', 'topic': ['ML', 'SQL'][i % 2]}
+        for i in range(5)
+    ]
+
+
+def add_answer_ids(docs):
+    for doc in docs:
+        doc['answer_ids'] = [len(doc['answer']), 1]
+
+
+class FakeEncoder:
+    """Deterministic stand-in for the SentenceTransformer-backed BatchEncoder."""
+
+    calls = []
+
+    def encode(self, texts):
+        FakeEncoder.calls.append(list(texts))
+        vectors = np.zeros((len(texts), embedding_size), dtype=np.float32)
+        for i, text in enumerate(texts):
+            vectors[i, sum(map(ord, text)) % embedding_size] = 2.0
+        return vectors
+
+
+@pytest.fixture
+def store_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(docstore, '_stores', {})
+    monkeypatch.setattr('src.embeddings.BatchEncoder', FakeEncoder)
+    FakeEncoder.calls = []
+    return tmp_path
+
+
+def test_store_round_trips_documents(store_dir):
+    store, report = open_docstore(add_answer_ids, chunks=[make_docs()])
+    assert report['upserted'] == 5
+    assert len(store) == 5
+    assert {doc['id']: doc for doc in store}['d3'] == dict(make_docs()[3], answer_ids=[len('Answer 3 é.'), 1])
+    assert store.topic_values == ['ML', 'SQL']
+    assert store.embeddings is None
+    assert FakeEncoder.calls == []
+
+
+def test_sync_copies_unchanged_rows_and_appends_changes(store_dir):
+    store, _ = open_docstore(add_answer_ids, chunks=[make_docs()])
+    first_version = store.version
+
+    docs = make_docs()
+    docs[2]['answer'] = 'Edited.'
+    docs[4]['topic'] = 'Stats'
+    del docs[0]
+    store, report = open_docstore(add_answer_ids, refresh=True, chunks=[docs])
+
+    assert (report['upserted'], report['deleted'], report['unchanged']) == (2, 1, 2)
+    assert store.version != first_version
+    assert sorted(store, key=lambda doc: doc['id']) == sorted(
+        [dict(doc, answer_ids=[len(doc['answer']), 1]) for doc in docs], key=lambda doc: doc['id'])
+    assert store.topic_values == ['ML', 'SQL', 'Stats']
+
+
+def test_embeddings_are_added_on_demand_and_kept_on_sync(store_dir):
+    open_docstore(add_answer_ids, chunks=[make_docs()])
+    store, _ = open_docstore(add_answer_ids, with_embeddings=True, chunks=[make_docs()])
+    assert store.embeddings.shape == (5, embedding_size)
+    assert np.allclose(np.linalg.norm(store.embeddings, axis=1), 1)
+    assert len(FakeEncoder.calls) == 1
+
+    docs = make_docs()
+    docs[1]['answer'] = 'Edited.'
+    store, _ = open_docstore(add_answer_ids, refresh=True, with_embeddings=True, chunks=[docs])
+    # Only the changed document is embedded again
+    assert FakeEncoder.calls[-1] == ['Question 1? Edited.']
+    rows = {doc_id: row for row, doc_id in enumerate(store.column('id'))}
+    assert np.allclose(store.embeddings[rows['d1']], FakeEncoder().encode(['Question 1? Edited.'])[0] / 2)
+
+    reloaded = DocStore.load(store.path)
+    assert reloaded.version == store.version
+    assert np.array_equal(reloaded.embeddings, store.embeddings)
@@ -0,0 +1,78 @@
+# test_embeddings.py
+
+import os
+
+import numpy as np
+import pytest
+
+from src import embeddings
+from src.embeddings import BatchEncoder
+
+
+class CountingEncoder(BatchEncoder):
+    """BatchEncoder whose model is replaced by a deterministic function of the text."""
+
+    def __init__(self, cache_dir, max_shards=16):
+        super().__init__(model_name='test-model', dim=4, cache_dir=cache_dir, max_shards=max_shards)
+        self.encoded = []
+
+    def encode_batched(self, texts):
+        self.encoded.extend(texts)
+        return np.array([[len(text), text.count('a'), 1, 0] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture(autouse=True)
+def fresh_indices(monkeypatch):
+    monkeypatch.setattr(embeddings, '_indices', {})
+
+
+def shards(encoder):
+    return sorted(name for name in os.listdir(encoder.cache_path) if name.endswith('.keys.npy'))
+
+
+def test_only_missing_texts_are_encoded_and_appended(tmp_path):
+    encoder = CountingEncoder(str(tmp_path))
+    first = encoder.encode(['a', 'bb', 'a'])
+    second = encoder.encode(['bb', 'ccc', 'aaaa'])
+
+    assert encoder.encoded == ['a', 'bb', 'ccc', 'aaaa']
+    assert np.array_equal(first[:, 0], [1, 2, 1])
+    assert np.array_equal(second[:, 0], [2, 3, 4])
+    assert len(shards(encoder)) == 2
+    # The second shard holds only the two new rows
+    new_shard = shards(encoder)[1].replace('.keys.npy', '.vectors.npy')
+    assert np.load(os.path.join(encoder.cache_path, new_shard)).shape == (2, 4)
+
+
+def test_cache_is_shared_across_processes_through_disk(tmp_path, monkeypatch):
+    CountingEncoder(str(tmp_path)).encode(['a', 'bb'])
+    monkeypatch.setattr(embeddings, '_indices', {})
+    encoder = CountingEncoder(str(tmp_path))
+    vectors = encoder.encode(['a', 'bb'])
+    assert encoder.encoded == []
+    assert isinstance(vectors, np.memmap)
+
+
+def test_compact_merges_shards_and_evicts_dead_keys(tmp_path):
+    encoder = CountingEncoder(str(tmp_path))
+    for text in ['a', 'bb', 'ccc']:
+        encoder.encode([text])
+    assert len(shards(encoder)) == 3
+
+    assert encoder.compact(['a', 'ccc']) == {'kept': 2, 'evicted': 1}
+    assert len(shards(encoder)) == 1
+    vectors = encoder.encode(['ccc', 'a'])
+    assert encoder.encoded == ['a', 'bb', 'ccc']
+    assert np.array_equal(vectors[:, 0], [3, 1])
+    encoder.encode(['bb'])
+    assert encoder.encoded[-1] == 'bb'
+
+
+def test_shards_are_merged_past_the_limit(tmp_path):
+    encoder = CountingEncoder(str(tmp_path), max_shards=2)
+    for text in ['a', 'bb', 'ccc']:
+        vectors = encoder.encode([text])
+    assert vectors[0, 0] == 3
+    assert len(shards(encoder)) == 1
+    assert np.array_equal(encoder.encode(['a', 'bb', 'ccc'])[:, 0], [1, 2, 3])
+
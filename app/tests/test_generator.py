@@ -0,0 +1,63 @@
+# test_generator.py
+
+import threading
+
+import pytest
+
+torch = pytest.importorskip('torch')
+pytest.importorskip('transformers')
+
+from src import generator as generator_module
+from src.generator import Generator
+
+
+class FailingModel:
+    """Model whose generate() fails before producing a token."""
+
+    def generate(self, streamer=None, **kwargs):
+        raise RuntimeError('out of memory')
+
+
+class StalledModel:
+    """Model whose generate() never produces a token until released."""
+
+    def __init__(self):
+        self.release = threading.Event()
+
+    def generate(self, streamer=None, **kwargs):
+        self.release.wait(5)
+        streamer.end()
+
+
+class StubGenerator(Generator):
+    """Generator over a stub model, fed prompts that are already token ids."""
+
+    tokenizer = None
+
+    def __init__(self, model):
+        super().__init__()
+        self.stub_model = model
+
+    @property
+    def model(self):
+        return self.stub_model
+
+    def encode(self, batch_input_ids):
+        return None, {'input_ids': torch.tensor(batch_input_ids), 'attention_mask': None}
+
+
+def test_stream_reraises_generation_errors():
+    gen = StubGenerator(FailingModel())
+    with pytest.raises(RuntimeError, match='out of memory'):
+        list(gen.stream([1, 2, 3], profile='fast'))
+
+
+def test_stream_times_out_when_no_token_arrives(monkeypatch):
+    monkeypatch.setattr(generator_module, 'stream_token_timeout', 0.05)
+    model = StalledModel()
+    gen = StubGenerator(model)
+    try:
+        with pytest.raises(TimeoutError):
+            list(gen.stream([1, 2, 3], profile='fast'))
+    finally:
+        model.release.set()
@@ -0,0 +1,86 @@
+# test_hybridpipeline.py
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from src.hybridpipeline import HybridSearchRAGPipeline, rrf_fuse, weighted_fuse
+
+
+def test_rrf_sums_reciprocal_ranks():
+    text = [('a', 12.0), ('b', 7.0), ('c', 1.0)]
+    knn = [('b', 0.9), ('d', 0.8)]
+    fused = dict(rrf_fuse([text, knn], k=60))
+    assert fused['a'] == pytest.approx(1 / 61)
+    assert fused['b'] == pytest.approx(1 / 62 + 1 / 61)
+    assert fused['c'] == pytest.approx(1 / 63)
+    assert fused['d'] == pytest.approx(1 / 62)
+
+
+def test_rrf_ranks_documents_found_by_both_first():
+    text = [('a', 12.0), ('b', 7.0)]
+    knn = [('c', 0.9), ('b', 0.8)]
+    assert [doc_id for doc_id, _ in rrf_fuse([text, knn])] == ['b', 'a', 'c']
+
+
+def test_rrf_ignores_score_scales():
+    text = [('a', 1000.0), ('b', 0.001)]
+    knn = [('b', 0.99), ('a', 0.98)]
+    fused = dict(rrf_fuse([text, knn]))
+    assert fused['a'] == pytest.approx(fused['b'])
+
+
+def test_rrf_of_empty_rankings():
+    assert rrf_fuse([[], []]) == []
+
+
+def test_weighted_fusion_normalizes_each_ranking():
+    text = [('a', 20.0), ('b', 10.0)]
+    knn = [('b', 0.9), ('c', 0.5)]
+    fused = dict(weighted_fuse([text, knn], [0.25, 0.75]))
+    assert fused == pytest.approx({'a': 0.25, 'b': 0.75, 'c': 0.0})
+
+
+def test_weighted_fusion_skips_empty_rankings():
+    assert weighted_fuse([[], [('a', 0.5)]], [0.5, 0.5]) == [('a', 0.5)]
+
+
+def test_pipeline_fuses_with_the_configured_method():
+    text = [('a', 20.0), ('b', 10.0)]
+    knn = [('b', 0.9), ('c', 0.5)]
+    rrf = HybridSearchRAGPipeline(fusion='rrf', backend='local')
+    weighted = HybridSearchRAGPipeline(fusion='weighted', text_weight=1.0, backend='local')
+    assert rrf.fuse(text, knn)[0][0] == 'b'
+    assert weighted.fuse(text, knn)[0][0] == 'a'
+
+
+def test_unknown_fusion_method_is_rejected():
+    with pytest.raises(ValueError, match='Unknown fusion method'):
+        HybridSearchRAGPipeline(fusion='max', backend='local')
+
+
+class FakeElasticsearch:
+    """Answers msearch with fixed text and kNN hits, one pair of responses per query."""
+
+    def __init__(self, text_hits, knn_hits):
+        self.text_hits = text_hits
+        self.knn_hits = knn_hits
+
+    def msearch(self, searches):
+        responses = []
+        for _ in range(len(searches) // 4):
+            for hits in (self.text_hits, self.knn_hits):
+                responses.append({'hits': {'hits': [
+                    {'_id': doc_id, '_score': score, '_source': {'answer': f'answer {doc_id}', 'answer_ids': [1], 'topic': 'ML'}}
+                    for doc_id, score in hits]}})
+        return {'responses': responses}
+
+
+def test_elasticsearch_results_carry_the_hit_ids():
+    np = pytest.importorskip('numpy')
+    pipeline = HybridSearchRAGPipeline(fusion='rrf', backend='local')
+    pipeline.es = FakeElasticsearch([('34a96b07', 12.0), ('5d1c0e2f', 7.0)], [('5d1c0e2f', 0.9)])
+    retrieval, = pipeline.search_batch(['what is overfitting?'], num_results=2,
+                                       query_vectors=np.zeros((1, 4), dtype=np.float32))
+    assert retrieval['ids'] == ['5d1c0e2f', '34a96b07']
+    assert retrieval['answers'] == ['answer 5d1c0e2f', 'answer 34a96b07']
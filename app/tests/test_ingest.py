@@ -0,0 +1,116 @@
+# test_ingest.py
+
+import json
+
+import pytest
+
+pytest.importorskip('elasticsearch')
+
+from elastic_transport import ApiResponseMeta, BaseNode, HttpHeaders
+from elastic_transport._node._base import NodeApiResponse
+from elasticsearch import Elasticsearch
+
+from src.ingest import BulkIngestor, delete_actions, failed_ids, make_actions
+
+
+class FakeNode(BaseNode):
+    """
+    Elasticsearch node answered in-process: index settings, refresh and bulk
+    requests are recorded, and bulk items are answered per document with the
+    status from ``statuses`` (201 by default).
+    """
+
+    requests = []
+    statuses = {}
+    refresh_interval = '5s'
+
+    def perform_request(self, method, target, body=None, headers=None, request_timeout=None):
+        path = target.split('?')[0]
+        FakeNode.requests.append((method, path, body))
+        if path.endswith('/_bulk'):
+            response, status = self._bulk(path.split('/')[1], body), 200
+        elif path.endswith('/_settings') and method == 'GET':
+            index = path.split('/')[1]
+            response, status = {index: {'settings': {'index': {'refresh_interval': FakeNode.refresh_interval}}}}, 200
+        else:
+            response, status = {'acknowledged': True}, 200
+        meta = ApiResponseMeta(
+            status=status, http_version='1.1', duration=0.0, node=self.config,
+            headers=HttpHeaders({'content-type': 'application/json', 'x-elastic-product': 'Elasticsearch'}),
+        )
+        return NodeApiResponse(meta, json.dumps(response).encode('utf-8'))
+
+    def _bulk(self, index, body):
+        lines = [json.loads(line) for line in body.decode('utf-8').splitlines() if line]
+        items = []
+        i = 0
+        while i < len(lines):
+            op_type, action = next(iter(lines[i].items()))
+            i += 1 if op_type == 'delete' else 2
+            statuses = FakeNode.statuses.get(action['_id'], [])
+            # A list of statuses is consumed one per attempt, e.g. [429, 201]
+            status = statuses.pop(0) if statuses else (404 if op_type == 'delete' else 201)
+            item = {'_index': action.get('_index', index), '_id': action['_id'], 'status': status}
+            if status >= 300:
+                item['error'] = {'type': 'test_error', 'reason': f'status {status}'}
+            items.append({op_type: item})
+        return {'took': 1, 'errors': any('error' in next(iter(item.values())) for item in items), 'items': items}
+
+
+@pytest.fixture
+def es():
+    FakeNode.requests = []
+    FakeNode.statuses = {}
+    return Elasticsearch('http://localhost:9200', node_class=FakeNode)
+
+
+def refresh_settings(requests):
+    return [json.loads(body)['index']['refresh_interval'] for method, path, body in requests
+            if method == 'PUT' and path.endswith('/_settings')]
+
+
+def make_docs(count):
+    return [{'id': f'd{i}', 'question': f'q{i}', 'answer': f'a{i}', 'topic': 't'} for i in range(count)]
+
+
+def test_ingest_streams_batches_and_restores_refresh(es):
+    ingestor = BulkIngestor(es, chunk_size=4, thread_count=2, initial_backoff=0)
+    report = ingestor.ingest('idx', make_actions(make_docs(10), id_field='id'))
+
+    assert (report['indexed'], report['failed']) == (10, 0)
+    assert [batch['indexed'] for batch in report['batches']] == [4, 4, 2]
+    assert refresh_settings(FakeNode.requests) == ['-1', '5s']
+    assert FakeNode.requests[-1][:2] == ('POST', '/idx/_refresh')
+
+
+def test_ingest_retries_429_and_reports_failures(es):
+    FakeNode.statuses = {'d1': [429, 201], 'd2': [400]}
+    ingestor = BulkIngestor(es, chunk_size=5, thread_count=1, initial_backoff=0)
+    report = ingestor.ingest('idx', make_actions(make_docs(5), id_field='id'))
+
+    assert (report['indexed'], report['failed']) == (4, 1)
+    assert report['batches'][0]['errors'][0]['index']['_id'] == 'd2'
+    assert failed_ids(report) == {'d2'}
+
+
+def test_deleting_a_missing_document_is_not_a_failure(es):
+    report = BulkIngestor(es, chunk_size=5).ingest('idx', delete_actions(['gone']))
+    assert (report['indexed'], report['failed']) == (1, 0)
+
+
+def test_refresh_is_restored_when_ingestion_fails(es):
+    FakeNode.refresh_interval = None
+
+    def failing_actions():
+        yield from make_actions(make_docs(3), id_field='id')
+        raise ValueError('bad document')
+
+    try:
+        with pytest.raises(ValueError):
+            BulkIngestor(es, chunk_size=2, thread_count=1).ingest('idx', failing_actions())
+    finally:
+        FakeNode.refresh_interval = '5s'
+
+    # None resets the index to its default refresh interval
+    assert refresh_settings(FakeNode.requests) == ['-1', None]
+    assert FakeNode.requests[-1][:2] == ('POST', '/idx/_refresh')
@@ -0,0 +1,23 @@
+# test_models.py
+
+import importlib.util
+
+import pytest
+
+from src.models import check_backend
+
+
+def test_known_backends_pass():
+    check_backend('torch')
+    check_backend('int8')
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError, match='Unknown generator backend'):
+        check_backend('tensorrt')
+
+
+def test_onnx_without_optimum_names_the_extra(monkeypatch):
+    monkeypatch.setattr(importlib.util, 'find_spec', lambda name: None)
+    with pytest.raises(ImportError, match=r'pip install "\.\[onnx\]"'):
+        check_backend('onnx')
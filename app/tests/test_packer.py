@@ -0,0 +1,63 @@
+# test_packer.py
+
+from src.packer import ContextPacker, jaccard
+
+
+def test_jaccard():
+    assert jaccard({1, 2}, {2, 3}) == 1 / 3
+    assert jaccard(set(), set()) == 1.0
+
+
+def test_passages_are_packed_whole_in_retrieval_order():
+    passages = [[1, 2, 3], [4, 5], [6, 7, 8, 9]]
+    context, used = ContextPacker(min_fragment=100).pack(passages, budget=10)
+    assert used == [0, 1, 2]
+    assert context == [1, 2, 3, 4, 5, 6, 7, 8, 9]
+
+
+def test_scores_decide_the_order():
+    passages = [[1, 2], [3, 4], [5, 6]]
+    context, used = ContextPacker().pack(passages, budget=10, scores=[0.1, 0.9, 0.5])
+    assert used == [1, 2, 0]
+    assert context == [3, 4, 5, 6, 1, 2]
+
+
+def test_near_duplicates_are_dropped():
+    passages = [[1, 2, 3, 4], [1, 2, 3, 4, 4], [5, 6]]
+    _, used = ContextPacker(dedupe_threshold=0.9).pack(passages, budget=20)
+    assert used == [0, 2]
+
+
+def test_passage_that_does_not_fit_is_skipped_for_a_shorter_one():
+    passages = [[1] * 4, [2] * 8, [3] * 3]
+    context, used = ContextPacker(min_fragment=100).pack(passages, budget=8)
+    assert used == [0, 2]
+    assert len(context) == 7
+
+
+def test_best_skipped_passage_fills_the_remaining_room():
+    passages = [[1] * 4, [2] * 10, [3] * 8]
+    context, used = ContextPacker(min_fragment=3).pack(passages, budget=9)
+    assert used == [0, 1]
+    assert context == [1] * 4 + [2] * 5
+
+
+def test_oversized_best_passage_is_cut_to_the_budget():
+    passages = [list(range(50)), [99]]
+    context, used = ContextPacker().pack(passages, budget=10)
+    assert used == [0]
+    assert context == list(range(10))
+
+
+def test_separators_go_between_passages_and_count_against_the_budget():
+    passages = [[1, 2], [3, 4], [5, 6]]
+    context, used = ContextPacker(min_fragment=100).pack(passages, budget=7, separator=[0])
+    assert used == [0, 1]
+    assert context == [1, 2, 0, 3, 4]
+
+
+def test_fragment_is_separated_from_the_passages_before_it():
+    passages = [[1] * 4, [2] * 10]
+    context, used = ContextPacker(min_fragment=3).pack(passages, budget=9, separator=[0])
+    assert used == [0, 1]
+    assert context == [1] * 4 + [0] + [2] * 4
@@ -0,0 +1,62 @@
+# test_ragpipeline.py
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from src.cache import ResponseCache
+from src.ragpipeline import RAGPipeline
+
+
+class KeywordPipeline(RAGPipeline):
+    """Pipeline whose retrieval and generation are answered in-process, without models."""
+
+    search_type = 'Keyword'
+
+    def __init__(self):
+        super().__init__()
+        self.index_version = 'v1'
+        self.generated = []
+        self.prompt_scores = []
+        self.generator.generate_batch = self.generate_batch
+
+    def embed_queries(self, queries):
+        raise AssertionError('a keyword pipeline must not embed queries')
+
+    def search_batch(self, queries, num_results, query_vectors=None):
+        return [{'answers': [f'answer to {query}'], 'scores': [2.0], 'time_taken': 1, 'total_hits': 1,
+                 'relevance_score': 2.0, 'topic': 'ML'} for query in queries]
+
+    def generate_prompt_ids(self, query, response, response_ids=None, scores=None):
+        self.prompt_scores.append(scores)
+        return query
+
+    def generate_batch(self, prompts, profile=None):
+        self.generated.extend(prompts)
+        return [{'response': f'generated for {prompt}', 'decoding_profile': profile} for prompt in prompts]
+
+
+def test_get_response_keeps_its_tuple_shape():
+    pipeline = KeywordPipeline()
+    assert pipeline.get_response('What is SQL?') == ('generated for What is SQL?', 1, 1, 2.0, 'ML')
+    assert pipeline.search('What is SQL?') == (['answer to What is SQL?'], 1, 1, 2.0, 'ML')
+
+
+def test_cache_matches_text_without_embedding_queries():
+    pipeline = KeywordPipeline()
+    pipeline.cache = ResponseCache()
+
+    first = pipeline.get_responses(['What is SQL?', 'What is a join?'])
+    again = pipeline.get_responses(['what is sql', 'What is a view?'])
+
+    assert [result['cache_status'] for result in first] == ['miss', 'miss']
+    assert [result['cache_status'] for result in again] == ['exact', 'miss']
+    assert again[0]['response'] == 'generated for What is SQL?'
+    assert pipeline.generated == ['What is SQL?', 'What is a join?', 'What is a view?']
+
+
+def test_retrieval_scores_reach_the_prompt():
+    pipeline = KeywordPipeline()
+    pipeline.get_responses(['What is SQL?'])
+    pipeline.get_response('What is a join?')
+    assert pipeline.prompt_scores == [[2.0], [2.0]]
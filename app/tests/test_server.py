@@ -0,0 +1,107 @@
+# test_server.py
+
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('numpy')
+
+from src.server import InferenceServer, MicroBatcher, Overloaded
+
+
+class EchoPipeline:
+    """Pipeline stand-in that answers each query with itself and records its batches."""
+
+    def __init__(self, release=None):
+        self.batches = []
+        self.release = release
+
+    def get_responses(self, queries, num_results=3, profile=None):
+        if self.release is not None:
+            self.release.wait(10)
+        self.batches.append((list(queries), num_results, profile))
+        return [{'query': query, 'response': query.upper()} for query in queries]
+
+
+@pytest.fixture
+def executor():
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        yield executor
+
+
+def test_requests_arriving_together_share_a_batch(executor):
+    pipeline = EchoPipeline()
+
+    async def main():
+        batcher = MicroBatcher('Echo', pipeline, executor, max_batch_size=8, max_wait_ms=50)
+        batcher.start()
+        return await asyncio.gather(*(batcher.submit({'query': f'q{i}'}) for i in range(5)))
+
+    results = asyncio.run(main())
+    assert [result['response'] for result in results] == ['Q0', 'Q1', 'Q2', 'Q3', 'Q4']
+    assert pipeline.batches == [(['q0', 'q1', 'q2', 'q3', 'q4'], 3, None)]
+    assert all(result['batch_size'] == 5 and 'batch_stage_ms' in result for result in results)
+    assert not any('stage_ms' in result for result in results)
+
+
+def test_batches_respect_max_size_and_group_by_settings(executor):
+    pipeline = EchoPipeline()
+
+    async def main():
+        batcher = MicroBatcher('Echo', pipeline, executor, max_batch_size=3, max_wait_ms=50)
+        batcher.start()
+        requests = [{'query': f'q{i}', 'num_results': 5 if i == 1 else 3} for i in range(4)]
+        return await asyncio.gather(*(batcher.submit(request) for request in requests))
+
+    asyncio.run(main())
+    assert pipeline.batches == [(['q0', 'q2'], 3, None), (['q1'], 5, None), (['q3'], 3, None)]
+
+
+def test_full_queue_is_refused(executor):
+    release = threading.Event()
+    pipeline = EchoPipeline(release)
+
+    async def main():
+        batcher = MicroBatcher('Echo', pipeline, executor, max_batch_size=1, max_wait_ms=0, queue_size=1)
+        batcher.start()
+        first = asyncio.ensure_future(batcher.submit({'query': 'first'}))
+        # Let the batcher take the first request, which then blocks in the pipeline
+        while batcher.stats['batches'] == 0:
+            await asyncio.sleep(0.01)
+        second = asyncio.ensure_future(batcher.submit({'query': 'second'}))
+        await asyncio.sleep(0.01)
+        with pytest.raises(Overloaded):
+            await batcher.submit({'query': 'third'})
+        release.set()
+        return await asyncio.gather(first, second), batcher.stats
+
+    results, stats = asyncio.run(main())
+    assert [result['response'] for result in results] == ['FIRST', 'SECOND']
+    assert stats['rejected'] == 1
+
+
+def test_invalid_requests_get_400(executor):
+    async def main():
+        batcher = MicroBatcher('Echo', EchoPipeline(), executor)
+        batcher.start()
+        server = InferenceServer({'Echo': batcher})
+        bodies = [b'not json', b'{}', b'{"query": ""}', b'{"query": "q", "num_results": "three"}',
+                  b'{"query": "q", "num_results": 0}', b'{"query": "q", "profile": "unknown"}',
+                  b'{"query": "q", "num_results": 2}']
+        return [await server._answer(body) for body in bodies]
+
+    statuses = [status for status, _ in asyncio.run(main())]
+    assert statuses == [400, 400, 400, 400, 400, 400, 200]
+
+
+def test_unknown_search_type_gets_404(executor):
+    async def main():
+        batcher = MicroBatcher('Echo', EchoPipeline(), executor)
+        batcher.start()
+        server = InferenceServer({'Echo': batcher})
+        return await server._answer(json.dumps({'query': 'q', 'search_type': 'Other'}).encode())
+
+    assert asyncio.run(main())[0] == 404
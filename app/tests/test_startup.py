@@ -0,0 +1,35 @@
+# test_startup.py
+
+import os
+
+import pytest
+
+from src.benchmarks.startup import app_imports, measure_imports
+from src.constants import startup_budget_ms
+
+APP_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@pytest.fixture
+def app_import_run(monkeypatch):
+    monkeypatch.chdir(APP_DIR)
+    modules = app_imports('app.py')
+    try:
+        # Best of three, so one slow run on a busy machine does not fail the budget
+        return min((measure_imports(modules) for _ in range(3)), key=lambda run: run['wall_ms'])
+    except ModuleNotFoundError as e:
+        pytest.skip(f'A requirement of the app is not installed: {e}')
+
+
+def test_app_imports_load_no_heavy_dependency(app_import_run):
+    assert app_import_run['heavy'] == [], f"{app_import_run['heavy']} loaded before any backend is used"
+
+
+def test_app_imports_fit_the_budget(app_import_run):
+    assert app_import_run['wall_ms'] <= startup_budget_ms
+
+
+def test_measure_imports_sees_heavy_modules():
+    pytest.importorskip('numpy')
+    assert 'numpy' in measure_imports(['numpy'])['heavy']
+    assert measure_imports(['json'])['heavy'] == []
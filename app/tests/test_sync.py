@@ -0,0 +1,86 @@
+# test_sync.py
+
+import pytest
+
+from src.sync import Manifest, document_id, read_documents, sync_documents
+
+
+def make_docs():
+    return [
+        {'id': 'a1', 'question': 'What is bagging?', 'answer': 'Bootstrap aggregating.', 'topic': 'ML'},
+        {'id': 'b2', 'question': 'What is boosting?', 'answer': 'Sequential ensembles.', 'topic': 'ML'},
+        {'id': 'c3', 'question': 'What is a join?', 'answer': 'Combines tables.', 'topic': 'SQL'},
+    ]
+
+
+def run_sync(docs, rebuild=False, failed=()):
+    applied = {}
+
+    def apply_fn(upsert_chunks, deletes):
+        applied['upserts'] = [doc['id'] for chunk in upsert_chunks for doc in chunk]
+        applied['deletes'] = list(deletes)
+        return set(failed)
+
+    report = sync_documents('test', apply_fn, chunks=[docs], rebuild=rebuild)
+    return report, applied
+
+
+def test_document_id_prefers_id_column():
+    assert document_id({'id': 7, 'question': 'q', 'answer': 'a'}) == '7'
+    assert document_id({'question': 'q', 'answer': 'a'}) == document_id({'question': 'q', 'answer': 'a'})
+
+
+def test_sync_applies_only_the_difference(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    report, applied = run_sync(make_docs(), rebuild=True)
+    assert applied['upserts'] == ['a1', 'b2', 'c3']
+    assert report['upserted'] == 3 and report['deleted'] == 0
+
+    docs = make_docs()
+    docs[1]['answer'] = 'Trains models one after the other.'
+    del docs[2]
+    report, applied = run_sync(docs)
+    assert applied == {'upserts': ['b2'], 'deletes': ['c3']}
+    assert (report['upserted'], report['deleted'], report['unchanged']) == (1, 1, 1)
+    assert set(Manifest('test').load()) == {'a1', 'b2'}
+
+
+def test_sync_skips_apply_when_nothing_changed(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    run_sync(make_docs(), rebuild=True)
+    report, applied = run_sync(make_docs())
+    assert applied == {}
+    assert report['unchanged'] == 3
+
+
+def test_failed_documents_are_retried_by_the_next_sync(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    report, _ = run_sync(make_docs(), rebuild=True, failed={'b2'})
+    assert (report['upserted'], report['failed']) == (2, 1)
+    assert set(Manifest('test').load()) == {'a1', 'c3'}
+
+    report, applied = run_sync(make_docs()[:2], failed={'c3'})
+    assert applied == {'upserts': ['b2'], 'deletes': ['c3']}
+    assert (report['upserted'], report['deleted'], report['failed']) == (1, 0, 1)
+    assert set(Manifest('test').load()) == {'a1', 'b2', 'c3'}
+
+    report, applied = run_sync(make_docs()[:2])
+    assert applied == {'upserts': [], 'deletes': ['c3']}
+    assert set(Manifest('test').load()) == {'a1', 'b2'}
+
+
+def test_sync_reports_duplicate_ids(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    docs = make_docs()
+    docs.append(dict(docs[0], answer='Another answer.'))
+    report, applied = run_sync(docs, rebuild=True)
+    assert applied['upserts'] == ['a1', 'b2', 'c3']
+    assert report['duplicates'] == 1
+
+
+def test_corpus_ids_cover_the_ground_truth():
+    pytest.importorskip('pandas')
+    from src.benchmarks.retrieval import load_ground_truth
+
+    ids = {doc['id'] for doc in read_documents()}
+    assert set(load_ground_truth()['document_id']) <= ids
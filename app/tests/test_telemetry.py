@@ -0,0 +1,112 @@
+# test_telemetry.py
+
+import sqlite3
+import threading
+
+import pytest
+
+from src.db import CONVERSATION_COLUMNS, SQLiteSink, TelemetryWriter
+
+
+def conversation(conversation_id):
+    return (conversation_id, 'question', 'answer') + (None,) * (len(CONVERSATION_COLUMNS) - 3)
+
+
+@pytest.fixture
+def sink(tmp_path):
+    sink = SQLiteSink(str(tmp_path / 'telemetry.db'))
+    sink.create_tables()
+    yield sink
+    sink.close()
+
+
+def count(sink, table):
+    return sink._conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+
+def test_rows_are_written_in_batches(sink):
+    writer = TelemetryWriter(sink=sink, batch_size=3, flush_interval=60)
+    for i in range(4):
+        writer.submit('conversations', conversation(f'c{i}'))
+    writer.submit('feedback', ('c0', 1))
+    writer.close()
+
+    assert (writer.written, writer.dropped) == (5, 0)
+    assert count(sink, 'conversations') == 4
+    assert count(sink, 'feedback') == 1
+
+
+def test_a_failing_table_only_drops_its_own_rows(sink):
+    with sink._conn:
+        sink._conn.execute('DROP TABLE feedback')
+    writer = TelemetryWriter(sink=sink, batch_size=10, flush_interval=60, max_retries=0)
+    writer.submit('conversations', conversation('c1'))
+    writer.submit('feedback', ('c1', 1))
+    writer.submit('conversations', conversation('c2'))
+    writer.close()
+
+    assert (writer.written, writer.dropped) == (2, 1)
+    assert count(sink, 'conversations') == 2
+
+
+class FlakySink(SQLiteSink):
+    """SQLite sink whose database is locked for the first few writes."""
+
+    def __init__(self, path, failures):
+        super().__init__(path)
+        self.failures = failures
+
+    def write(self, rows_by_table):
+        if self.failures:
+            self.failures -= 1
+            raise sqlite3.OperationalError('database is locked')
+        super().write(rows_by_table)
+
+
+def test_transient_errors_are_retried_then_dropped(tmp_path, monkeypatch):
+    monkeypatch.setattr('src.db.time.sleep', lambda seconds: None)
+    sink = FlakySink(str(tmp_path / 'telemetry.db'), failures=1)
+    sink.create_tables()
+    writer = TelemetryWriter(sink=sink, batch_size=1, flush_interval=60, max_retries=1)
+    writer.submit('conversations', conversation('c1'))
+    writer.close()
+    assert (writer.written, writer.dropped) == (1, 0)
+
+    sink.failures = 5
+    writer = TelemetryWriter(sink=sink, batch_size=2, flush_interval=60, max_retries=1)
+    writer.submit('conversations', conversation('c2'))
+    writer.submit('feedback', ('c2', -1))
+    writer.close()
+    assert (writer.written, writer.dropped) == (0, 2)
+    sink.close()
+
+
+class BlockingSink(SQLiteSink):
+    """SQLite sink whose writes wait until released."""
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.started = threading.Event()
+        self.release = threading.Event()
+
+    def write(self, rows_by_table):
+        self.started.set()
+        self.release.wait(10)
+        super().write(rows_by_table)
+
+
+def test_rows_are_dropped_when_the_queue_is_full(tmp_path):
+    sink = BlockingSink(str(tmp_path / 'telemetry.db'))
+    sink.create_tables()
+    writer = TelemetryWriter(sink=sink, queue_size=1, batch_size=1, flush_interval=60)
+    writer.submit('conversations', conversation('c0'))
+    assert sink.started.wait(10)
+    # c1 waits in the queue while c0 is being written; the rest find it full
+    results = [writer.submit('conversations', conversation(f'c{i}')) for i in range(1, 5)]
+    sink.release.set()
+    writer.close()
+
+    assert results == [True, False, False, False]
+    assert (writer.written, writer.dropped) == (2, 3)
+    assert count(sink, 'conversations') == 2
+    sink.close()
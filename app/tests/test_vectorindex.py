@@ -0,0 +1,76 @@
+# test_vectorindex.py
+
+import pytest
+
+np = pytest.importorskip('numpy')
+
+from src.vectorindex import VectorIndex
+
+
+@pytest.fixture
+def corpus():
+    rng = np.random.default_rng(0)
+    vectors = rng.normal(size=(300, 16)).astype(np.float32)
+    docs = [{'id': str(i), 'topic': ['ML', 'SQL', 'Stats'][i % 3]} for i in range(len(vectors))]
+    queries = rng.normal(size=(5, 16)).astype(np.float32)
+    return vectors, docs, queries
+
+
+def cosine(vectors, queries):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    queries = queries / np.linalg.norm(queries, axis=1, keepdims=True)
+    return queries @ vectors.T
+
+
+def test_exact_search_matches_brute_force_on_elasticsearch_scale(corpus):
+    vectors, docs, queries = corpus
+    index = VectorIndex().fit(vectors, docs)
+    expected = cosine(vectors, queries)
+
+    for query_scores, (doc_ids, scores) in zip(expected, index.search_batch(queries, num_results=5)):
+        assert list(doc_ids) == list(np.argsort(-query_scores)[:5])
+        assert np.allclose(scores, (1 + query_scores[doc_ids]) / 2, atol=1e-5)
+        assert np.all((scores >= 0) & (scores <= 1))
+
+
+def test_int8_scores_blockwise_close_to_float32(corpus):
+    vectors, docs, queries = corpus
+    index = VectorIndex(dtype='int8').fit(vectors, docs)
+    whole = index.search_batch(queries, num_results=300)
+
+    index.score_block_rows = 7
+    blocked = index.search_batch(queries, num_results=300)
+    expected = cosine(vectors, queries)
+    for query_scores, (doc_ids, scores), (block_ids, block_scores) in zip(expected, whole, blocked):
+        assert np.allclose(scores, block_scores, atol=1e-6)
+        assert np.allclose(scores, (1 + query_scores[doc_ids]) / 2, atol=0.01)
+
+
+def test_ivf_probing_every_cluster_is_exact(corpus):
+    vectors, docs, queries = corpus
+    exact = VectorIndex().fit(vectors, docs)
+    ivf = VectorIndex(method='ivf', nlist=8, nprobe=8).fit(vectors, docs)
+    for (exact_ids, exact_scores), (ivf_ids, ivf_scores) in zip(
+            exact.search_batch(queries, num_results=10), ivf.search_batch(queries, num_results=10)):
+        assert list(exact_ids) == list(ivf_ids)
+        assert np.allclose(exact_scores, ivf_scores, atol=1e-6)
+
+
+def test_keyword_filter(corpus):
+    vectors, docs, queries = corpus
+    index = VectorIndex(dtype='int8', method='ivf', nlist=4, nprobe=2).fit(vectors, docs)
+    doc_ids, _ = index.search(queries[0], filter_dict={'topic': 'SQL'}, num_results=10)
+    assert len(doc_ids) and all(docs[i]['topic'] == 'SQL' for i in doc_ids)
+    assert len(index.search(queries[0], filter_dict={'topic': 'Unknown'})[0]) == 0
+
+
+def test_save_and_load_round_trip(corpus, tmp_path):
+    vectors, docs, queries = corpus
+    index = VectorIndex(dtype='int8', method='ivf', nlist=6, nprobe=3).fit(vectors, docs)
+    index.save(str(tmp_path / 'index'))
+    loaded = VectorIndex.load(str(tmp_path / 'index'))
+
+    assert loaded.docs == docs
+    for (ids, scores), (loaded_ids, loaded_scores) in zip(index.search_batch(queries), loaded.search_batch(queries)):
+        assert list(ids) == list(loaded_ids)
+        assert np.allclose(scores, loaded_scores)